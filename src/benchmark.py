@@ -0,0 +1,267 @@
+"""
+This script benchmarks the stages of the main.py pipeline on synthetic data.
+It generates deterministic train, ideal and test CSV files of configurable sizes,
+runs every stage on them, records wall time, CPU time and peak memory per stage
+(sampled resident set size by default, or Python allocations with tracemalloc),
+and writes the measurements as JSON. A previous JSON report can be passed with
+--compare to flag stages that got slower.
+
+Example:
+    python src/benchmark.py --preset small --output bench.json
+    python src/benchmark.py --preset small --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import Float
+
+from modules.DataAnalyzer import DataAnalyzer
+from modules.DatabaseConnection import DatabaseConnection
+from modules.ResultSink import ResultSink
+from modules.SyntheticDataGenerator import SyntheticDataGenerator
+from schema.index import table_test
+
+# (ideal functions, rows, test points)
+PRESETS: Dict[str, List[Tuple[int, int, int]]] = {
+    'tiny': [(50, 400, 100)],
+    'small': [(50, 400, 100), (500, 10_000, 100_000)],
+    'medium': [(5_000, 10_000, 1_000_000), (50, 1_000_000, 1_000_000)],
+    'large': [(50_000, 10_000, 1_000_000), (50, 10_000_000, 10_000_000)],
+}
+
+DATA_DIRECTORY = os.path.join('runtime', 'benchmark')
+DB_FILENAME = 'benchmark.db'
+
+
+def parse_size(value: str) -> Tuple[int, int, int]:
+    """
+    Parses a size given as FUNCTIONSxROWSxTEST_POINTS, e.g. 50x400x100.
+    """
+    try:
+        functions, rows, test_points = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size {value}, expected FUNCTIONSxROWSxTEST_POINTS")
+    return functions, rows, test_points
+
+
+def resident_bytes() -> int | None:
+    """
+    Returns the resident set size of this process, or None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StageRecorder:
+    """
+    Records wall time, CPU time and peak memory of named stages.
+
+    With memory='rss' a background thread samples the resident set size every
+    few milliseconds, which costs next to nothing and includes allocations made
+    by C code (pandas' parser, SQLite). With memory='tracemalloc' only Python and
+    NumPy allocations are counted, exactly, but the stages run several times slower.
+    """
+
+    def __init__(self, memory: str) -> None:
+        self.memory = memory
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        sampler = None
+        samples = []
+        if self.memory == 'tracemalloc':
+            tracemalloc.start()
+        elif self.memory == 'rss' and resident_bytes() is not None:
+            stop = threading.Event()
+            samples.append(resident_bytes())
+
+            def sample():
+                while not stop.wait(0.005):
+                    samples.append(resident_bytes())
+
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            result = {
+                'wall_seconds': time.perf_counter() - wall,
+                'cpu_seconds': time.process_time() - cpu,
+            }
+            if self.memory == 'tracemalloc':
+                result['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            elif sampler is not None:
+                stop.set()
+                sampler.join()
+                samples.append(resident_bytes())
+                result['peak_rss_bytes'] = max(samples)
+                result['peak_rss_growth_bytes'] = max(samples) - samples[0]
+            self.stages[name] = result
+
+
+def run_size(functions: int, rows: int, test_points: int, seed: int, memory: str, workers: int | None = None) -> Dict[str, Any]:
+    """
+    Runs all pipeline stages for one data size.
+
+    Returns:
+        Dict[str, Any]: The sizes, the selected best fits and the per-stage measurements.
+    """
+    directory = os.path.join(DATA_DIRECTORY, f'{functions}x{rows}x{test_points}-seed{seed}')
+    paths = {name: os.path.join(directory, f'{name}.csv') for name in ('train', 'ideal', 'test')}
+    if not all(os.path.exists(path) for path in paths.values()):
+        print(f'Generating {functions} functions x {rows} rows, {test_points} test points')
+        paths = SyntheticDataGenerator(seed).generate(directory, functions, rows, test_points)
+
+    db_path = os.path.join('runtime', DB_FILENAME)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    analyzer = DataAnalyzer(DatabaseConnection(DB_FILENAME, profile='bulk_load'))
+
+    table_ideal = {'x': Float}
+    table_ideal.update({f'y{i}': Float for i in range(1, functions + 1)})
+    train_columns = len(SyntheticDataGenerator(seed).selected_functions(functions))
+    table_training = {'x': Float}
+    table_training.update({f'y{i}': Float for i in range(1, train_columns + 1)})
+
+    recorder = StageRecorder(memory)
+    analyzer.create_table('test', table_test, True)
+    analyzer.create_table('train', table_training, True)
+    analyzer.create_table('ideal', table_ideal, True)
+
+    with recorder.stage('load_csv_to_db'):
+        analyzer.load_csv_to_db(paths['train'], 'train', bulk=True)
+        analyzer.load_csv_to_db(paths['ideal'], 'ideal', bulk=True)
+
+    with recorder.stage('get_data_from_db'):
+        train = analyzer.read_table('train', dtype='float64')
+        ideal = analyzer.read_table('ideal', dtype='float64')
+    analyzer.load_training_data(train)
+    analyzer.load_ideal_data(ideal)
+
+    with recorder.stage('find_ideal_curves'):
+        best_fits = analyzer.find_ideal_curves()
+
+    with recorder.stage('load_fit_columns'):
+        analyzer.load_fit_columns()
+
+    with recorder.stage('test_data_set'):
+        results = analyzer.test_data_set(paths['test'], workers=workers)
+
+    # Keeps the stage name of earlier reports so that --compare still matches it
+    with recorder.stage('replace_data_in_table'):
+        with ResultSink(analyzer, 'test') as sink:
+            sink.write(results)
+
+    analyzer.engine.dispose()
+    return {
+        'sizes': {'ideal_functions': functions, 'rows': rows, 'test_points': test_points, 'seed': seed},
+        'best_fits': best_fits,
+        'result_rows': len(results),
+        'workers': workers,
+        'shards': analyzer.shard_stats,
+        'stages': recorder.stages,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_seconds: float) -> List[str]:
+    """
+    Compares the wall times of a report against a baseline report.
+
+    Returns:
+        List[str]: A description of every stage that got slower than the tolerance allows.
+    """
+    baseline_runs = {json.dumps(run['sizes'], sort_keys=True): run for run in baseline.get('runs', [])}
+    regressions = []
+    for run in report['runs']:
+        previous = baseline_runs.get(json.dumps(run['sizes'], sort_keys=True))
+        if previous is None:
+            continue
+        for name, stage in run['stages'].items():
+            if name not in previous['stages']:
+                continue
+            old = previous['stages'][name]['wall_seconds']
+            new = stage['wall_seconds']
+            ratio = new / old if old > 0 else float('inf')
+            sizes = 'x'.join(str(run['sizes'][key]) for key in ('ideal_functions', 'rows', 'test_points'))
+            print(f'{sizes:>24} {name:<22} {old:10.4f}s -> {new:10.4f}s  ({ratio:5.2f}x)')
+            if ratio > 1 + tolerance and new - old > min_seconds:
+                regressions.append(f'{sizes} {name}: {old:.4f}s -> {new:.4f}s ({ratio:.2f}x)')
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the data pipeline on synthetic data.')
+    parser.add_argument('--preset', choices=PRESETS, default='small', help='Predefined list of data sizes.')
+    parser.add_argument('--size', type=parse_size, action='append', metavar='FxRxT',
+                        help='Data size as FUNCTIONSxROWSxTEST_POINTS; replaces the preset. Repeatable.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data.')
+    parser.add_argument('--memory', choices=('rss', 'tracemalloc', 'none'), default='rss',
+                        help='How to measure peak memory per stage (tracemalloc slows the stages down).')
+    parser.add_argument('--workers', type=int, help='Classify the test file in this many processes.')
+    parser.add_argument('--output', default=os.path.join(DATA_DIRECTORY, 'report.json'),
+                        help="File for the JSON report, or '-' for stdout.")
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON report of a previous run to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative slowdown per stage before --compare fails.')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='Ignore slowdowns smaller than this many seconds.')
+    args = parser.parse_args(argv)
+
+    sizes = args.size or PRESETS[args.preset]
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'memory': args.memory,
+        'runs': [run_size(*size, seed=args.seed, memory=args.memory, workers=args.workers) for size in sizes],
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+        print(f'Report written to {args.output}')
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            print('Regressions:', *regressions, sep='\n  ', file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,371 @@
+"""
+This script is the command line entry point for the individual steps of the pipeline.
+Unlike main.py, which always runs every step, each subcommand runs one step and
+imports only the modules that step needs, when it runs: parsing the command
+line costs no pandas, NumPy or SQLAlchemy import, and only `plot` pulls in
+matplotlib. `classify` reuses the fit cached by an earlier `fit` (or main.py) run
+for the same files and writes into the existing test table instead of creating
+the tables again. `ingest` skips files that are unchanged since they were
+loaded and appends only the new rows of files that grew. `fit` aligns the
+training rows with the ideal rows on x, so the training file may cover part
+of the ideal grid in any order; --align-tolerance and --align-interpolate
+also match x values that are near or between ideal rows. `serve` keeps the
+best fits in memory and answers classification requests over HTTP, see
+ClassificationService.
+
+The `startup` command measures how long each subcommand takes to import its
+modules, in fresh interpreters, and fails if that exceeds STARTUP_BUDGETS or
+if a subcommand loads a package listed in STARTUP_EXCLUDES.
+
+Example:
+    python src/cli.py ingest
+    python src/cli.py fit
+    python src/cli.py classify --test data/test.csv --workers 4
+    python src/cli.py plot --format svg
+    python src/cli.py bench --preset tiny
+    python src/cli.py serve --socket runtime/classify.sock
+    python src/cli.py startup
+"""
+
+import argparse
+import importlib
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# The modules each subcommand imports, loaded by --startup-only
+COMMAND_IMPORTS: Dict[str, List[str]] = {
+    'ingest': ['modules.DataAnalyzer', 'modules.DatabaseConnection', 'schema.index'],
+    'fit': ['modules.DataAnalyzer', 'modules.DatabaseConnection'],
+    'classify': ['modules.DataAnalyzer', 'modules.DatabaseConnection', 'modules.ResultSink'],
+    'plot': ['visualisation'],
+    'bench': ['benchmark'],
+    'serve': ['modules.ClassificationService'],
+}
+
+# Seconds from interpreter start until a subcommand has imported its modules,
+# about 1.5 times the time measured on a single-core machine; None is the bare
+# command line without any subcommand imports
+STARTUP_BUDGETS: Dict[str | None, float] = {
+    None: 0.15,
+    'ingest': 1.2,
+    'fit': 1.2,
+    'classify': 1.2,
+    'plot': 2.0,
+    'bench': 1.2,
+    'serve': 1.2,
+}
+
+# Packages reported by the startup command when a subcommand loads them
+HEAVY_PACKAGES = ('numpy', 'pandas', 'sqlalchemy', 'matplotlib')
+
+# Packages a subcommand must not load at all, whatever the timing
+STARTUP_EXCLUDES: Dict[str | None, Tuple[str, ...]] = {
+    None: HEAVY_PACKAGES,
+    'ingest': ('matplotlib',),
+    'fit': ('matplotlib',),
+    'classify': ('matplotlib',),
+    'bench': ('matplotlib',),
+    'serve': ('matplotlib',),
+}
+
+
+def analyzer(profile: str = 'default', dtype: str = 'float64', args: argparse.Namespace = None):
+    """
+    Creates a data analyzer on the pipeline database.
+
+    Args:
+        profile (str, optional): The engine profile, see DatabaseConnection. Defaults to 'default'.
+        dtype (str, optional): The storage type of the ideal functions. Defaults to 'float64'.
+        args (argparse.Namespace, optional): The parsed options with --align-tolerance and
+            --align-interpolate, if the command has them. Defaults to None.
+
+    Returns:
+        DataAnalyzer: The analyzer, with the result cache enabled.
+    """
+    from modules.DataAnalyzer import DataAnalyzer
+    from modules.DatabaseConnection import DatabaseConnection
+
+    db_analyzer = DataAnalyzer(DatabaseConnection(profile=profile), dtype=dtype,
+                               align_tolerance=getattr(args, 'align_tolerance', 0.0),
+                               align_interpolate=getattr(args, 'align_interpolate', False))
+    db_analyzer.enable_result_cache()
+    return db_analyzer
+
+
+def fit_tables(db_analyzer, train_path: str, ideal_path: str, refit: bool = False) -> List[str]:
+    """
+    Finds the best fits from the train and ideal tables and caches them for the given source files.
+
+    Args:
+        db_analyzer (DataAnalyzer): The analyzer.
+        train_path (str): The training CSV the train table was loaded from.
+        ideal_path (str): The ideal CSV the ideal table was loaded from.
+        refit (bool, optional): Whether to fit even if a fit of these files is cached. Defaults to False.
+
+    Returns:
+        List[str]: The best fits, or None if the tables are empty.
+    """
+    train = db_analyzer.read_table('train', dtype='float64')
+    ideal = db_analyzer.read_table('ideal', dtype='float64')
+    if train.empty or ideal.empty:
+        print('Run the ingest command first to fill the train and ideal tables')
+        return None
+    db_analyzer.load_training_data(train, source=train_path)
+    db_analyzer.load_ideal_data(ideal, source=ideal_path)
+    return db_analyzer.find_ideal_curves(refit=refit)
+
+
+def ingest(args: argparse.Namespace) -> int:
+    from schema.index import table_ideal, table_test, table_test_points, table_training
+
+    db_analyzer = analyzer('bulk_load')
+    db_analyzer.create_table('test', table_test, True)
+    loads = [(args.train, 'train', table_training), (args.ideal, 'ideal', table_ideal)]
+    if args.test is not None:
+        loads.append((args.test, 'test_points', table_test_points))
+    for csv_path, table_name, columns in loads:
+        if db_analyzer.ingest_csv(csv_path, table_name, columns, full=args.full) is None:
+            return 1
+    return 0
+
+
+def fit(args: argparse.Namespace) -> int:
+    db_analyzer = analyzer('read_heavy', args.dtype, args)
+    # The precision check compares the fits, so it needs the tables even for a cached fit
+    fit_again = args.refit or args.check_precision
+    best_fits = None if fit_again else db_analyzer.load_cached_fit(args.train, args.ideal)
+    if best_fits is None:
+        best_fits = fit_tables(db_analyzer, args.train, args.ideal, args.refit)
+        if best_fits is None:
+            return 1
+    print('Best fits: ', best_fits)
+    if args.check_precision:
+        report = db_analyzer.check_precision(csv_path=args.test)
+        if report is None or not report['same_fits'] or not report.get('same_results', True):
+            return 1
+    return 0
+
+
+def classify(args: argparse.Namespace) -> int:
+    from modules.ResultSink import ResultSink
+
+    db_analyzer = analyzer(dtype=args.dtype, args=args)
+    best_fits = db_analyzer.load_cached_fit(args.train, args.ideal)
+    if best_fits is None:
+        print('No cached fit for these files, fitting first')
+        best_fits = fit_tables(db_analyzer, args.train, args.ideal)
+        if best_fits is None:
+            return 1
+
+    if not args.append:
+        # Empty the existing table instead of recreating it
+        sink = ResultSink(db_analyzer, 'test')
+        sink.ensure_table()
+        sink.clear()
+    if args.in_db:
+        rows = db_analyzer.classify_in_db(csv_path=args.test)
+    else:
+        if db_analyzer.load_fit_columns() is None:
+            return 1
+        rows = db_analyzer.write_test_data_set(args.test, interpolate=args.interpolate, workers=args.workers)
+    if rows is None:
+        return 1
+    print(f'Wrote {rows} rows to table test')
+    return 0
+
+
+def plot(args: argparse.Namespace) -> int:
+    import visualisation
+
+    return visualisation.main(args.args)
+
+
+def bench(args: argparse.Namespace) -> int:
+    import benchmark
+
+    return benchmark.main(args.args)
+
+
+def serve(args: argparse.Namespace) -> int:
+    import asyncio
+
+    from modules.ClassificationService import ClassificationService
+
+    db_analyzer = analyzer('read_heavy', args.dtype, args)
+    if db_analyzer.load_cached_fit(args.train, args.ideal) is None:
+        print('No cached fit for these files, fitting first')
+        if fit_tables(db_analyzer, args.train, args.ideal) is None:
+            return 1
+    if db_analyzer.load_fit_columns() is None:
+        return 1
+    service = ClassificationService(db_analyzer, args.interpolate, args.max_batch, args.max_delay_ms / 1000)
+    try:
+        asyncio.run(service.serve_forever(args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    print(service.stats.snapshot())
+    return 0
+
+
+def measure_startup(command: str | None, runs: int) -> Dict:
+    """
+    Measures the median wall time of a fresh interpreter importing a subcommand's modules.
+
+    Args:
+        command (str | None): The subcommand, or None for the bare command line.
+        runs (int): The number of interpreters to start.
+
+    Returns:
+        Dict: The command, median seconds, budget and the heavy packages it loads.
+    """
+    arguments = [sys.executable, os.path.abspath(__file__), '--startup-only']
+    if command is not None:
+        arguments.append(command)
+    seconds = []
+    loaded = ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(arguments, capture_output=True, text=True, check=True)
+        seconds.append(time.perf_counter() - start)
+        loaded = completed.stdout.strip()
+    return {
+        'command': command or '(none)',
+        'seconds': statistics.median(seconds),
+        'budget': STARTUP_BUDGETS[command],
+        'loaded': loaded or '-',
+    }
+
+
+def startup(args: argparse.Namespace) -> int:
+    failed = []
+    for command in STARTUP_BUDGETS:
+        result = measure_startup(command, args.runs)
+        budget = result['budget'] * args.scale
+        excluded = [package for package in result['loaded'].split() if package in STARTUP_EXCLUDES.get(command, ())]
+        print(f"{result['command']:<10} {result['seconds'] * 1000:7.0f} ms  (budget {budget * 1000:5.0f} ms)  "
+              f"loads {result['loaded']}")
+        if result['seconds'] > budget:
+            failed.append(f"{result['command']} took {result['seconds'] * 1000:.0f} ms")
+        if excluded:
+            failed.append(f"{result['command']} loaded {', '.join(excluded)}")
+    if failed:
+        print('Startup check failed:', *failed, sep='\n  ', file=sys.stderr)
+        return 1
+    return 0
+
+
+def parser() -> argparse.ArgumentParser:
+    """
+    Builds the command line parser.
+
+    Returns:
+        argparse.ArgumentParser: The parser, with one subparser per command.
+    """
+    root = argparse.ArgumentParser(description='Run single steps of the data pipeline.')
+    root.add_argument('--profile', action='store_true',
+                      help='Write a stage and SQL timing report to runtime/profile.json.')
+    root.add_argument('--startup-only', action='store_true', help=argparse.SUPPRESS)
+    commands = root.add_subparsers(dest='command', metavar='COMMAND')
+
+    def files(command: argparse.ArgumentParser) -> None:
+        command.add_argument('--train', default='data/train.csv', help='Training CSV file.')
+        command.add_argument('--ideal', default='data/ideal.csv', help='Ideal CSV file.')
+
+    def dtype(command: argparse.ArgumentParser) -> None:
+        command.add_argument('--dtype', choices=('float64', 'float32'), default='float64',
+                             help='Storage type of the ideal functions; float32 halves their memory.')
+
+    def alignment(command: argparse.ArgumentParser) -> None:
+        command.add_argument('--align-tolerance', type=float, default=0.0,
+                             help='Largest x distance at which a training row matches an ideal row when fitting.')
+        command.add_argument('--align-interpolate', action='store_true',
+                             help='Fit training rows between ideal x values against interpolated ideal values.')
+
+    command = commands.add_parser('ingest', help='Load new or changed CSV files into the tables.')
+    files(command)
+    command.add_argument('--test', help='Also load this test CSV into the test_points table, for classify --in-db.')
+    command.add_argument('--full', action='store_true',
+                         help='Reload every file, even if it is unchanged or was only appended to.')
+    command.set_defaults(handler=ingest)
+
+    command = commands.add_parser('fit', help='Select the ideal function for each training column.')
+    files(command)
+    dtype(command)
+    alignment(command)
+    command.add_argument('--refit', action='store_true', help='Ignore a cached fit.')
+    command.add_argument('--check-precision', action='store_true',
+                         help='Compare the fits and the results for --test with float64 ones.')
+    command.add_argument('--test', default='data/test.csv', help='Test CSV file for --check-precision.')
+    command.set_defaults(handler=fit)
+
+    command = commands.add_parser('classify', help='Classify test points and write them to the test table.')
+    files(command)
+    dtype(command)
+    alignment(command)
+    command.add_argument('--test', default='data/test.csv', help='Test CSV file.')
+    command.add_argument('--workers', type=int, help='Classify byte-range shards in this many processes.')
+    command.add_argument('--interpolate', action='store_true', help='Interpolate between ideal x values.')
+    command.add_argument('--in-db', action='store_true', help='Classify inside SQLite.')
+    command.add_argument('--append', action='store_true', help='Keep the rows already in the test table.')
+    command.set_defaults(handler=classify)
+
+    command = commands.add_parser('plot', help='Render the tables to image files, see visualisation.py.',
+                                  add_help=False)
+    command.set_defaults(handler=plot, passthrough=True)
+
+    command = commands.add_parser('bench', help='Benchmark the pipeline on synthetic data, see benchmark.py.',
+                                  add_help=False)
+    command.set_defaults(handler=bench, passthrough=True)
+
+    command = commands.add_parser('serve', help='Serve classification requests over HTTP, see ClassificationService.')
+    files(command)
+    dtype(command)
+    alignment(command)
+    command.add_argument('--socket', help='Listen on this Unix socket instead of a TCP port.')
+    command.add_argument('--host', default='127.0.0.1', help='Host to listen on.')
+    command.add_argument('--port', type=int, default=8080, help='Port to listen on.')
+    command.add_argument('--interpolate', action='store_true', help='Interpolate between ideal x values.')
+    command.add_argument('--max-batch', type=int, default=4096, help='Maximum number of points per micro-batch.')
+    command.add_argument('--max-delay-ms', type=float, default=0.0,
+                         help='Time to wait for more requests before classifying a micro-batch.')
+    command.set_defaults(handler=serve)
+
+    command = commands.add_parser('startup', help='Measure the import time of every command against its budget.')
+    command.add_argument('--runs', type=int, default=5, help='Interpreters started per command.')
+    command.add_argument('--scale', type=float, default=1.0, help='Factor applied to every budget, for slower machines.')
+    command.set_defaults(handler=startup)
+    return root
+
+
+def main(argv: List[str] = None) -> int:
+    root = parser()
+    # plot and bench hand their arguments on to the script they run
+    args, extra = root.parse_known_args(argv)
+    args.args = extra
+    if extra and not getattr(args, 'passthrough', False):
+        root.error(f"unrecognized arguments: {' '.join(extra)}")
+    if args.startup_only:
+        for module in COMMAND_IMPORTS.get(args.command, []):
+            importlib.import_module(module)
+        print(' '.join(package for package in HEAVY_PACKAGES if package in sys.modules))
+        return 0
+    if args.command is None:
+        root.print_help()
+        return 2
+
+    if args.profile:
+        from modules.Profiler import profiler
+
+        profiler.enable()
+    status = args.handler(args)
+    if args.profile:
+        profiler.write_report('runtime/profile.json')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,58 +2,141 @@
 This script performs data analysis and manipulation using a database connection.
 It creates tables, loads data from CSV files into the tables, analyzes the data,
 finds the best fits, tests the data set, and writes the test results to the database.
-"""
-
-
-from modules.DataAnalyzer import DataAnalyzer
-from modules.DataHandler import DataHandler
-from modules.DatabaseConnection import DatabaseConnection
-from schema.index import table_test, table_training, table_ideal
-
-# Initialize database connection
-db_connection = DatabaseConnection()
-
-# Initialize data handler
-db_handler = DataHandler(db_connection)
-
-
-# Create tables
-db_handler.create_table('test', table_test, True)
-db_handler.create_table('train', table_training, True)
-db_handler.create_table('ideal', table_ideal, True)
-
+The steps run as a pipeline of stages: independent stages such as the two CSV
+ingests run concurrently, and test results are written chunk by chunk while
+later chunks are still being classified.
+If the input files have not changed since a previous run, the cached results are
+written to the test table instead of fitting and classifying again.
 
-# Load data to tables
-db_handler.load_csv_to_db('data/train.csv', 'train')
-db_handler.load_csv_to_db('data/ideal.csv', 'ideal')
+Pass --in-db to classify the test points inside SQLite instead of in Python; the
+test CSV is then loaded into the test_points table alongside the other ingests.
 
+Pass --workers N to classify byte-range shards of the test CSV in N processes.
 
+Pass --profile (or set DATA_PROFILE=1) to write a stage and SQL timing report to
+runtime/profile.json; --profile-memory (or DATA_PROFILE_MEMORY=1) adds memory peaks.
 
-# Get data from tables
-train = db_handler.get_data_from_db('SELECT * FROM train')
-ideal = db_handler.get_data_from_db('SELECT * FROM ideal')
-
-# Initialize data analyzer
-db_analyzer = DataAnalyzer(db_connection)
-
-# Load data to data analyzer
-db_analyzer.load_training_data(train)
-db_analyzer.load_ideal_data(ideal)
-
-# Find best fits
-best_fits = db_analyzer.find_ideal_curves()
-# print(best_fits)
-
-test_results = db_analyzer.test_data_set('data/test.csv')
-# print(test_results)
-
-# Write test_results to database
-db_analyzer.replace_data_in_table('test', test_results)
-
-
-# Get data from tables
-test = db_handler.get_data_from_db('SELECT * FROM test')
-print(test)
+To run single steps (ingest, fit, classify, plot, bench) use cli.py instead.
+"""
 
+import sys
+from typing import List
 
+import pandas as pd
 
+from modules.DataAnalyzer import DataAnalyzer
+from modules.DatabaseConnection import DatabaseConnection
+from modules.IdealCache import IdealCache
+from modules.PipelineScheduler import PipelineScheduler, Stage
+from modules.Profiler import profiler
+from modules.ResultSink import ResultSink
+from schema.index import table_test, table_test_points, table_training, table_ideal
+
+
+def main(argv: List[str] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if '--profile' in argv or '--profile-memory' in argv:
+        profiler.enable(memory='--profile-memory' in argv)
+    in_db = '--in-db' in argv
+    workers = int(argv[argv.index('--workers') + 1]) if '--workers' in argv else None
+
+    # Initialize database connection, tuned for loading the CSV files
+    db_connection = DatabaseConnection(profile='bulk_load')
+
+    # Initialize data analyzer, which also handles the table operations
+    db_handler = db_analyzer = DataAnalyzer(db_connection)
+
+    # Reuse the results of a previous run with the same input files
+    db_analyzer.enable_result_cache()
+    test_results = db_analyzer.lookup_cached_results('data/train.csv', 'data/ideal.csv', 'data/test.csv')
+
+    def create_tables(inputs):
+        # The input tables are created by the ingest when their files changed
+        db_handler.create_table('test', table_test, True)
+
+    def read_ideal_back(inputs):
+        # The ideal set is memory-mapped from the columnar cache unless ideal.csv changed
+        ideal_cache = IdealCache()
+        if not ideal_cache.is_valid('data/ideal.csv'):
+            ideal_cache.write(db_handler.read_table('ideal', dtype='float64'), 'data/ideal.csv')
+        return ideal_cache
+
+    def fit(inputs):
+        # Load data to data analyzer and find best fits
+        db_analyzer.load_training_data(inputs['read_train_back'], source='data/train.csv')
+        db_analyzer.load_ideal_data(cache=inputs['read_ideal_back'], source='data/ideal.csv')
+        best_fits = db_analyzer.find_ideal_curves()
+        # Classification only needs the best fit columns
+        db_analyzer.load_fit_columns()
+        return best_fits
+
+    def write_results(inputs):
+        # Append every classified chunk to the typed test table as it arrives; keep
+        # the chunks for the result cache unless they grow beyond what it would store
+        cache_key = db_analyzer.results_cache_key('data/test.csv')
+        frames = []
+        rows = 0
+        no_best_fit = 0
+        with ResultSink(db_analyzer, 'test') as sink:
+            for frame in inputs['classify']:
+                sink.write(frame)
+                no_best_fit += frame.attrs['no_best_fit']
+                rows += len(frame)
+                if cache_key is not None and rows <= db_analyzer.result_cache.max_result_rows:
+                    frames.append(frame)
+                else:
+                    frames = []
+                    cache_key = None
+
+        print('No best fit: ', no_best_fit)
+        if cache_key is not None:
+            columns = ['x', 'y', 'delta_y', 'ideal_func']
+            db_analyzer.result_cache.put_results(
+                cache_key, pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+            )
+        return sink.rows_written
+
+    # The CSV ingests run concurrently and skip unchanged files or load only appended
+    # rows; classified test chunks are written while later chunks are still being classified
+    stages = [
+        Stage('create_tables', create_tables),
+        Stage('load_train', lambda inputs: db_handler.ingest_csv('data/train.csv', 'train', table_training)),
+        Stage('load_ideal', lambda inputs: db_handler.ingest_csv('data/ideal.csv', 'ideal', table_ideal)),
+        Stage('read_train_back', lambda inputs: db_handler.read_table('train', dtype='float64'),
+              depends_on=['load_train']),
+        Stage('read_ideal_back', read_ideal_back, depends_on=['load_ideal']),
+        Stage('fit', fit, depends_on=['read_train_back', 'read_ideal_back']),
+    ]
+    if in_db:
+        stages += [
+            Stage('load_test', lambda inputs: db_handler.ingest_csv('data/test.csv', 'test_points', table_test_points)),
+            Stage('classify_in_db', lambda inputs: db_analyzer.classify_in_db(), depends_on=['fit', 'load_test']),
+        ]
+    else:
+        stages += [
+            Stage('classify', lambda inputs: db_analyzer.iter_test_data_set('data/test.csv', workers=workers),
+                  depends_on=['fit'], streams=True),
+            Stage('write_results', write_results, depends_on=['create_tables', 'classify']),
+        ]
+    pipeline = PipelineScheduler(stages)
+
+    if test_results is None:
+        pipeline.run()
+    else:
+        # Only the results are cached; the test table may have been rewritten since,
+        # e.g. by cli.py classify with another test file
+        create_tables(None)
+        with ResultSink(db_analyzer, 'test') as sink:
+            sink.write(test_results)
+
+    # Get data from tables
+    test = db_handler.get_data_from_db('SELECT * FROM test')
+    print(test)
+
+    if profiler.enabled:
+        profiler.write_report('runtime/profile.json')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,337 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from modules.DataAnalyzer import DataAnalyzer
+from modules.IdealIndex import IdealIndex
+
+
+class LatencyStats:
+    """
+    A class that keeps request counters and a window of recent latencies.
+
+    Attributes:
+        requests (int): The number of answered classification requests.
+        points (int): The number of classified points.
+        batches (int): The number of micro-batches.
+        errors (int): The number of rejected requests.
+        latencies (deque): The latencies of the most recent requests in seconds.
+
+    Methods:
+        record(seconds): Adds the latency of one request.
+        snapshot(): Returns the counters and latency percentiles.
+    """
+
+    def __init__(self, window: int = 10_000) -> None:
+        """
+        Initializes a new instance of the LatencyStats class.
+
+        Args:
+            window (int, optional): The number of recent requests the percentiles are computed over.
+                Defaults to 10000.
+
+        """
+        self.requests = 0
+        self.points = 0
+        self.batches = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+        self.started = time.time()
+
+    def record(self, seconds: float) -> None:
+        self.requests += 1
+        self.latencies.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns the counters and the p50, p99 and maximum latency of the recent requests.
+
+        Returns:
+            Dict[str, Any]: The statistics, latencies in milliseconds.
+        """
+        latencies = np.fromiter(self.latencies, dtype=np.float64, count=len(self.latencies)) * 1000
+        p50, p99 = np.percentile(latencies, [50, 99]) if len(latencies) else (0.0, 0.0)
+        return {
+            'uptime_seconds': time.time() - self.started,
+            'requests': self.requests,
+            'points': self.points,
+            'batches': self.batches,
+            'errors': self.errors,
+            'mean_batch_requests': self.requests / self.batches if self.batches else 0.0,
+            'latency_window': len(latencies),
+            'p50_ms': float(p50),
+            'p99_ms': float(p99),
+            'max_ms': float(latencies.max()) if len(latencies) else 0.0,
+        }
+
+
+class ClassificationService:
+    """
+    A class that serves classification requests from the best fits held in memory.
+
+    The sorted ideal x values and best fit columns are taken from a fitted
+    DataAnalyzer once, so a request costs a binary search instead of reading
+    files, refitting and rewriting tables. The service speaks HTTP/1.1 with
+    keep-alive on a Unix socket or a TCP port:
+
+        POST /classify  {"x": 1.0, "y": 2.0}                returns {"matches": [...]}
+        POST /classify  {"points": [[x, y], ...]}           returns {"results": [[...], ...]}
+        GET  /stats     counters and p50/p99 latency in ms
+        GET  /fits      the best fits
+
+    Every match is {"ideal_func": name, "delta_y": deviation}. Requests that
+    arrive while a batch is being classified are grouped into the next
+    micro-batch, which is classified with one vectorized IdealIndex call.
+
+    Attributes:
+        best_fits (List[str]): The names of the best fit columns.
+        interpolate (bool): Whether to interpolate between ideal x values.
+        max_batch (int): The maximum number of points per micro-batch.
+        max_delay (float): Seconds the batcher waits for more requests after the first, 0 to never wait.
+        stats (LatencyStats): The request counters and latencies.
+
+    Methods:
+        classify(x, y): Classifies points in this thread, returning the matches per point.
+        start(socket_path, host, port): Starts serving.
+        stop(): Stops serving.
+        serve_forever(socket_path, host, port): Serves until cancelled.
+    """
+
+    def __init__(self, analyzer: DataAnalyzer, interpolate: bool = False, max_batch: int = 4096,
+                 max_delay: float = 0.0) -> None:
+        """
+        Initializes a new instance of the ClassificationService class.
+
+        Args:
+            analyzer (DataAnalyzer): An analyzer with best fits and the ideal set loaded.
+            interpolate (bool, optional): Whether to interpolate between ideal x values. Defaults to False.
+            max_batch (int, optional): The maximum number of points per micro-batch. Defaults to 4096.
+            max_delay (float, optional): Seconds to wait for more requests before classifying a batch.
+                Defaults to 0, which only groups requests that are already waiting.
+
+        """
+        if analyzer.best_fits is None or analyzer.ideal_y is None:
+            raise ValueError('The analyzer needs best fits and the ideal set')
+        if analyzer.ideal_fit_values is None:
+            analyzer.build_ideal_index()
+        self.best_fits = list(analyzer.best_fits)
+        self.interpolate = interpolate
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = LatencyStats()
+        self._ideal_x = np.ascontiguousarray(analyzer.ideal_x)
+        self._ideal_fit_values = np.ascontiguousarray(analyzer.ideal_fit_values)
+        self._queue: asyncio.Queue = None
+        self._server: asyncio.AbstractServer = None
+        self._batcher: asyncio.Task = None
+        self._socket_path: str = None
+
+    def classify(self, x: np.ndarray, y: np.ndarray) -> List[List[Dict[str, Any]]]:
+        """
+        Classifies points against the best fits held in memory.
+
+        Args:
+            x (np.ndarray): The x values.
+            y (np.ndarray): The y values.
+
+        Returns:
+            List[List[Dict[str, Any]]]: The matches of every point, in best fit order.
+        """
+        rows, fits, deviation = IdealIndex.match(self._ideal_x, self._ideal_fit_values, x, y, self.interpolate)
+        results: List[List[Dict[str, Any]]] = [[] for _ in range(len(x))]
+        for row, fit, delta_y in zip(rows.tolist(), fits.tolist(), deviation.tolist()):
+            results[row].append({'ideal_func': self.best_fits[fit], 'delta_y': delta_y})
+        return results
+
+    async def _run_batches(self) -> None:
+        """
+        Classifies queued requests in micro-batches until cancelled.
+
+        """
+        while True:
+            batch = [await self._queue.get()]
+            if self.max_delay > 0:
+                await asyncio.sleep(self.max_delay)
+            else:
+                # Let connections with complete requests enqueue them first
+                await asyncio.sleep(0)
+            try:
+                points = len(batch[0][0])
+                while points < self.max_batch and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    points += len(batch[-1][0])
+
+                x = np.concatenate([request[0] for request in batch])
+                y = np.concatenate([request[1] for request in batch])
+                results = self.classify(x, y)
+            except Exception as e:
+                # Fail this batch only; the batcher must keep serving later requests
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.stats.batches += 1
+            self.stats.points += len(x)
+            offset = 0
+            for request_x, _, future in batch:
+                if not future.done():
+                    future.set_result(results[offset:offset + len(request_x)])
+                offset += len(request_x)
+
+    async def _submit(self, x: np.ndarray, y: np.ndarray) -> List[List[Dict[str, Any]]]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((x, y, future))
+        return await future
+
+    @staticmethod
+    def _parse_points(payload: Any) -> Tuple[np.ndarray, np.ndarray, bool]:
+        """
+        Reads the points of a classification request.
+
+        Args:
+            payload (Any): The decoded JSON body.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, bool]: The x values, the y values and whether it is a single point.
+        """
+        if isinstance(payload, dict) and 'points' in payload:
+            points = np.asarray(payload['points'], dtype=np.float64)
+            if points.size == 0:
+                points = points.reshape(0, 2)
+            if points.ndim != 2 or points.shape[1] != 2:
+                raise ValueError('points must be a list of [x, y] pairs')
+            if not np.isfinite(points).all():
+                raise ValueError('points must be finite numbers')
+            return points[:, 0].copy(), points[:, 1].copy(), False
+        if isinstance(payload, dict) and 'x' in payload and 'y' in payload:
+            x = np.asarray(payload['x'], dtype=np.float64)
+            y = np.asarray(payload['y'], dtype=np.float64)
+            if x.ndim != 0 or y.ndim != 0:
+                raise ValueError('x and y must be single numbers, use points for several')
+            if not (np.isfinite(x) and np.isfinite(y)):
+                raise ValueError('x and y must be finite numbers')
+            return x.reshape(1), y.reshape(1), True
+        raise ValueError("expected {'x': ..., 'y': ...} or {'points': [[x, y], ...]}")
+
+    async def _respond(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        """
+        Answers one HTTP request.
+
+        Returns:
+            Tuple[int, Dict[str, Any]]: The status code and the JSON response.
+        """
+        if path == '/classify':
+            if method != 'POST':
+                return 405, {'error': 'use POST'}
+            try:
+                x, y, single = self._parse_points(json.loads(body))
+            except (ValueError, TypeError) as e:
+                return 400, {'error': f'invalid request: {e}'}
+            try:
+                results = await self._submit(x, y) if len(x) else []
+            except Exception as e:
+                return 500, {'error': f'classification failed: {e}'}
+            return 200, {'matches': results[0]} if single else {'results': results}
+        if path == '/stats' and method == 'GET':
+            return 200, self.stats.snapshot()
+        if path == '/fits' and method == 'GET':
+            return 200, {'best_fits': self.best_fits, 'interpolate': self.interpolate}
+        return 404, {'error': f'unknown endpoint {method} {path}'}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serves the HTTP requests of one connection until the client closes it.
+
+        """
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                   500: 'Internal Server Error'}
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                started = time.perf_counter()
+                lines = head.decode('latin-1').split('\r\n')
+                method, path = lines[0].split(' ')[:2]
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, response = await self._respond(method, path, body)
+                if status == 200 and path == '/classify':
+                    self.stats.record(time.perf_counter() - started)
+                elif status != 200:
+                    self.stats.errors += 1
+                data = json.dumps(response).encode()
+                close = headers.get('connection', '').lower() == 'close'
+                writer.write(
+                    f"HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n{'Connection: close' if close else 'Connection: keep-alive'}"
+                    f"\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError) as e:
+            print(f"Error serving request: {e}")
+        finally:
+            writer.close()
+
+    async def start(self, socket_path: str = None, host: str = '127.0.0.1', port: int = 8080) -> None:
+        """
+        Starts the batcher and the server on a Unix socket, or on a TCP port if no socket is given.
+
+        Args:
+            socket_path (str, optional): The path of the Unix socket. Defaults to None.
+            host (str, optional): The host to listen on without a socket. Defaults to '127.0.0.1'.
+            port (int, optional): The port to listen on without a socket. Defaults to 8080.
+
+        """
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._run_batches())
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self._server = await asyncio.start_unix_server(self._handle, path=socket_path)
+            self._socket_path = socket_path
+            print(f'Serving {len(self.best_fits)} best fits on unix:{socket_path}')
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+            print(f'Serving {len(self.best_fits)} best fits on http://{host}:{port}')
+
+    async def stop(self) -> None:
+        """
+        Stops accepting connections and the batcher, and removes the Unix socket.
+
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._batcher is not None:
+            self._batcher.cancel()
+        if self._socket_path is not None and os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+
+    async def serve_forever(self, socket_path: str = None, host: str = '127.0.0.1', port: int = 8080) -> None:
+        """
+        Serves until the task is cancelled, e.g. by Ctrl+C.
+
+        Args:
+            socket_path (str, optional): The path of the Unix socket. Defaults to None.
+            host (str, optional): The host to listen on without a socket. Defaults to '127.0.0.1'.
+            port (int, optional): The port to listen on without a socket. Defaults to 8080.
+
+        """
+        await self.start(socket_path, host, port)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
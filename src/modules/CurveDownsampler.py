@@ -0,0 +1,128 @@
+import numpy as np
+
+
+class CurveDownsampler:
+    """
+    A class with point reduction methods for plotting large series.
+
+    A figure is only a few thousand pixels wide, so drawing millions of points
+    costs time without changing the picture. The methods return the indices of
+    the points to keep, in ascending order, so several columns of the same rows
+    can be reduced together.
+
+    Methods:
+        lttb(x, y, threshold): Largest-Triangle-Three-Buckets selection for line plots.
+        min_max(y, buckets): Keeps the minimum and maximum of every bucket for line plots.
+        grid(x, y, width, height): Keeps one point per raster cell for scatter plots.
+    """
+
+    @staticmethod
+    def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+        """
+        Selects points with the Largest-Triangle-Three-Buckets algorithm.
+
+        The first and last points are always kept. The remaining points are split
+        into threshold - 2 buckets, and from each bucket the point forming the
+        largest triangle with the previously kept point and the mean of the next
+        bucket is kept, which preserves the visual shape of the curve.
+
+        Args:
+            x (np.ndarray): The x values, sorted ascending.
+            y (np.ndarray): The y values.
+            threshold (int): The number of points to keep.
+
+        Returns:
+            np.ndarray: The indices of the kept points.
+        """
+        n = len(x)
+        if threshold >= n or threshold < 3:
+            return np.arange(n)
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+        selected = np.empty(threshold, dtype=np.int64)
+        selected[0] = 0
+        selected[-1] = n - 1
+        previous = 0
+        for bucket in range(threshold - 2):
+            start, end = edges[bucket], edges[bucket + 1]
+            next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+            mean_x = x[next_start:next_end].mean()
+            mean_y = np.nanmean(y[next_start:next_end]) if next_end > next_start else y[-1]
+            area = np.abs(
+                (x[previous] - mean_x) * (y[start:end] - y[previous])
+                - (x[previous] - x[start:end]) * (mean_y - y[previous])
+            )
+            if np.isnan(area).all():
+                previous = start
+            else:
+                previous = start + int(np.nanargmax(area))
+            selected[bucket + 1] = previous
+        return selected
+
+    @staticmethod
+    def min_max(y: np.ndarray, buckets: int) -> np.ndarray:
+        """
+        Keeps the minimum and the maximum of every bucket of consecutive points.
+
+        Unlike LTTB this never drops a peak, and it is fully vectorized.
+
+        Args:
+            y (np.ndarray): The y values, in x order.
+            buckets (int): The number of buckets; at most 2 * buckets points are kept.
+
+        Returns:
+            np.ndarray: The indices of the kept points.
+        """
+        n = len(y)
+        if buckets <= 0 or 2 * buckets >= n:
+            return np.arange(n)
+
+        width = -(-n // buckets)
+        padded = np.full(buckets * width, np.nan)
+        padded[:n] = y
+        blocks = padded.reshape(buckets, width)
+        # NaN (missing values and padding) never wins
+        lowest = np.where(np.isnan(blocks), np.inf, blocks).argmin(axis=1)
+        highest = np.where(np.isnan(blocks), -np.inf, blocks).argmax(axis=1)
+        offsets = np.arange(buckets) * width
+        selected = np.concatenate((offsets + lowest, offsets + highest, [0, n - 1]))
+        return np.unique(selected[selected < n])
+
+    @staticmethod
+    def grid(x: np.ndarray, y: np.ndarray, width: int = 400, height: int = 300) -> np.ndarray:
+        """
+        Keeps the first point of every occupied cell of a width x height raster.
+
+        The default raster has cells about the size of a scatter marker, so the
+        kept points cover the same area as all points.
+
+        Args:
+            x (np.ndarray): The x values.
+            y (np.ndarray): The y values.
+            width (int, optional): The number of raster columns. Defaults to 400.
+            height (int, optional): The number of raster rows. Defaults to 300.
+
+        Returns:
+            np.ndarray: The indices of the kept points.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if len(x) <= width * height // 16:
+            return np.arange(len(x))
+
+        finite = np.isfinite(x) & np.isfinite(y)
+        index = np.flatnonzero(finite)
+        if len(index) == 0:
+            return index
+        fx, fy = x[index], y[index]
+
+        def cells(values: np.ndarray, count: int) -> np.ndarray:
+            low, high = values.min(), values.max()
+            scale = (count - 1) / (high - low) if high > low else 0.0
+            return ((values - low) * scale).astype(np.int64)
+
+        cell = cells(fx, width) * height + cells(fy, height)
+        _, first = np.unique(cell, return_index=True)
+        return np.sort(index[first])
@@ -1,10 +1,19 @@
 import math
-from typing import Dict, List, Union
+from typing import Any, Dict, Iterator, List, Tuple, Union
 import numpy as np
 import pandas as pd
+from sqlalchemy import exc, text
 
 from modules.DataHandler import DataHandler
+from modules.IdealCache import IdealCache
+from modules.IdealIndex import IdealIndex
 from modules.MSECalculator import MSECalculator
+from modules.ParallelFitter import ParallelFitter
+from modules.Profiler import profiler
+from modules.ResultCache import ResultCache
+from modules.ResultSink import ResultSink
+from modules.ShardedClassifier import ShardedClassifier
+from schema.index import table_test_points
 
 
 class DataAnalyzer(DataHandler):
@@ -13,63 +22,337 @@ class DataAnalyzer(DataHandler):
 
     Attributes:
         train_set (pd.DataFrame): The training dataset.
-        ideal_set (pd.DataFrame): The ideal dataset.
+        ideal_set (pd.DataFrame): The ideal dataset, as a frame over ideal_row_x and ideal_y.
+        dtype (np.dtype): The storage type of ideal_y, float64 or float32.
+        ideal_columns (List[str]): The names of the ideal functions, in table order.
+        ideal_column_index (Dict[str, int]): The row of each ideal function in ideal_y.
+        ideal_y (np.ndarray): The ideal functions as one C-ordered (functions, rows) matrix,
+            so that the values of every function are contiguous.
+        ideal_row_x (np.ndarray): The float64 x values of the ideal rows, in table order.
+        fit_index (np.ndarray): The rows of the best fits in ideal_y.
+        align_tolerance (float): The largest x distance at which a training row still matches an ideal row.
+        align_interpolate (bool): Whether training rows between ideal rows are fitted against interpolated values.
+        train_alignment (Tuple[np.ndarray, np.ndarray]): The aligned training rows and the ideal functions
+            at those rows, see align_training_data.
         best_fits (List[str]): The list of best fit curves.
+        fit_pairs (List[Tuple[str, str]]): Each fitted training column with its best fit curve.
+        mse_matrix (pd.DataFrame): The MSE of every training column against every ideal column.
+        ideal_x (np.ndarray): The sorted x grid of the ideal set, built after the best fits are found.
+        ideal_order (np.ndarray): The positions of the ideal rows in ideal_x order.
+        ideal_fit_values (np.ndarray): The best fit columns of the ideal set, ordered like ideal_x.
+        sse_accumulator (np.ndarray): The running sum of squared errors per (training, ideal) column pair.
+        accumulated_rows (np.ndarray): The number of training rows in sse_accumulator, per training column.
+        fit_columns (Tuple[List[str], List[str]]): The training and ideal columns of sse_accumulator.
+        result_cache (ResultCache): The persistent fit and result cache, if enabled.
+        sources (Dict[str, str]): The files the training and ideal data were read from.
+        fit_key (str): The result cache key of the inputs the current best fits were found from.
+        shard_stats (List[Dict]): The per-shard rows and throughput of the last parallel classification.
 
     Methods:
-        load_training_data(data): Loads the training data.
-        load_ideal_data(data): Loads the ideal data.
-        find_best_fit(train_y): Finds the best fit curve for a given training set.
-        find_ideal_curves(): Finds the ideal curves for the training set.
-        test_data_point(datapoint): Tests a single data point against the ideal curves.
-        test_data_set(csv_path): Tests a dataset against the ideal curves.
+        load_training_data(data, source): Loads the training data.
+        load_ideal_data(data, cache, source): Loads the ideal data, optionally from the columnar cache.
+        load_fit_columns(table_name, dtype): Replaces the ideal data by only the columns classification needs.
+        enable_result_cache(max_entries, max_result_rows): Caches fits and results by input content.
+        invalidate_cache(key): Removes one or all cached fits and results.
+        lookup_cached_results(train_path, ideal_path, test_path, interpolate): Returns cached results for input files.
+        load_cached_fit(train_path, ideal_path): Restores the cached best fits of input files.
+        results_cache_key(csv_path, interpolate): Returns the result cache key of a test file.
+        align_training_data(): Aligns the training rows with the ideal rows on x.
+        find_best_fit(train_y, top_k, align): Finds the best fit curve (or the top k curves) for a given training set.
+        rank_best_fits(train_y, k, block_size, align): Ranks the k best fit curves with early abandoning.
+        find_ideal_curves(vectorized, refit): Finds the ideal curves for the training set.
+        compute_mse_matrix(): Computes the MSE of all training/ideal column pairs at once.
+        partial_fit(data): Updates the best fits with newly appended training rows.
+        save_fit_state(path): Persists the incremental fit accumulators.
+        load_fit_state(path): Restores the incremental fit accumulators.
+        reset_fit_state(): Discards the incremental fit accumulators.
+        fit_many(train_sets, workers): Finds the best fits of many training tables in parallel.
+        build_ideal_index(): Builds the sorted x lookup for the best fit columns.
+        lookup_ideal_values(x, interpolate): Looks up the best fit values at the given x values.
+        test_data_point(datapoint, interpolate): Tests a single data point against the ideal curves.
+        classify_points(x, y, interpolate): Tests a batch of data points against the ideal curves.
+        iter_test_data_set(csv_path, chunksize, interpolate, workers): Tests a dataset chunk by chunk.
+        test_data_set(csv_path, interpolate, batched, chunksize, workers): Tests a dataset against the ideal curves.
+        write_test_data_set(csv_path, table_name, interpolate, chunksize, upsert, workers): Streams the test results into a table.
+        classify_in_db(points_table, ideal_table, result_table, csv_path, upsert): Tests a dataset inside SQLite.
+        check_precision(ideal_table, csv_path, interpolate): Compares float32 fits and results with float64 ones.
     """
 
-    def __init__(self, *args, **kwargs):
+    __slots__ = (
+        'train_set', 'dtype', 'ideal_columns', 'ideal_column_index', 'ideal_y', 'ideal_row_x', 'fit_index',
+        'align_tolerance', 'align_interpolate', 'train_alignment',
+        'best_fits', 'fit_pairs', 'mse_matrix', 'ideal_x', 'ideal_order', 'ideal_fit_values', 'sse_accumulator',
+        'accumulated_rows', 'fit_columns', 'result_cache', 'sources', 'fit_key', 'shard_stats',
+    )
+
+    def __init__(self, *args, dtype: Any = 'float64', align_tolerance: float = 0.0, align_interpolate: bool = False,
+                 **kwargs):
         # Call parent constructor
         super().__init__(*args, **kwargs)
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float64, np.float32):
+            raise ValueError(f'Unsupported storage dtype {dtype}, expected float64 or float32')
+        if not align_tolerance >= 0:
+            raise ValueError(f'The alignment tolerance must not be negative, got {align_tolerance}')
+        self.align_tolerance = float(align_tolerance)
+        self.align_interpolate = align_interpolate
+        self.train_alignment: Tuple[np.ndarray, np.ndarray] = None
         self.train_set: pd.DataFrame = None
-        self.ideal_set: pd.DataFrame = None
+        self.ideal_columns: List[str] = None
+        self.ideal_column_index: Dict[str, int] = None
+        self.ideal_y: np.ndarray = None
+        self.ideal_row_x: np.ndarray = None
+        self.fit_index: np.ndarray = None
         self.best_fits: List[str] = None
+        self.fit_pairs: List[Tuple[str, str]] = None
+        self.mse_matrix: pd.DataFrame = None
+        self.ideal_x: np.ndarray = None
+        self.ideal_order: np.ndarray = None
+        self.ideal_fit_values: np.ndarray = None
+        self.sse_accumulator: np.ndarray = None
+        self.accumulated_rows: np.ndarray = None
+        self.fit_columns: Tuple[List[str], List[str]] = None
+        self.result_cache: ResultCache = None
+        self.sources: Dict[str, str] = {}
+        self.fit_key: str = None
+        self.shard_stats: List[Dict] = []
+
+    @staticmethod
+    def _y_columns(data: pd.DataFrame) -> List[str]:
+        """
+        Returns the function columns of a dataset, i.e. every column except x.
+
+        Args:
+            data (pd.DataFrame): The dataset.
+
+        Returns:
+            List[str]: The names of the function columns in table order.
+        """
+        return [column for column in data.columns if column != 'x']
+
+    @property
+    def ideal_set(self) -> pd.DataFrame:
+        """
+        The ideal dataset as a DataFrame with x and one column per ideal function.
+
+        The frame is built over the stored arrays without copying them. Assigning
+        a frame stores its functions as one (functions, rows) matrix in the
+        analyzer's dtype; assigning None releases the ideal data.
+
+        """
+        if self.ideal_y is None:
+            return None
+        data = pd.DataFrame(self.ideal_y.T, columns=self.ideal_columns, copy=False)
+        data.insert(0, 'x', self.ideal_row_x)
+        return data
+
+    @ideal_set.setter
+    def ideal_set(self, data: pd.DataFrame) -> None:
+        if data is None:
+            self.fit_index = self.train_alignment = None
+            self.ideal_columns = self.ideal_column_index = self.ideal_y = self.ideal_row_x = None
+            return
+        self._store_ideal(list(data.columns), data.to_numpy(dtype=self.dtype).T, data['x'].to_numpy(dtype=np.float64))
+
+    def _store_ideal(self, columns: List[str], values: np.ndarray, x: np.ndarray) -> None:
+        """
+        Stores the function rows of a (columns, rows) array as the ideal matrix.
+
+        A contiguous range of function rows that already has the analyzer's dtype,
+        e.g. of the memory-mapped IdealCache, is kept as a view instead of a copy.
+
+        Args:
+            columns (List[str]): The names of the rows of values, including x.
+            values (np.ndarray): The ideal data as a (columns, rows) array.
+            x (np.ndarray): The float64 x values.
+
+        """
+        self.fit_index = self.train_alignment = None
+        self.ideal_columns = [column for column in columns if column != 'x']
+        self.ideal_column_index = {column: position for position, column in enumerate(self.ideal_columns)}
+        self.ideal_row_x = x
+        positions = np.array([position for position, column in enumerate(columns) if column != 'x'], dtype=np.int64)
+        if len(positions) and (np.diff(positions) == 1).all():
+            values = values[positions[0]:positions[-1] + 1]
+        else:
+            values = values[positions]
+        self.ideal_y = np.ascontiguousarray(values, dtype=self.dtype)
+
+    def _resolve_fits(self) -> np.ndarray:
+        """
+        Returns the rows of the best fits in ideal_y, resolving the names once per fit.
+
+        Returns:
+            np.ndarray: The row of every best fit.
+        """
+        if self.fit_index is None:
+            self.fit_index = np.array([self.ideal_column_index[fit] for fit in self.best_fits], dtype=np.int64)
+        return self.fit_index
 
-    def load_training_data(self, data):
+    def load_training_data(self, data, source: str = None):
         """
         Loads the training data.
 
         Args:
             data: The training data.
+            source (str, optional): The file the data was read from. With the result cache
+                enabled, its content digest identifies the data instead of hashing the frame.
+                Defaults to None.
 
         Returns:
             None
         """
         self.train_set = data
-    
-    def load_ideal_data(self, data):
+        self.train_alignment = None
+        self._set_source('train', source)
+
+    def load_ideal_data(self, data=None, cache: IdealCache = None, source: str = None):
         """
         Loads the ideal data.
 
         Args:
-            data: The ideal data.
+            data: The ideal data. If omitted, the data is memory-mapped from the cache.
+            cache (IdealCache, optional): The columnar cache to load the ideal data from. Defaults to None.
+            source (str, optional): The file the data was read from, see load_training_data. Defaults to None.
 
         Returns:
             None
         """
-        self.ideal_set = data
+        if data is None and cache is not None:
+            meta = cache.read_meta()
+            if meta is None:
+                print('Ideal cache not found')
+                self.ideal_set = None
+            else:
+                # Keep the memory-mapped (columns, rows) array instead of going through a DataFrame
+                values = cache.load_array()
+                self._store_ideal(meta['columns'], values, np.asarray(values[meta['columns'].index('x')], dtype=np.float64))
+        else:
+            self.ideal_set = data
+        self._set_source('ideal', source)
+        # Any previously built lookup or fit state refers to the old ideal set
+        self.ideal_x = None
+        self.ideal_order = None
+        self.ideal_fit_values = None
+        self.fit_key = None
+        self.reset_fit_state()
+
+    @profiler.profiled('DataAnalyzer.align_training_data')
+    def align_training_data(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Aligns the training rows with the ideal rows on x.
+
+        Training data may cover only part of the ideal grid, in another order or
+        at slightly different x values, so its rows cannot be compared with the
+        ideal rows position by position. The training x values are merged with the
+        sorted ideal grid once, with align_tolerance and align_interpolate (see
+        IdealIndex.align), and all ideal functions are gathered at the aligned
+        rows into one matrix that every candidate comparison reuses. Training rows
+        without a matching ideal row are left out of the fit. If the training x
+        values equal the ideal x values row by row, the ideal matrix is used as it is.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The aligned training rows, or None if all rows align
+                in place, and the ideal functions at those rows as a (functions, rows) matrix.
+                None if no training row matches the ideal set.
+        """
+        if self.train_alignment is not None:
+            return self.train_alignment
+        if self.train_set is None:
+            print('Load training set first')
+            return
+        if self.ideal_y is None:
+            print('Load ideal set first')
+            return
+        train_x = self.train_set['x'].to_numpy(dtype=np.float64)
+        if np.array_equal(train_x, self.ideal_row_x):
+            self.train_alignment = (None, self.ideal_y)
+            return self.train_alignment
+
+        self._sort_ideal_x()
+        rows, lower, upper, weight = IdealIndex.align(self.ideal_x, train_x, self.align_tolerance, self.align_interpolate)
+        if len(rows) == 0:
+            print('No training rows matched the ideal set')
+            return
+        self.train_alignment = (rows, self._aligned_ideal_y(lower, upper, weight))
+        return self.train_alignment
+
+    def _aligned_ideal_y(self, lower: np.ndarray, upper: np.ndarray, weight: np.ndarray,
+                         source: np.ndarray = None) -> np.ndarray:
+        """
+        Gathers all ideal functions at aligned positions of the sorted ideal grid.
+
+        Args:
+            lower (np.ndarray): The lower positions in ideal_x.
+            upper (np.ndarray): The upper positions in ideal_x.
+            weight (np.ndarray): The weight of the upper position, 0 on the grid.
+            source (np.ndarray, optional): A (functions, rows) matrix to gather from instead of ideal_y.
+                Defaults to None.
+
+        Returns:
+            np.ndarray: The (functions, rows) matrix in the dtype of the source.
+        """
+        source = self.ideal_y if source is None else source
+        ideal_y = source[:, self.ideal_order[lower]]
+        between = np.flatnonzero(weight)
+        if len(between):
+            lower_y = ideal_y[:, between]
+            upper_y = source[:, self.ideal_order[upper[between]]]
+            ideal_y[:, between] = lower_y + weight[between] * (upper_y - lower_y)
+        return ideal_y
+
+    def _fit_candidates(self, train_y: np.ndarray, align: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns training values and the ideal functions to compare them with, row by row.
+
+        Args:
+            train_y (np.ndarray): The training values, (rows,) or (rows, columns).
+            align (bool): Whether the values are rows of the loaded training data, to be aligned
+                with the ideal set on x first. Otherwise they are compared with the ideal rows
+                position by position.
 
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The training values and the (functions, rows) ideal matrix,
+                or None if no training row matches the ideal set.
+        """
+        if not align:
+            return train_y, self.ideal_y
+        alignment = self.align_training_data()
+        if alignment is None:
+            return None
+        rows, ideal_y = alignment
+        return (train_y if rows is None else train_y[rows]), ideal_y
 
-    def find_best_fit(self, train_y: List):
+    def find_best_fit(self, train_y: List, top_k: int = None, align: bool = False):
         """
         Finds the best fit curve for a given training set.
 
         Args:
             train_y (List): The y values of the training set.
+            top_k (int, optional): If given, rank the top_k best curves with rank_best_fits
+                instead of returning only the best one. Defaults to None.
+            align (bool, optional): Whether train_y is a column of the loaded training data, to be
+                aligned with the ideal set on x first (see align_training_data). Defaults to False,
+                which compares train_y with the ideal rows position by position.
 
         Returns:
-            Tuple: The name of the best fit curve and the lowest mean squared error (MSE).
+            Tuple: The name of the best fit curve and the lowest mean squared error (MSE),
+                or in ranked mode the ranking and the number of pruned candidates.
         """
-        if self.ideal_set is None:
+        if self.ideal_y is None:
             print('Load ideal set first')
             return
+        if top_k is not None:
+            return self.rank_best_fits(train_y, top_k, align=align)
+        candidates = self._fit_candidates(np.asarray(train_y, dtype=np.float64), align)
+        if candidates is None:
+            return None, float('inf')
+        # Missing training values are left out of the comparison
+        finite = np.isfinite(candidates[0])
+        if not finite.any():
+            return None, float('inf')
+        train_y = candidates[0][finite].tolist()
+
         # Initialize curve_index and lowest MSE
         curve_index = None
         name = None
@@ -78,55 +361,664 @@ class DataAnalyzer(DataHandler):
         lowest_mse = float('inf')
 
         # Iterate through each curve in the ideal set
-        for i in range(1, 51): 
+        for column, values in zip(self.ideal_columns, candidates[1][:, finite]):
             # Extract y values from the ideal set
-            y_values =  self.ideal_set[f'y{i}'].tolist()
-          
+            y_values = values.tolist()
+
             # Compute the MSE between the y values of the curve and the training set
             mse = MSECalculator.calculate(train_y, y_values)
 
             # If the MSE is lower than the current lowest MSE, update the lowest MSE and best curve
-            if mse < lowest_mse:
-                curve_index = i
+            if mse is not None and mse < lowest_mse:
+                curve_index = column
                 lowest_mse = mse
 
         if curve_index is not None:
-            name = f'y{curve_index}'
+            name = curve_index
 
-        return name, lowest_mse    
-    
-    def find_ideal_curves(self):
+        return name, lowest_mse
+
+    @profiler.profiled('DataAnalyzer.rank_best_fits')
+    def rank_best_fits(self, train_y: List, k: int = 5, block_size: int = 256,
+                       align: bool = False) -> Tuple[pd.DataFrame, int]:
+        """
+        Ranks the k best fit curves for a given training set.
+
+        The squared errors are accumulated block by block of rows. The k curves
+        with the lowest error on the first block are evaluated in full to get an
+        upper bound for the k-th best SSE. The other curves are then evaluated
+        in groups, most promising first, and each curve is abandoned as soon as
+        its partial SSE exceeds the bound. Since the partial SSE only grows,
+        abandoned curves can never be among the k best. Whenever a group
+        finishes, the bound is tightened to the k-th best SSE seen so far.
+        Curves with a NaN error rank last, like in find_best_fit.
+
+        Args:
+            train_y (List): The y values of the training set.
+            k (int, optional): The number of curves to return, at least 1. Defaults to 5.
+            block_size (int, optional): The number of rows accumulated between pruning steps. Defaults to 256.
+            align (bool, optional): Whether train_y is a column of the loaded training data, to be
+                aligned with the ideal set on x first, see find_best_fit. Defaults to False.
+
+        Returns:
+            Tuple[pd.DataFrame, int]: The k best curves ordered by ascending MSE, with
+                ideal_func and mse columns, and the number of curves abandoned early.
+        """
+        if self.ideal_y is None:
+            print('Load ideal set first')
+            return
+        if k < 1:
+            print('k must be at least 1')
+            return
+        ideal_columns = self.ideal_columns
+        candidates = self._fit_candidates(np.asarray(train_y, dtype=np.float64), align)
+        if candidates is None:
+            return
+        train_y, ideal_y = candidates[0], candidates[1].T
+        if len(train_y) == len(ideal_y):
+            finite = np.isfinite(train_y)
+            train_y, ideal_y = train_y[finite], ideal_y[finite]
+        if len(train_y) != len(ideal_y) or len(train_y) == 0:
+            print('Training and ideal set must have the same number of rows')
+            return
+        k = min(k, len(ideal_columns))
+        block_size = max(1, block_size)
+
+        def block_sse(rows, columns):
+            sse = MSECalculator.sse(train_y[rows], ideal_y[rows][:, columns])
+            # A NaN would never exceed the bound, treat it as the worst error instead
+            return np.where(np.isnan(sse), np.inf, sse)
+
+        # Partial SSE of every candidate over the first block
+        first = slice(0, block_size)
+        everything = np.arange(len(ideal_columns))
+        partial = block_sse(first, everything)
+
+        # Fully evaluate the k most promising candidates to bound the k-th best SSE
+        best = np.argsort(partial, kind='stable')[:k]
+        best_sse = block_sse(slice(None), best)
+        threshold = best_sse.max()
+
+        # The rest, most promising first so the bound tightens early
+        rest = np.setdiff1d(everything, best)
+        rest = rest[np.argsort(partial[rest], kind='stable')]
+        pruned = 0
+        # Enough candidates per group to keep the block sums vectorized
+        group_size = max(k, 64)
+        for group_start in range(0, len(rest), group_size):
+            active = rest[group_start:group_start + group_size]
+            survivors = partial[active] <= threshold
+            pruned += len(active) - int(np.count_nonzero(survivors))
+            active = active[survivors]
+
+            for start in range(block_size, len(train_y), block_size):
+                if len(active) == 0:
+                    break
+                partial[active] += block_sse(slice(start, start + block_size), active)
+                survivors = partial[active] <= threshold
+                pruned += len(active) - int(np.count_nonzero(survivors))
+                active = active[survivors]
+
+            if len(active):
+                # Keep the k best so far, ties by column position like the pairwise search
+                best = np.concatenate([best, active])
+                best_sse = np.concatenate([best_sse, partial[active]])
+                order = np.lexsort((best, best_sse))[:k]
+                best, best_sse = best[order], best_sse[order]
+                threshold = best_sse.max()
+
+        candidates, sse = best, best_sse
+        order = np.lexsort((candidates, sse))[:k]
+        ranking = pd.DataFrame({
+            'ideal_func': [ideal_columns[i] for i in candidates[order]],
+            'mse': sse[order] / len(train_y),
+        })
+        return ranking, pruned
+
+    @profiler.profiled('DataAnalyzer.compute_mse_matrix')
+    def compute_mse_matrix(self) -> pd.DataFrame:
+        """
+        Computes the MSE of every training column against every ideal column.
+
+        All pairs are evaluated in one batched NumPy pass over the training rows
+        aligned with the ideal set (see align_training_data). Missing training
+        values only remove their row from their own column, see MSECalculator.finite_sse. The
+        columns are discovered from the loaded datasets, so any number of
+        training and ideal functions is supported.
+
+        Returns:
+            pd.DataFrame: The MSE matrix, indexed by training column with one column per ideal function.
+        """
+        if self.train_set is None:
+            print('Load training set first')
+            return
+        if self.ideal_y is None:
+            print('Load ideal set first')
+            return
+        train_columns = self._y_columns(self.train_set)
+        ideal_columns = list(self.ideal_columns)
+        candidates = self._fit_candidates(self.train_set[train_columns].to_numpy(dtype=np.float64), align=True)
+        if candidates is None:
+            return
+        train_y, ideal_y = candidates
+
+        if len(train_y) == 0:
+            print('Training set has no rows to fit')
+            return
+
+        # A float32 ideal set is multiplied in float32; the candidates around each
+        # minimum are recomputed in float64 either way
+        sse, counts = MSECalculator.finite_sse(
+            train_y, ideal_y.T, lambda a, b: MSECalculator.best_fit_sse_matrix(a, b, dtype=self.dtype)
+        )
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mse_matrix = pd.DataFrame(sse / counts[:, None], index=train_columns, columns=ideal_columns)
+        # Seed the incremental accumulators so that later appends only add their own rows
+        self.sse_accumulator = sse
+        self.accumulated_rows = counts
+        self.fit_columns = (train_columns, ideal_columns)
+        return self.mse_matrix
+
+    def _select_fits(self, sse: np.ndarray, counts: np.ndarray, train_columns: List[str],
+                     ideal_columns: List[str]) -> List[Tuple[str, str]]:
+        """
+        Selects the ideal function with the lowest error for every training column.
+
+        Ideal functions with missing values are never selected. Training columns
+        without any usable row get no fit and are reported, like find_best_fit
+        does for the pairwise search.
+
+        Args:
+            sse (np.ndarray): The (columns, functions) SSE.
+            counts (np.ndarray): The number of rows behind each training column's SSE.
+            train_columns (List[str]): The training columns.
+            ideal_columns (List[str]): The ideal functions.
+
+        Returns:
+            List[Tuple[str, str]]: The training columns that have a fit, with their best fit.
+        """
+        pairs = []
+        for column, index in zip(train_columns, MSECalculator.best_columns(sse, counts)):
+            if index < 0:
+                print(f'No usable rows to fit training column {column}')
+                continue
+            pairs.append((column, ideal_columns[index]))
+        return pairs
+
+    def _set_source(self, kind: str, source: str | None) -> None:
+        if source is None:
+            self.sources.pop(kind, None)
+        else:
+            self.sources[kind] = source
+
+    def enable_result_cache(self, max_entries: int = 64, max_result_rows: int = 10_000_000) -> ResultCache:
+        """
+        Enables the persistent result cache in the analyzer's database.
+
+        With the cache enabled, find_ideal_curves and test_data_set return stored
+        results when their inputs have the same content as a previous run.
+
+        Args:
+            max_entries (int, optional): The maximum number of cached fits and results. Defaults to 64.
+            max_result_rows (int, optional): The maximum total number of cached result rows. Defaults to 10000000.
+
+        Returns:
+            ResultCache: The cache.
+        """
+        self.result_cache = ResultCache(self.engine, max_entries, max_result_rows)
+        return self.result_cache
+
+    def invalidate_cache(self, key: str = None) -> None:
+        """
+        Removes cached fits and results.
+
+        Args:
+            key (str, optional): The cache key to remove. Defaults to None, which clears the whole cache.
+
+        Returns:
+            None
+        """
+        if self.result_cache is None:
+            print('Result cache is not enabled')
+            return
+        self.result_cache.invalidate(key)
+
+    def _input_digest(self, kind: str, data: pd.DataFrame) -> str:
+        """
+        Returns the content digest of the loaded training or ideal data.
+
+        Args:
+            kind (str): 'train' or 'ideal'.
+            data (pd.DataFrame): The loaded data, hashed if no source file is known.
+
+        Returns:
+            str: The digest.
+        """
+        if kind in self.sources:
+            return self.result_cache.file_digest(self.sources[kind])
+        return self.result_cache.frame_digest(data)
+
+    def _fit_options_key(self) -> Tuple[str, ...]:
+        # Default options add nothing, so fits cached before the options existed stay valid
+        options = []
+        if self.dtype != np.float64:
+            options.append(f'dtype={self.dtype}')
+        if self.align_tolerance != 0 or self.align_interpolate:
+            options += [f'align_tolerance={self.align_tolerance!r}', f'align_interpolate={self.align_interpolate}']
+        return tuple(options)
+
+    def _fit_cache_key(self) -> str:
+        return ResultCache.combine(
+            self._input_digest('train', self.train_set),
+            self._input_digest('ideal', self.ideal_set),
+            *self._fit_options_key(),
+        )
+
+    def _file_fit_key(self, train_path: str, ideal_path: str) -> str:
+        return ResultCache.combine(self.result_cache.file_digest(train_path), self.result_cache.file_digest(ideal_path),
+                                   *self._fit_options_key())
+
+    @staticmethod
+    def _results_cache_key(fit_key: str, test_digest: str, interpolate: bool) -> str:
+        return ResultCache.combine(fit_key, test_digest, f'interpolate={interpolate}')
+
+    def lookup_cached_results(self, train_path: str, ideal_path: str, test_path: str, interpolate: bool = False) -> pd.DataFrame:
+        """
+        Returns cached classification results for the given input files without loading them.
+
+        Args:
+            train_path (str): The training CSV file.
+            ideal_path (str): The ideal CSV file.
+            test_path (str): The test CSV file.
+            interpolate (bool, optional): Whether the results were computed with interpolation. Defaults to False.
+
+        Returns:
+            pd.DataFrame: The cached results, or None on a cache miss or if the cache is disabled.
+        """
+        if self.result_cache is None:
+            return None
+        fit_key = self._file_fit_key(train_path, ideal_path)
+        key = self._results_cache_key(fit_key, self.result_cache.file_digest(test_path), interpolate)
+        return self.result_cache.get_results(key)
+
+    def load_cached_fit(self, train_path: str, ideal_path: str) -> List[str]:
+        """
+        Restores the best fits of previously fitted input files without loading the data.
+
+        Only the digests of the two files are needed, and those are reused while
+        the files are unchanged, so a fit found by an earlier run costs no table
+        reads. Call load_fit_columns afterwards to read the columns classification needs.
+
+        Args:
+            train_path (str): The training CSV file.
+            ideal_path (str): The ideal CSV file.
+
+        Returns:
+            List[str]: The best fits, or None on a cache miss or if the cache is disabled.
+        """
+        if self.result_cache is None:
+            return None
+        fit_key = self._file_fit_key(train_path, ideal_path)
+        cached = self.result_cache.get_fit(fit_key)
+        if cached is None:
+            return None
+        self.best_fits = cached[0]
+        # The cached MSE is keyed by training column, in the order of the best fits
+        self.fit_pairs = list(zip(cached[1], self.best_fits))
+        self.mse_matrix = None
+        self.reset_fit_state()
+        self.fit_key = fit_key
+        self._set_source('train', train_path)
+        self._set_source('ideal', ideal_path)
+        return self.best_fits
+
+    def results_cache_key(self, csv_path: str, interpolate: bool = False) -> str:
+        """
+        Returns the result cache key for classifying a test file with the current best fits.
+
+        Args:
+            csv_path (str): The test CSV file.
+            interpolate (bool, optional): Whether the results are computed with interpolation. Defaults to False.
+
+        Returns:
+            str: The cache key, or None if the cache is disabled or the best fits are not cacheable.
+        """
+        if self.result_cache is None or self.fit_key is None:
+            return None
+        return self._results_cache_key(self.fit_key, self.result_cache.file_digest(csv_path), interpolate)
+
+    @profiler.profiled('DataAnalyzer.fit_many', rows=len)
+    def fit_many(self, train_sets: Dict[str, pd.DataFrame], workers: int = None) -> pd.DataFrame:
+        """
+        Finds the best fits of many independent training tables in a process pool.
+
+        The ideal set is placed in shared memory once instead of being sent to
+        every worker, and every table is aligned with it on x like in
+        align_training_data. The analyzer's own training data and best fits are
+        not changed.
+
+        Args:
+            train_sets (Dict[str, pd.DataFrame]): The training tables by dataset name.
+            workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+
+        Returns:
+            pd.DataFrame: The best fit and its MSE per dataset and training column.
+        """
+        if self.ideal_y is None:
+            print('Load ideal set first')
+            return
+        return ParallelFitter(self.ideal_set, workers, self.align_tolerance, self.align_interpolate).fit(train_sets)
+
+    def reset_fit_state(self) -> None:
+        """
+        Discards the incremental fit accumulators.
+
+        Returns:
+            None
+        """
+        self.sse_accumulator = None
+        self.accumulated_rows = None
+        self.fit_columns = None
+
+    @profiler.profiled('DataAnalyzer.partial_fit')
+    def partial_fit(self, data: pd.DataFrame) -> List[str]:
+        """
+        Updates the best fits with newly appended training rows.
+
+        Each new row is aligned with the ideal grid like in align_training_data and
+        its squared errors are added to the running per-(training, ideal) sums, so
+        the cost is proportional to the number of new rows only. Rows without a
+        matching ideal row are ignored. The first call starts from empty
+        accumulators unless find_ideal_curves or load_fit_state ran before; best
+        fits restored from the result cache are first re-evaluated on the loaded
+        training data, see _seed_fit_state.
+
+        Args:
+            data (pd.DataFrame): The new training rows, with x and the training columns.
+
+        Returns:
+            List[str]: The list of best fit curves over all rows seen so far.
+        """
+        if self.ideal_y is None:
+            print('Load ideal set first')
+            return
+        if not self._seed_fit_state():
+            return
+        train_columns = self._y_columns(data)
+        ideal_columns = list(self.ideal_columns)
+        if self.sse_accumulator is None:
+            self.sse_accumulator = np.zeros((len(train_columns), len(ideal_columns)))
+            self.accumulated_rows = np.zeros(len(train_columns), dtype=np.int64)
+            self.fit_columns = (train_columns, ideal_columns)
+        elif self.fit_columns != (train_columns, ideal_columns):
+            print('Training or ideal columns differ from the accumulated fit')
+            return
+
+        self._sort_ideal_x()
+        rows, lower, upper, weight = IdealIndex.align(self.ideal_x, data['x'].to_numpy(dtype=np.float64),
+                                                      self.align_tolerance, self.align_interpolate)
+        train_y = data[train_columns].to_numpy(dtype=np.float64)[rows]
+        ideal_y = self._aligned_ideal_y(lower, upper, weight).T
+
+        sse, counts = MSECalculator.finite_sse(train_y, ideal_y, MSECalculator.sse)
+        self.sse_accumulator += sse
+        self.accumulated_rows += counts
+
+        return self._select_accumulated_fits()
+
+    def _seed_fit_state(self) -> bool:
+        """
+        Seeds the incremental accumulators for best fits that were found without them.
+
+        A fit restored from the result cache only stores the best fits, so its
+        squared errors are computed again from the loaded training data. Otherwise
+        partial_fit would select the best fits from the new rows alone.
+
+        Returns:
+            bool: False if the best fits have no accumulators and no training data to compute them from.
+        """
+        if self.sse_accumulator is not None or self.best_fits is None:
+            return True
+        if self.train_set is None:
+            print('Load the training data of the best fits first')
+            return False
+        return self.compute_mse_matrix() is not None
+
+    def _select_accumulated_fits(self) -> List[str]:
+        """
+        Selects the best fits from the incremental accumulators.
+
+        Returns:
+            List[str]: The list of best fit curves.
+        """
+        if not self.accumulated_rows.any():
+            print('No training rows matched the ideal set')
+            return
+        train_columns, ideal_columns = self.fit_columns
+        self.fit_key = None
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mse = self.sse_accumulator / self.accumulated_rows[:, None]
+        self.mse_matrix = pd.DataFrame(mse, index=train_columns, columns=ideal_columns)
+        pairs = self._select_fits(self.sse_accumulator, self.accumulated_rows, train_columns, ideal_columns)
+        self.best_fits = [fit for _, fit in pairs]
+        self.fit_pairs = pairs
+        self.build_ideal_index()
+        return self.best_fits
+
+    def save_fit_state(self, path: str) -> None:
+        """
+        Persists the incremental fit accumulators to a .npz file.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            None
+        """
+        if not self._seed_fit_state():
+            return
+        if self.sse_accumulator is None:
+            print('Find best fits first')
+            return
+        train_columns, ideal_columns = self.fit_columns
+        np.savez(
+            path,
+            sse=self.sse_accumulator,
+            rows=np.asarray(self.accumulated_rows, dtype=np.int64),
+            train_columns=np.asarray(train_columns, dtype=str),
+            ideal_columns=np.asarray(ideal_columns, dtype=str),
+        )
+
+    def load_fit_state(self, path: str) -> List[str]:
+        """
+        Restores the incremental fit accumulators saved with save_fit_state.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            List[str]: The list of best fit curves of the restored state.
+        """
+        if self.ideal_y is None:
+            print('Load ideal set first')
+            return
+        with np.load(path) as state:
+            fit_columns = (state['train_columns'].tolist(), state['ideal_columns'].tolist())
+            if fit_columns[1] != self.ideal_columns:
+                print('Saved fit state does not match the loaded ideal set')
+                return
+            self.sse_accumulator = state['sse'].copy()
+            # Older states hold one row count for all training columns
+            self.accumulated_rows = np.broadcast_to(state['rows'], len(fit_columns[0])).astype(np.int64)
+            self.fit_columns = fit_columns
+        return self._select_accumulated_fits()
+
+    @profiler.profiled('DataAnalyzer.find_ideal_curves')
+    def find_ideal_curves(self, vectorized: bool = True, refit: bool = False):
         """
         Finds the ideal curves for the training set.
 
+        Args:
+            vectorized (bool, optional): Whether to evaluate all pairs in one batched pass
+                instead of one find_best_fit call per training column. Defaults to True.
+            refit (bool, optional): Whether to fit again even if the result cache holds a fit
+                for these inputs; the new fit replaces the cached one. Defaults to False.
+
         Returns:
             List[str]: The list of best fit curves.
         """
         if self.train_set is None:
             print('Load training set first')
             return
-        if self.ideal_set is None:
+        if self.ideal_y is None:
             print('Load ideal set first')
             return
-        best_fits: List[str] = []
+
+        # Only fits found here are tied to the loaded inputs and can key cached results
+        self.fit_key = None
+        if self.result_cache is not None:
+            fit_key = self._fit_cache_key()
+            cached = None if refit else self.result_cache.get_fit(fit_key)
+            if cached is not None:
+                self.best_fits = cached[0]
+                self.fit_pairs = list(zip(cached[1], self.best_fits))
+                self.mse_matrix = None
+                self.reset_fit_state()
+                self.fit_key = fit_key
+                self.build_ideal_index()
+                return self.best_fits
+
+        if vectorized:
+            mse_matrix = self.compute_mse_matrix()
+            if mse_matrix is None:
+                # No training row matched the ideal set, so no column has a fit, as in the pairwise search
+                self.best_fits = []
+                self.fit_pairs = []
+                self.build_ideal_index()
+                return self.best_fits
+            pairs = self._select_fits(self.sse_accumulator, self.accumulated_rows, *self.fit_columns)
+            self.best_fits = [fit for _, fit in pairs]
+            self.fit_pairs = pairs
+            if self.result_cache is not None:
+                best_mse = {column: float(mse_matrix.at[column, fit]) for column, fit in pairs}
+                self.result_cache.put_fit(fit_key, self.best_fits, best_mse)
+                self.fit_key = fit_key
+            self.build_ideal_index()
+            return self.best_fits
+
+        pairs: List[Tuple[str, str]] = []
 
         # Iterate through each y column in the training set
-        for i in range(1, 5):
+        for column in self._y_columns(self.train_set):
             # Extract y values from the training set
-            train_y = self.train_set[f'y{i}'].tolist()
-            best_fit = self.find_best_fit(train_y)
-            # If best fit is found, append it to the best fits list
+            train_y = self.train_set[column].tolist()
+            best_fit = self.find_best_fit(train_y, align=True)
+            # If best fit is found, pair it with the training column
             if best_fit[0] is not None:
-                best_fits.append(best_fit[0])
-        self.best_fits = best_fits
-        return best_fits
-    
-    def test_data_point(self, datapoint: List):
+                pairs.append((column, best_fit[0]))
+            else:
+                print(f'No usable rows to fit training column {column}')
+        self.best_fits = [fit for _, fit in pairs]
+        self.fit_pairs = pairs
+        self.build_ideal_index()
+        return self.best_fits
+
+    @profiler.profiled('DataAnalyzer.load_fit_columns', rows=len)
+    def load_fit_columns(self, table_name: str = 'ideal', dtype: Any = 'float64') -> pd.DataFrame:
+        """
+        Replaces the ideal data by x and the best fit columns, read from the database.
+
+        After fitting, classification only needs the best fit columns, so the
+        full ideal set can be released and only these columns are read, with a
+        compact dtype if requested. The best fits and their cache key are kept,
+        the incremental fit accumulators are discarded because they refer to all
+        ideal columns.
+
+        Args:
+            table_name (str, optional): The table holding the ideal data. Defaults to 'ideal'.
+            dtype (Any, optional): The dtype of the columns, e.g. 'float32'. Defaults to 'float64'.
+
+        Returns:
+            pd.DataFrame: The projected ideal data, or None if it could not be read.
+        """
+        if self.best_fits is None:
+            print('Find best fits first')
+            return None
+        columns = ['x'] + list(dict.fromkeys(self.best_fits))
+        data = self.read_table(table_name, columns, dtype=dtype)
+        if len(data.columns) == 0:
+            return None
+        self.ideal_set = data
+        self.ideal_x = None
+        self.ideal_order = None
+        self.ideal_fit_values = None
+        self.reset_fit_state()
+        self.build_ideal_index()
+        return data
+
+    @profiler.profiled('DataAnalyzer.build_ideal_index')
+    def build_ideal_index(self) -> None:
+        """
+        Builds the sorted x lookup for the best fit columns.
+
+        The ideal x values are sorted once and the best fit columns are gathered
+        in the same order, so every later lookup is a binary search instead of a
+        scan over the whole ideal set.
+
+        Returns:
+            None
+        """
+        if self.best_fits is None:
+            print('Find best fits first')
+            return
+        if self.ideal_y is None:
+            print('Load ideal set first')
+            return
+        self._sort_ideal_x()
+        self.fit_index = None
+        self.ideal_fit_values = np.ascontiguousarray(self.ideal_y[self._resolve_fits()][:, self.ideal_order].T)
+
+    def _sort_ideal_x(self) -> None:
+        """
+        Sorts the x grid of the ideal set once and remembers the row order.
+
+        Returns:
+            None
+        """
+        if self.ideal_order is not None:
+            return
+        ideal_x = self.ideal_row_x
+        self.ideal_order = np.argsort(ideal_x, kind='stable')
+        self.ideal_x = ideal_x[self.ideal_order]
+
+    def lookup_ideal_values(self, x, interpolate: bool = False) -> np.ndarray:
+        """
+        Looks up the values of the best fit columns at the given x values.
+
+        Args:
+            x: A single x value or an array of x values.
+            interpolate (bool, optional): Whether to linearly interpolate between the
+                neighbouring ideal rows for x values that are not on the ideal grid.
+                Defaults to False.
+
+        Returns:
+            np.ndarray: Array of shape (len(x), len(best_fits)). Rows for x values that
+                are not on the grid (or outside of it when interpolating) are NaN.
+        """
+        if self.ideal_fit_values is None:
+            self.build_ideal_index()
+            if self.ideal_fit_values is None:
+                return
+        return IdealIndex.lookup(self.ideal_x, self.ideal_fit_values, x, interpolate)
+
+    def test_data_point(self, datapoint: List, interpolate: bool = False):
         """
         Tests a single data point against the ideal curves.
 
         Args:
             datapoint (List): The data point to be tested.
+            interpolate (bool, optional): Whether to interpolate the ideal curves for x values
+                that are not on the ideal grid. Without it such points never match. Defaults to False.
 
         Returns:
             List[List]: A list of suitable data points that meet the deviation criteria.
@@ -134,7 +1026,7 @@ class DataAnalyzer(DataHandler):
         if self.best_fits is None:
             print('Find best fits first')
             return
-        if self.ideal_set is None:
+        if self.ideal_y is None:
             print('Load ideal set first')
             return
 
@@ -148,13 +1040,12 @@ class DataAnalyzer(DataHandler):
         # Criteria for deviation
         max_deviation = math.sqrt(2)
 
-        ideal = self.ideal_set
         best_fits = self.best_fits
-        
+        # Get the y values of all best fits at the x value of the datapoint
+        ideal_values = self.lookup_ideal_values(x, interpolate)[0]
+
         # Iterate through each best fit
-        for best_fit in best_fits:
-            # Get y value from the pandas dataframe (ideal) based on the x value of the datapoint
-            ideal_y = ideal[ideal['x'] == x][best_fit].values[0]
+        for best_fit, ideal_y in zip(best_fits, ideal_values):
             # Compute the deviation
             deviation = abs(y - ideal_y)
             # If the deviation is lower or equal than the max deviation, set the ideal function and update the deviation
@@ -169,12 +1060,213 @@ class DataAnalyzer(DataHandler):
         
         
     
-    def test_data_set(self, csv_path: str):
+    @profiler.profiled('DataAnalyzer.classify_points', rows=len)
+    def classify_points(self, x: np.ndarray, y: np.ndarray, interpolate: bool = False) -> pd.DataFrame:
+        """
+        Tests a batch of data points against the ideal curves in one array operation.
+
+        Args:
+            x (np.ndarray): The x values of the data points.
+            y (np.ndarray): The y values of the data points.
+            interpolate (bool, optional): Whether to interpolate the ideal curves for x values
+                that are not on the ideal grid. Defaults to False.
+
+        Returns:
+            pd.DataFrame: The matching rows with x, y, deviation and ideal function, in input
+                order and, per point, in best fit order. The number of points without any
+                match is stored in the frame's attrs under 'no_best_fit'.
+        """
+        if self.ideal_fit_values is None:
+            self.build_ideal_index()
+            if self.ideal_fit_values is None:
+                return
+        return IdealIndex.classify(self.ideal_x, self.ideal_fit_values, self.best_fits, x, y, interpolate)
+
+    def iter_test_data_set(self, csv_path: str, chunksize: int = 100_000, interpolate: bool = False,
+                           workers: int = None) -> Iterator[pd.DataFrame]:
+        """
+        Tests a dataset against the ideal curves, yielding the results chunk by chunk.
+
+        Only one chunk of the CSV file and its results are held in memory at a time.
+        With workers, the file is split into byte-range shards that a process pool
+        classifies in parallel (see ShardedClassifier); the chunks are then the
+        shards, still yielded in file order, and the per-shard throughput is kept
+        in shard_stats.
+
+        Args:
+            csv_path (str): The path to the CSV file containing the dataset.
+            chunksize (int, optional): The number of CSV rows classified per chunk. Defaults to 100000.
+            interpolate (bool, optional): Whether to interpolate the ideal curves for x values
+                that are not on the ideal grid. Defaults to False.
+            workers (int, optional): The number of worker processes. Defaults to None, which
+                classifies in this process.
+
+        Yields:
+            pd.DataFrame: The results of each chunk, including x, y, deviation, and ideal function.
+        """
+        if self.best_fits is None:
+            print('Find best fits first')
+            return
+        if self.ideal_y is None:
+            print('Load ideal set first')
+            return
+
+        if workers is not None:
+            if self.ideal_fit_values is None:
+                self.build_ideal_index()
+            classifier = ShardedClassifier(self.ideal_x, self.ideal_fit_values, self.best_fits, workers)
+            self.shard_stats = classifier.shard_stats
+            yield from profiler.iterate('DataAnalyzer.classify_shard', classifier.iter_classify(csv_path, interpolate), rows=len)
+            return
+
+        chunks = pd.read_csv(csv_path, chunksize=chunksize, usecols=['x', 'y'], dtype='float64')
+        for chunk in profiler.iterate('DataAnalyzer.read_csv_chunk', chunks, rows=len):
+            yield self.classify_points(chunk['x'].to_numpy(), chunk['y'].to_numpy(), interpolate)
+
+    @profiler.profiled('DataAnalyzer.write_test_data_set', rows=lambda rows: rows)
+    def write_test_data_set(self, csv_path: str, table_name: str = 'test', interpolate: bool = False,
+                            chunksize: int = 100_000, upsert: bool = False, workers: int = None) -> int:
+        """
+        Tests a dataset against the ideal curves and streams the results into the typed result table.
+
+        Unlike test_data_set, the results are never collected in memory: every
+        classified chunk is handed to a ResultSink, which appends it in batched
+        transactions. With upsert, writing the same test set again leaves the
+        table unchanged.
+
+        Args:
+            csv_path (str): The path to the CSV file containing the dataset.
+            table_name (str, optional): The result table, created if needed. Defaults to 'test'.
+            interpolate (bool, optional): Whether to interpolate the ideal curves for x values
+                that are not on the ideal grid. Defaults to False.
+            chunksize (int, optional): The number of CSV rows classified per chunk. Defaults to 100000.
+            upsert (bool, optional): Whether rows with an existing (x, y, ideal_func) key are updated
+                instead of added. Defaults to False.
+            workers (int, optional): The number of worker processes, see iter_test_data_set. Defaults to None.
+
+        Returns:
+            int: The number of result rows written.
+        """
+        no_best_fit = 0
+        with ResultSink(self, table_name, upsert=upsert) as sink:
+            for frame in self.iter_test_data_set(csv_path, chunksize, interpolate, workers):
+                no_best_fit += frame.attrs['no_best_fit']
+                sink.write(frame)
+
+        print('No best fit: ', no_best_fit)
+        return sink.rows_written
+
+    @profiler.profiled('DataAnalyzer.classify_in_db', rows=lambda rows: rows)
+    def classify_in_db(self, points_table: str = 'test_points', ideal_table: str = 'ideal', result_table: str = 'test',
+                       csv_path: str = None, upsert: bool = False) -> int:
+        """
+        Tests a dataset that is stored in the database against the ideal curves, entirely inside SQLite.
+
+        The test points are joined with the ideal table on x through B-tree
+        indexes, delta_y is computed for every best fit column, and the rows
+        within the deviation threshold are inserted straight into the result
+        table by one INSERT ... SELECT statement. No row passes through Python,
+        so the test set may be larger than memory. Only points whose x is on the
+        ideal grid are matched; there is no interpolation in this mode.
+
+        Args:
+            points_table (str, optional): The table holding the x and y columns of the test points.
+                Defaults to 'test_points'.
+            ideal_table (str, optional): The table holding the ideal data. Defaults to 'ideal'.
+            result_table (str, optional): The result table, created if needed. Defaults to 'test'.
+            csv_path (str, optional): If given, the points table is recreated and loaded from this
+                CSV file first. Defaults to None.
+            upsert (bool, optional): Whether rows with an existing (x, y, ideal_func) key are updated
+                instead of added. Defaults to False.
+
+        Returns:
+            int: The number of result rows written, or None if the classification failed.
+        """
+        if self.best_fits is None:
+            print('Find best fits first')
+            return None
+
+        if csv_path is not None:
+            self.create_table(points_table, table_test_points, True)
+            if self.load_csv_to_db(csv_path, points_table, bulk=True) is None:
+                return None
+
+        quote = self.engine.dialect.identifier_preparer.quote
+        points, ideal = quote(points_table), quote(ideal_table)
+        fits = list(dict.fromkeys(self.best_fits))
+        try:
+            with self.engine.connect() as connection:
+                ideal_columns = list(connection.exec_driver_sql(f"SELECT * FROM {ideal} LIMIT 0").keys())
+        except exc.SQLAlchemyError as e:
+            print(f"Error classifying in the database: {e}")
+            return None
+        missing = [column for column in ['x'] + fits if column not in ideal_columns]
+        if missing:
+            print(f"Error classifying in the database: columns {missing} do not exist in table {ideal_table}")
+            return None
+
+        sink = ResultSink(self, result_table, upsert=upsert)
+        sink.ensure_table()
+
+        # Join once, reading only the best fit columns of each (wide) ideal row, ...
+        matches = quote('classify_matches')
+        join = (
+            f"CREATE TEMP TABLE {matches} AS SELECT p.rowid AS point, p.x AS x, p.y AS y, "
+            + ', '.join(f"i.{quote(fit)} AS f{position}" for position, fit in enumerate(fits))
+            + f" FROM {points} AS p JOIN {ideal} AS i ON i.x = p.x"
+        )
+        # ... then emit one row per suitable fit; ordering by point and fit gives the row order of test_data_set
+        branches = ' UNION ALL '.join(
+            f"SELECT point, {position} AS fit, x, y, ABS(y - f{position}) AS delta_y, :fit_{position} AS ideal_func "
+            f"FROM {matches} WHERE ABS(y - f{position}) <= :max_deviation"
+            for position in range(len(fits))
+        )
+        statement = (
+            f"INSERT INTO {quote(result_table)} (x, y, delta_y, ideal_func) "
+            f"SELECT x, y, delta_y, ideal_func FROM ({branches}) WHERE true ORDER BY point, fit"
+        )
+        # The WHERE clause above keeps SQLite from reading ON CONFLICT as part of the SELECT
+        if sink.upsert:
+            statement += " ON CONFLICT (x, y, ideal_func) DO UPDATE SET delta_y = excluded.delta_y"
+        suitable = ' OR '.join(f"ABS(y - f{position}) <= :max_deviation" for position in range(len(fits)))
+        parameters = {'max_deviation': math.sqrt(2)}
+        parameters.update({f'fit_{position}': fit for position, fit in enumerate(fits)})
+
+        try:
+            with self.write_lock, self.engine.begin() as connection:
+                connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {quote(f'ix_{ideal_table}_x')} ON {ideal} (x)")
+                connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {quote(f'ix_{points_table}_x')} ON {points} (x)")
+                connection.exec_driver_sql(f"DROP TABLE IF EXISTS temp.{matches}")
+                connection.exec_driver_sql(join)
+                rows = connection.execute(text(statement), parameters).rowcount
+                total = connection.exec_driver_sql(f"SELECT COUNT(*) FROM {points}").scalar()
+                # Duplicate x values in the ideal table join a point more than once
+                matched = connection.execute(
+                    text(f"SELECT COUNT(DISTINCT point) FROM {matches} WHERE {suitable}"), parameters).scalar()
+                connection.exec_driver_sql(f"DROP TABLE temp.{matches}")
+        except exc.SQLAlchemyError as e:
+            print(f"Error classifying in the database: {e}")
+            return None
+
+        no_best_fit = total - matched
+        print('No best fit: ', no_best_fit)
+        return rows
+
+    @profiler.profiled('DataAnalyzer.test_data_set', rows=len)
+    def test_data_set(self, csv_path: str, interpolate: bool = False, batched: bool = True, chunksize: int = 100_000,
+                      workers: int = None):
         """
         Tests a dataset against the ideal curves.
 
         Args:
             csv_path (str): The path to the CSV file containing the dataset.
+            interpolate (bool, optional): Whether to interpolate the ideal curves for x values
+                that are not on the ideal grid. Defaults to False.
+            batched (bool, optional): Whether to classify whole chunks at once instead of
+                calling test_data_point for every row. Defaults to True.
+            chunksize (int, optional): The number of CSV rows per chunk in batched mode. Defaults to 100000.
+            workers (int, optional): The number of worker processes classifying shards of the file in
+                batched mode, see iter_test_data_set. Defaults to None.
 
         Returns:
             pd.DataFrame: The results of the test, including x, y, deviation, and ideal function.
@@ -182,9 +1274,33 @@ class DataAnalyzer(DataHandler):
         if self.best_fits is None:
             print('Find best fits first')
             return
-        if self.ideal_set is None:
+        if self.ideal_y is None:
             print('Load ideal set first')
             return
+
+        cache_key = self.results_cache_key(csv_path, interpolate) if batched else None
+        if cache_key is not None:
+            cached = self.result_cache.get_results(cache_key)
+            if cached is not None:
+                return cached
+
+        if batched:
+            frames = []
+            no_best_fit = 0
+            for frame in self.iter_test_data_set(csv_path, chunksize, interpolate, workers):
+                no_best_fit += frame.attrs['no_best_fit']
+                frames.append(frame)
+
+            print('No best fit: ', no_best_fit)
+
+            if frames:
+                df = pd.concat(frames, ignore_index=True)
+            else:
+                df = pd.DataFrame(columns=['x', 'y', 'delta_y', 'ideal_func'])
+            if cache_key is not None:
+                self.result_cache.put_results(cache_key, df)
+            return df
+
         # Initialize empty list to store results
         results = []
 
@@ -200,7 +1316,7 @@ class DataAnalyzer(DataHandler):
             y = chunk['y'].values[0]
             datapoint = np.array([x, y])
             # Call the function
-            result = self.test_data_point(datapoint)
+            result = self.test_data_point(datapoint, interpolate)
             if result is None:
                 no_best_fit.append([x, y, None, None])
             else:
@@ -210,3 +1326,85 @@ class DataAnalyzer(DataHandler):
 
         df = pd.DataFrame(results, columns=['x', 'y', 'delta_y', 'ideal_func'])
         return df
+
+    @profiler.profiled('DataAnalyzer.check_precision')
+    def check_precision(self, ideal_table: str = 'ideal', csv_path: str = None, interpolate: bool = False) -> Dict[str, Any]:
+        """
+        Compares the best fits and test results of the stored ideal set with float64 ones.
+
+        The float64 reference is read from the ideal table, only for the columns
+        held in memory. The best fits are always compared, so the training data and
+        the full ideal set must be loaded; the MSE matrix is computed if the best
+        fits came from the result cache. With csv_path the test points are also
+        classified against both. This is meant to validate the float32 storage
+        mode on a given dataset.
+
+        Args:
+            ideal_table (str, optional): The table holding the ideal data. Defaults to 'ideal'.
+            csv_path (str, optional): A test CSV file to classify with both precisions. Defaults to None.
+            interpolate (bool, optional): Whether to interpolate the ideal curves. Defaults to False.
+
+        Returns:
+            Dict[str, Any]: The largest value error, whether the fits and results agree and by
+                how much the MSE and delta_y differ, or None if the check could not run.
+        """
+        if self.best_fits is None:
+            print('Find best fits first')
+            return None
+        if self.ideal_fit_values is None:
+            self.build_ideal_index()
+        reference = self.read_table(ideal_table, ['x'] + self.ideal_columns, dtype='float64')
+        if len(reference) != len(self.ideal_row_x) or not np.array_equal(reference['x'].to_numpy(), self.ideal_row_x):
+            print(f'Table {ideal_table} does not hold the loaded ideal set')
+            return None
+        reference_y = reference[self.ideal_columns].to_numpy()
+        report: Dict[str, Any] = {
+            'dtype': str(self.dtype),
+            'max_value_error': float(np.abs(self.ideal_y.T - reference_y).max(initial=0.0)),
+        }
+
+        if self.train_set is None or not set(self.best_fits) <= set(self.ideal_columns):
+            print('Load the training data and the full ideal set to compare the fits')
+            return None
+        if self.mse_matrix is None or list(self.mse_matrix.columns) != self.ideal_columns:
+            if self.compute_mse_matrix() is None:
+                return None
+        train_y = self.train_set[list(self.mse_matrix.index)].to_numpy(dtype=np.float64)
+        rows, _ = self.align_training_data()
+        reference_fit_y = reference_y.T
+        if rows is not None:
+            # Compare against the float64 values at the same aligned rows
+            _, lower, upper, weight = IdealIndex.align(self.ideal_x, self.train_set['x'].to_numpy(dtype=np.float64),
+                                                       self.align_tolerance, self.align_interpolate)
+            train_y = train_y[rows]
+            reference_fit_y = self._aligned_ideal_y(lower, upper, weight, np.ascontiguousarray(reference_fit_y))
+        reference_sse, counts = MSECalculator.finite_sse(train_y, reference_fit_y.T, MSECalculator.best_fit_sse_matrix)
+        reference_pairs = self._select_fits(reference_sse, counts, list(self.mse_matrix.index), self.ideal_columns)
+        report['same_fits'] = [fit for _, fit in reference_pairs] == self.best_fits
+        report['float64_fits'] = [fit for _, fit in reference_pairs]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            reference_mse = reference_sse / counts[:, None]
+        errors = [
+            abs(float(self.mse_matrix.at[column, fit]) - reference_mse[row, self.ideal_column_index[fit]])
+            for row, column in enumerate(self.mse_matrix.index) for train_column, fit in reference_pairs
+            if train_column == column
+        ]
+        report['max_mse_error'] = float(max(errors, default=0.0))
+
+        if csv_path is not None:
+            points = pd.read_csv(csv_path, usecols=['x', 'y'], dtype='float64')
+            x, y = points['x'].to_numpy(), points['y'].to_numpy()
+            self._sort_ideal_x()
+            fits = self._resolve_fits()
+            reference_values = reference_y[:, fits][self.ideal_order]
+            stored = IdealIndex.match(self.ideal_x, self.ideal_fit_values, x, y, interpolate)
+            expected = IdealIndex.match(self.ideal_x, reference_values, x, y, interpolate)
+            same = len(stored[0]) == len(expected[0]) and all(np.array_equal(a, b) for a, b in zip(stored[:2], expected[:2]))
+            report['points'] = len(x)
+            report['same_results'] = same
+            report['matches'] = len(stored[0])
+            report['float64_matches'] = len(expected[0])
+            report['max_delta_y_error'] = float(np.abs(stored[2] - expected[2]).max(initial=0.0)) if same else None
+
+        print('Precision check: ', report)
+        return report
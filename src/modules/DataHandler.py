@@ -1,14 +1,77 @@
-from typing import Dict, Any, List, TypedDict
+from typing import Callable, Dict, Any, Iterable, Iterator, List, TypedDict
+import hashlib
+import io
+import numpy as np
 import pandas as pd
-from sqlalchemy import inspect, Column, MetaData, Table,  exc
+from sqlalchemy import inspect, Column, Float, Integer, MetaData, Table, Text, delete, exc, select
+from sqlalchemy.engine import Connection
 import os
+import queue
+import threading
+import time
 
 from modules.DatabaseConnection import DatabaseConnection
+from modules.Profiler import profiler
 
 class ColumnDefinition(TypedDict):
     name: str
     type_: Any
 
+class IngestStats(TypedDict):
+    rows: int
+    seconds: float
+    rows_per_sec: float
+
+class IngestResult(IngestStats):
+    mode: str
+    total_rows: int
+
+
+# Ingest manifest, kept in the same database as the data tables: one row per
+# (file, table) with the state of the file when it was last ingested
+manifest_metadata = MetaData()
+
+ingest_manifest = Table(
+    'ingest_manifest',
+    manifest_metadata,
+    Column('path', Text, primary_key=True),
+    Column('table_name', Text, primary_key=True),
+    Column('size', Integer, nullable=False),
+    Column('mtime_ns', Integer, nullable=False),
+    Column('digest', Text, nullable=False),
+    Column('byte_offset', Integer, nullable=False),
+    Column('rows', Integer, nullable=False),
+    Column('ingested', Float, nullable=False),
+)
+
+
+class _FileRange(io.RawIOBase):
+    """
+    Reads the bytes [start, end) of a file and adds them to a digest on the way.
+
+    Bounding the read keeps rows appended while an ingest runs for the next one.
+    """
+
+    def __init__(self, path: str, start: int, end: int, digest) -> None:
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+        self._digest = digest
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._file.read(min(len(buffer), self._remaining))
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        self._digest.update(data)
+        return len(data)
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
 class DataHandler:
     """
     A class that handles data operations with a database.
@@ -19,15 +82,22 @@ class DataHandler:
     Attributes:
         engine: The database engine.
         metadata: The metadata object for the database.
+        write_lock: Serializes writes from concurrent threads, since SQLite allows a single writer.
 
     Methods:
         create_table: Creates a table in the database.
         load_csv_to_db: Loads data from a CSV file into a database table.
+        read_csv_chunks: Reads a CSV file chunk by chunk.
+        bulk_insert: Inserts chunks of rows into an existing database table.
+        ingest_csv: Loads only what changed in a CSV file since its last ingest.
         get_data_from_db: Retrieves data from the database using a query.
+        read_table: Reads selected columns of a table with explicit dtypes, optionally in chunks.
         replace_data_in_table: Replaces data in a database table.
 
     """
 
+    __slots__ = ('engine', 'metadata', 'write_lock')
+
     def __init__(self, db_connection: DatabaseConnection) -> None:
         """
         Initializes a new instance of the DataHandler class.
@@ -39,7 +109,9 @@ class DataHandler:
         self.engine = db_connection.engine
         self.metadata = MetaData()
         self.metadata.bind = self.engine
+        self.write_lock = threading.RLock()
 
+    @profiler.profiled('DataHandler.create_table')
     def create_table(self, table_name: str, columns: Dict[str, Any], recreate: bool = False) -> None:
         """
         Creates a table in the database.
@@ -69,38 +141,392 @@ class DataHandler:
         except exc.SQLAlchemyError as e:
             print(f"Error creating table {table_name}: {e}")
 
-    def load_csv_to_db(self, csv_path: str, table_name: str) -> None:
+    @profiler.profiled('DataHandler.load_csv_to_db')
+    def load_csv_to_db(self, csv_path: str, table_name: str, bulk: bool = False, chunksize: int = 100_000) -> IngestStats | None:
         """
         Loads data from a CSV file into a database table.
 
         Args:
             csv_path (str): The path to the CSV file.
             table_name (str): The name of the table.
+            bulk (bool, optional): Whether to stream the CSV in chunks into the existing typed
+                table (see bulk_load_csv) instead of replacing the table with pandas. Defaults to False.
+            chunksize (int, optional): The number of CSV rows per chunk in bulk mode. Defaults to 100000.
+
+        Returns:
+            IngestStats | None: The row count and throughput in bulk mode, otherwise None.
 
         """
+        if bulk:
+            return self.bulk_load_csv(csv_path, table_name, chunksize)
         try:
             df = pd.read_csv(csv_path)
             df.to_sql(table_name, self.engine, if_exists='replace', index=False)
         except Exception as e:
             print(f"Error loading CSV to DB: {e}")
 
-    def get_data_from_db(self, query: str) -> pd.DataFrame:
+    @profiler.profiled('DataHandler.bulk_load_csv', rows=lambda stats: stats['rows'])
+    def bulk_load_csv(self, csv_path: str, table_name: str, chunksize: int = 100_000) -> IngestStats | None:
+        """
+        Streams a CSV file in chunks into an existing database table.
+
+        Args:
+            csv_path (str): The path to the CSV file.
+            table_name (str): The name of the existing table.
+            chunksize (int, optional): The number of CSV rows per chunk. Defaults to 100000.
+
+        Returns:
+            IngestStats | None: The number of rows inserted, the elapsed time and the rows per second,
+                or None if the load failed.
+
+        """
+        return self.bulk_insert(table_name, self.read_csv_chunks(csv_path, chunksize))
+
+    def read_csv_chunks(self, csv_path: str, chunksize: int = 100_000) -> Iterator[pd.DataFrame]:
+        """
+        Reads a CSV file chunk by chunk.
+
+        The file is only opened once the first chunk is requested, so errors are
+        raised where the chunks are consumed.
+
+        Args:
+            csv_path (str): The path to the CSV file.
+            chunksize (int, optional): The number of CSV rows per chunk. Defaults to 100000.
+
+        Yields:
+            pd.DataFrame: The chunks of the CSV file.
+        """
+        yield from profiler.iterate('DataHandler.read_csv_chunk', pd.read_csv(csv_path, chunksize=chunksize), rows=len)
+
+    @profiler.profiled('DataHandler.bulk_insert', rows=lambda stats: stats['rows'] if stats else 0)
+    def bulk_insert(self, table_name: str, chunks: Iterable[pd.DataFrame],
+                    before_commit: Callable[[Connection, int], None] = None) -> IngestStats | None:
+        """
+        Inserts chunks of rows into an existing database table.
+
+        Chunks are read and converted to records on a producer thread, which stays
+        at most two chunks ahead, while this thread inserts each one with a single
+        executemany call straight into the table. The write lock is taken once the
+        first chunk is parsed and all chunks are inserted in one transaction, so the
+        typed schema created by create_table is kept and, if any chunk fails,
+        nothing is written.
+
+        Args:
+            table_name (str): The name of the existing table.
+            chunks (Iterable[pd.DataFrame]): The rows to insert, e.g. from read_csv_chunks.
+            before_commit (Callable[[Connection, int], None], optional): Called with the connection
+                and the number of inserted rows before the transaction commits, to record
+                bookkeeping atomically with the rows. Defaults to None.
+
+        Returns:
+            IngestStats | None: The number of rows inserted, the elapsed time and the rows per second,
+                or None if the load failed.
+
+        """
+        try:
+            table = Table(table_name, MetaData(), autoload_with=self.engine)
+        except exc.NoSuchTableError:
+            print(f"Error loading CSV to DB: table {table_name} does not exist")
+            return None
+
+        preparer = self.engine.dialect.identifier_preparer
+        start = time.perf_counter()
+        rows = 0
+        ready = queue.Queue(maxsize=2)
+        stop = threading.Event()
+
+        def produce():
+            # Each item is (columns, records), an exception to re-raise, or None at the end
+            try:
+                for chunk in chunks:
+                    records = chunk.to_numpy(dtype=object)
+                    # Missing values become NULL instead of NaN
+                    records[pd.isna(records)] = None
+                    item = (list(chunk.columns), list(map(tuple, records.tolist())))
+                    while not stop.is_set():
+                        try:
+                            ready.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop.is_set():
+                        return
+                item = None
+            except Exception as e:
+                item = e
+            while not stop.is_set():
+                try:
+                    ready.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        producer = threading.Thread(target=produce, name=f'bulk_insert-{table_name}', daemon=True)
+        producer.start()
+        try:
+            # Parse the first chunk before taking the lock, so other writers are not held up by it
+            item = ready.get()
+            with self.write_lock, self.engine.begin() as connection:
+                columns = None
+                while item is not None:
+                    if isinstance(item, Exception):
+                        raise item
+                    chunk_columns, records = item
+                    if columns is None:
+                        unknown = [column for column in chunk_columns if column not in table.columns]
+                        if unknown:
+                            raise ValueError(f"columns {unknown} do not exist in table {table_name}")
+                        columns = chunk_columns
+                        column_list = ', '.join(preparer.quote(column) for column in columns)
+                        placeholders = ', '.join('?' for _ in columns)
+                        statement = f"INSERT INTO {preparer.quote(table_name)} ({column_list}) VALUES ({placeholders})"
+                    if records:
+                        connection.exec_driver_sql(statement, records)
+                        rows += len(records)
+                    item = ready.get()
+                if before_commit is not None:
+                    before_commit(connection, rows)
+        except Exception as e:
+            print(f"Error loading CSV to DB: {e}")
+            return None
+        finally:
+            stop.set()
+            producer.join()
+
+        seconds = time.perf_counter() - start
+        rows_per_sec = rows / seconds if seconds > 0 else float('inf')
+        print(f"Loaded {rows} rows into {table_name} in {seconds:.3f}s ({rows_per_sec:,.0f} rows/s)")
+        return IngestStats(rows=rows, seconds=seconds, rows_per_sec=rows_per_sec)
+
+    @profiler.profiled('DataHandler.ingest_csv', rows=lambda result: result['rows'] if result else 0)
+    def ingest_csv(self, csv_path: str, table_name: str, columns: Dict[str, Any], chunksize: int = 100_000,
+                   full: bool = False) -> IngestResult | None:
+        """
+        Brings a table up to date with a CSV file, loading only what changed since the last ingest.
+
+        The ingest manifest records the size, modification time and SHA-256 digest
+        of the file at its last ingest, with the byte offset and row count ingested.
+        A file with the same size and modification time is skipped without reading
+        it. A file that grew and still starts with the ingested bytes is treated
+        as appended: only its tail is parsed and inserted. Any other change (or
+        full=True) recreates the table and loads the whole file. The rows and the
+        manifest entry are written in one transaction.
+
+        Args:
+            csv_path (str): The path to the CSV file.
+            table_name (str): The name of the table.
+            columns (Dict[str, Any]): The column names and types, for creating the table.
+            chunksize (int, optional): The number of CSV rows per chunk. Defaults to 100000.
+            full (bool, optional): Whether to reload the whole file regardless of the manifest.
+                Defaults to False.
+
+        Returns:
+            IngestResult | None: The rows inserted by this call, the elapsed time, the rows per second,
+                the mode ('skipped', 'appended' or 'full') and the total rows from the file,
+                or None if the ingest failed.
+
+        """
+        path = os.path.abspath(csv_path)
+        try:
+            stat = os.stat(path)
+            manifest_metadata.create_all(self.engine)
+            key = (ingest_manifest.c.path == path) & (ingest_manifest.c.table_name == table_name)
+            with self.engine.connect() as connection:
+                entry = connection.execute(select(ingest_manifest).where(key)).first()
+        except (OSError, exc.SQLAlchemyError) as e:
+            print(f"Error loading CSV to DB: {e}")
+            return None
+        if full or not inspect(self.engine).has_table(table_name):
+            entry = None
+
+        start = time.perf_counter()
+        mode = 'full'
+        digest = hashlib.sha256()
+        if entry is not None and (stat.st_size, stat.st_mtime_ns) == (entry.size, entry.mtime_ns):
+            mode = 'skipped'
+        elif entry is not None and stat.st_size >= entry.byte_offset:
+            # Appended rows leave the ingested bytes, which end with a line break, untouched
+            with open(path, 'rb') as file:
+                for block in iter(lambda: file.read(min(1 << 20, entry.byte_offset - file.tell())), b''):
+                    digest.update(block)
+                file.seek(max(entry.byte_offset - 1, 0))
+                line_end = entry.byte_offset == 0 or file.read(1) == b'\n'
+            if digest.hexdigest() == entry.digest and line_end:
+                mode = 'skipped' if stat.st_size == entry.byte_offset else 'appended'
+            else:
+                digest = hashlib.sha256()
+
+        def record(connection: Connection, rows: int) -> None:
+            connection.execute(delete(ingest_manifest).where(key))
+            connection.execute(ingest_manifest.insert(), {
+                'path': path,
+                'table_name': table_name,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'digest': digest.hexdigest(),
+                'byte_offset': stat.st_size,
+                'rows': rows,
+                'ingested': time.time(),
+            })
+
+        if mode == 'skipped':
+            if (stat.st_size, stat.st_mtime_ns) != (entry.size, entry.mtime_ns):
+                # Touched but unchanged: remember the new modification time
+                with self.write_lock, self.engine.begin() as connection:
+                    record(connection, entry.rows)
+            print(f"Skipped {csv_path}: unchanged since it was ingested into {table_name}")
+            return IngestResult(rows=0, seconds=time.perf_counter() - start, rows_per_sec=0.0, mode=mode,
+                                total_rows=entry.rows)
+
+        if mode == 'appended':
+            with open(path, 'r', encoding='utf-8', newline='') as file:
+                names = pd.read_csv(file, nrows=0).columns.tolist()
+            chunks = self._read_range_chunks(path, entry.byte_offset, stat.st_size, digest, chunksize, names)
+            previous_rows = entry.rows
+        else:
+            # Forget the file first, so an interrupted reload is never taken for an up to date table
+            with self.write_lock, self.engine.begin() as connection:
+                connection.execute(delete(ingest_manifest).where(key))
+            self.create_table(table_name, columns, True)
+            chunks = self._read_range_chunks(path, 0, stat.st_size, digest, chunksize)
+            previous_rows = 0
+
+        stats = self.bulk_insert(table_name, chunks, lambda connection, rows: record(connection, previous_rows + rows))
+        if stats is None:
+            return None
+        return IngestResult(**stats, mode=mode, total_rows=previous_rows + stats['rows'])
+
+    @staticmethod
+    def _read_range_chunks(path: str, start: int, end: int, digest, chunksize: int,
+                           names: List[str] = None) -> Iterator[pd.DataFrame]:
+        """
+        Reads the CSV rows in the bytes [start, end) of a file chunk by chunk, adding the bytes to digest.
+
+        Args:
+            path (str): The path to the CSV file.
+            start (int): The first byte; 0 reads the header from the file.
+            end (int): The byte after the last one.
+            digest: The hashlib object the bytes are added to.
+            chunksize (int): The number of CSV rows per chunk.
+            names (List[str], optional): The column names for a range without header. Defaults to None.
+
+        Yields:
+            pd.DataFrame: The chunks.
+        """
+        with io.BufferedReader(_FileRange(path, start, end, digest), 1 << 20) as file:
+            header = 'infer' if names is None else None
+            try:
+                chunks = pd.read_csv(file, chunksize=chunksize, header=header, names=names)
+                yield from profiler.iterate('DataHandler.read_csv_chunk', chunks, rows=len)
+            except pd.errors.EmptyDataError:
+                # Only blank lines were appended
+                return
+
+    @profiler.profiled('DataHandler.get_data_from_db', rows=len)
+    def get_data_from_db(self, query: str, dtype: Any = None, chunksize: int = None) -> pd.DataFrame | Iterator[pd.DataFrame]:
         """
         Retrieves data from the database using a query.
 
         Args:
             query (str): The SQL query.
+            dtype (Any, optional): The dtype of all columns, or a dict of dtypes by column,
+                e.g. 'float32'. Defaults to None, which lets pandas infer the dtypes.
+            chunksize (int, optional): If given, an iterator over DataFrames of this many rows
+                is returned instead of one DataFrame. Defaults to None.
 
         Returns:
-            pd.DataFrame: The retrieved data as a pandas DataFrame.
+            pd.DataFrame | Iterator[pd.DataFrame]: The retrieved data as a pandas DataFrame, or its chunks.
 
         """
+        if chunksize is not None:
+            return self._read_chunks(query, dtype, chunksize)
         try:
-            return pd.read_sql_query(query, self.engine)
+            return pd.read_sql_query(query, self.engine, dtype=dtype)
         except exc.SQLAlchemyError as e:
             print(f"Error executing query: {e}")
             return pd.DataFrame()
 
+    def _read_chunks(self, query: str, dtype: Any, chunksize: int) -> Iterator[pd.DataFrame]:
+        try:
+            with self.engine.connect() as connection:
+                chunks = pd.read_sql_query(query, connection, dtype=dtype, chunksize=chunksize)
+                yield from profiler.iterate('DataHandler.read_chunk', chunks, rows=len)
+        except exc.SQLAlchemyError as e:
+            print(f"Error executing query: {e}")
+
+    def read_table(self, table_name: str, columns: List[str] = None, dtype: Any = None,
+                   chunksize: int = None) -> pd.DataFrame | Iterator[pd.DataFrame]:
+        """
+        Reads selected columns of a table.
+
+        Only the requested columns are fetched from SQLite. If dtype is a single
+        numeric dtype, the rows are converted straight into one NumPy block per
+        chunk, which skips pandas' per-column type inference and the intermediate
+        object columns, so e.g. float32 reads need a quarter of the memory of a
+        SELECT * that is inferred as float64.
+
+        Args:
+            table_name (str): The name of the table.
+            columns (List[str], optional): The columns to read, in this order. Defaults to all columns.
+            dtype (Any, optional): The dtype of all columns, or a dict of dtypes by column.
+                Defaults to None, which lets pandas infer the dtypes.
+            chunksize (int, optional): If given, an iterator over DataFrames of this many rows
+                is returned instead of one DataFrame. Defaults to None.
+
+        Returns:
+            pd.DataFrame | Iterator[pd.DataFrame]: The data, or its chunks. An empty DataFrame
+                (or iterator) if the table or a column does not exist.
+
+        """
+        preparer = self.engine.dialect.identifier_preparer
+        try:
+            # Only the column names are needed; reflecting wide tables is comparatively slow
+            with self.engine.connect() as connection:
+                table_columns = list(connection.exec_driver_sql(f"SELECT * FROM {preparer.quote(table_name)} LIMIT 0").keys())
+        except exc.SQLAlchemyError as e:
+            print(f"Error reading table {table_name}: {e}")
+            return iter(()) if chunksize is not None else pd.DataFrame()
+
+        columns = list(columns) if columns is not None else table_columns
+        unknown = [column for column in columns if column not in table_columns]
+        if unknown:
+            print(f"Error reading table {table_name}: columns {unknown} do not exist")
+            return iter(()) if chunksize is not None else pd.DataFrame()
+        column_list = ', '.join(preparer.quote(column) for column in columns)
+        query = f"SELECT {column_list} FROM {preparer.quote(table_name)}"
+
+        if dtype is None or isinstance(dtype, dict) or not np.issubdtype(np.dtype(dtype), np.number):
+            return self.get_data_from_db(query, dtype, chunksize)
+
+        if chunksize is not None:
+            return self._read_blocks(query, columns, np.dtype(dtype), chunksize)
+        # Fetch about a million values at a time, so the Python row tuples stay small
+        blocks = self._read_blocks(query, columns, np.dtype(dtype), max(1, 1_000_000 // max(len(columns), 1)))
+        with profiler.stage('DataHandler.read_table') as add_rows:
+            frames = list(blocks)
+            data = pd.concat(frames, ignore_index=True) if len(frames) > 1 else (
+                frames[0] if frames else pd.DataFrame(np.empty((0, len(columns)), dtype=dtype), columns=columns)
+            )
+            add_rows(len(data))
+        return data
+
+    def _read_blocks(self, query: str, columns: List[str], dtype: np.dtype, chunksize: int) -> Iterator[pd.DataFrame]:
+        try:
+            with self.engine.connect() as connection:
+                # Plain DBAPI tuples convert to NumPy much faster than Row objects
+                cursor = connection.exec_driver_sql(query).cursor
+                while True:
+                    with profiler.stage('DataHandler.read_block') as add_rows:
+                        rows = cursor.fetchmany(chunksize)
+                        if not rows:
+                            break
+                        # NULL becomes NaN for float dtypes
+                        block = np.array(rows, dtype=dtype)
+                        add_rows(len(block))
+                    yield pd.DataFrame(block, columns=columns, copy=False)
+        except (exc.SQLAlchemyError, TypeError, ValueError) as e:
+            print(f"Error executing query: {e}")
+
     def replace_data_in_table(self, table_name: str, data: pd.DataFrame) -> None:
         """
         Replaces data in a database table.
@@ -111,6 +537,8 @@ class DataHandler:
 
         """
         try:
-            data.to_sql(table_name, self.engine, if_exists='replace', index=False)
+            with profiler.stage('DataHandler.replace_data_in_table') as add_rows, self.write_lock:
+                data.to_sql(table_name, self.engine, if_exists='replace', index=False)
+                add_rows(len(data))
         except exc.SQLAlchemyError as e:
             print(f"Error replacing data in table {table_name}: {e}")
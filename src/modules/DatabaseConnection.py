@@ -1,42 +1,144 @@
 import os
-from sqlalchemy import create_engine
+from typing import Any, Dict
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine.base import Engine
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from modules.Profiler import profiler
+
+# Named engine profiles. Each profile lists the PRAGMAs applied to every new
+# SQLite connection and whether the database lives in memory instead of a file.
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # Plain SQLite defaults
+    'default': {
+        'pragmas': {},
+    },
+    # Large ingests: no fsync, big page cache, temporary b-trees in memory.
+    # A crash during a load can corrupt the file, which is acceptable for data
+    # that is recreated from the CSV files anyway.
+    'bulk_load': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'OFF',
+            'cache_size': -512 * 1024,  # negative values are KiB, i.e. 512 MiB
+            'mmap_size': 1024 ** 3,
+            'temp_store': 'MEMORY',
+        },
+    },
+    # Many concurrent readers: WAL so readers never block on the writer
+    'read_heavy': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'cache_size': -128 * 1024,
+            'mmap_size': 1024 ** 3,
+            'temp_store': 'MEMORY',
+        },
+    },
+    # Throwaway database for tests and one-off runs; nothing touches the disk
+    'memory': {
+        'pragmas': {
+            'temp_store': 'MEMORY',
+        },
+        'in_memory': True,
+    },
+}
 
 class DatabaseConnection:
     """
     A class to manage database connections using SQLAlchemy.
-    
+
     This class encapsulates the logic required to create and manage a SQLite
     database engine. It ensures that the database file is located within a
     'runtime' directory. If the directory does not exist, it is created.
-    
+
+    The engine is tuned through a named profile (see PROFILES) whose PRAGMAs
+    are applied by a connect-event hook to every connection the pool opens.
+    File databases use a QueuePool, so readers in one process reuse open
+    connections instead of reopening the file. The 'memory' profile keeps a
+    single shared in-memory connection.
+
     Attributes:
         db_filename (str): The name of the database file.
+        profile (str): The name of the engine profile.
+        pool_size (int): The number of connections kept open by the pool.
+        max_overflow (int): The number of extra connections allowed when the pool is exhausted.
         engine (Engine): The SQLAlchemy engine instance for database operations.
     """
-    
-    def __init__(self, db_filename: str = 'database.db'):
+
+    def __init__(self, db_filename: str = 'database.db', profile: str = 'default', pool_size: int = 5, max_overflow: int = 10):
         """
         Initializes the DatabaseConnection instance with a specific database file name.
-        
+
         Parameters:
             db_filename (str): The name of the database file to be used or created
                                within the 'runtime' directory. Defaults to 'database.db'.
+            profile (str): The engine profile, one of 'default', 'bulk_load', 'read_heavy'
+                           or 'memory'. Defaults to 'default'.
+            pool_size (int): The number of connections kept open by the pool. Defaults to 5.
+            max_overflow (int): The number of extra connections allowed when the pool is
+                                exhausted. Defaults to 10.
         """
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown engine profile {profile}, expected one of {', '.join(PROFILES)}")
         self.db_filename = db_filename
+        self.profile = profile
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
         self.engine = self.create_engine()
 
     def create_engine(self) -> Engine:
         """
         Creates and returns a SQLAlchemy engine instance for the SQLite database.
-        
+
         This method checks if a 'runtime' directory exists, and if not, it creates it.
         Then, it initializes a SQLAlchemy engine with the SQLite database located
-        within this directory.
-        
+        within this directory and registers the PRAGMAs of the selected profile.
+
         Returns:
             Engine: A SQLAlchemy engine connected to the specified SQLite database.
         """
-        if not os.path.exists('runtime'):
-            os.makedirs('runtime')
-        return create_engine(f"sqlite:///runtime/{self.db_filename}")
+        settings = PROFILES[self.profile]
+        if settings.get('in_memory'):
+            # Every checkout must see the same in-memory database
+            engine = create_engine(
+                'sqlite://',
+                poolclass=StaticPool,
+                connect_args={'check_same_thread': False},
+            )
+        else:
+            if not os.path.exists('runtime'):
+                os.makedirs('runtime')
+            engine = create_engine(
+                f"sqlite:///runtime/{self.db_filename}",
+                poolclass=QueuePool,
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                connect_args={'check_same_thread': False},
+            )
+
+        pragmas = settings['pragmas']
+        if pragmas:
+            event.listen(engine, 'connect', self._pragma_hook(pragmas))
+        profiler.instrument_engine(engine)
+        return engine
+
+    @staticmethod
+    def _pragma_hook(pragmas: Dict[str, Any]):
+        """
+        Builds a connect-event listener that applies the given PRAGMAs.
+
+        Parameters:
+            pragmas (Dict[str, Any]): The PRAGMA names and values.
+
+        Returns:
+            Callable: The listener for the engine's 'connect' event.
+        """
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for name, value in pragmas.items():
+                    cursor.execute(f"PRAGMA {name}={value}")
+            finally:
+                cursor.close()
+        return apply_pragmas
@@ -0,0 +1,128 @@
+import json
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+class IdealCache:
+    """
+    A class to manage an on-disk columnar cache of the ideal function set.
+
+    The ideal set is stored as one contiguous float64 array of shape
+    (columns, rows) in NumPy's .npy format, so every function is a contiguous
+    run of values on disk. Loading memory-maps that file read-only, which means
+    no parsing on cold start and that several processes reading the same cache
+    share the operating system's page cache instead of each holding a copy.
+
+    Attributes:
+        directory (str): The directory holding the cache files.
+    """
+
+    VALUES_FILE = 'values.npy'
+    META_FILE = 'meta.json'
+
+    def __init__(self, directory: str = os.path.join('runtime', 'ideal_cache')):
+        """
+        Initializes the IdealCache instance with a cache directory.
+
+        Parameters:
+            directory (str): The directory holding the cache files. Defaults to
+                             'runtime/ideal_cache', next to the database file.
+        """
+        self.directory = directory
+
+    @property
+    def values_path(self) -> str:
+        return os.path.join(self.directory, self.VALUES_FILE)
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, self.META_FILE)
+
+    @staticmethod
+    def source_signature(source_path: str) -> Dict[str, Any]:
+        """
+        Describes a source file by path, size and modification time.
+
+        Parameters:
+            source_path (str): The path of the file the cache was built from.
+
+        Returns:
+            Dict[str, Any]: The signature stored alongside the cache.
+        """
+        stat = os.stat(source_path)
+        return {'path': os.path.abspath(source_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def read_meta(self) -> Dict[str, Any] | None:
+        """
+        Reads the cache metadata.
+
+        Returns:
+            Dict[str, Any] | None: The metadata, or None if there is no cache.
+        """
+        if not os.path.exists(self.meta_path) or not os.path.exists(self.values_path):
+            return None
+        with open(self.meta_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def is_valid(self, source_path: str | None = None) -> bool:
+        """
+        Checks whether the cache exists and, optionally, was built from the given file.
+
+        Parameters:
+            source_path (str | None): The source file the cache must match. Defaults to None,
+                                      in which case any existing cache is valid.
+
+        Returns:
+            bool: True if the cache can be loaded.
+        """
+        meta = self.read_meta()
+        if meta is None:
+            return False
+        if source_path is None:
+            return True
+        if not os.path.exists(source_path):
+            return False
+        return meta.get('source') == self.source_signature(source_path)
+
+    def write(self, data: pd.DataFrame, source_path: str | None = None) -> None:
+        """
+        Writes the ideal set to the cache.
+
+        The files are written under temporary names and moved into place, so
+        readers never see a partially written cache.
+
+        Parameters:
+            data (pd.DataFrame): The ideal set, including the x column.
+            source_path (str | None): The file the ideal set was read from, used to
+                                      detect stale caches. Defaults to None.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        columns: List[str] = [str(column) for column in data.columns]
+        values = np.ascontiguousarray(data.to_numpy(dtype=np.float64).T)
+
+        meta = {
+            'columns': columns,
+            'rows': int(values.shape[1]),
+            'source': self.source_signature(source_path) if source_path else None,
+        }
+
+        tmp_values = self.values_path + '.tmp'
+        with open(tmp_values, 'wb') as file:
+            np.save(file, values)
+        tmp_meta = self.meta_path + '.tmp'
+        with open(tmp_meta, 'w', encoding='utf-8') as file:
+            json.dump(meta, file)
+        os.replace(tmp_values, self.values_path)
+        os.replace(tmp_meta, self.meta_path)
+
+    def load_array(self) -> np.ndarray:
+        """
+        Memory-maps the cached values read-only.
+
+        Returns:
+            np.ndarray: The memory-mapped array of shape (columns, rows).
+        """
+        return np.load(self.values_path, mmap_mode='r')
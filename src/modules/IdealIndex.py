@@ -0,0 +1,176 @@
+import math
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class IdealIndex:
+    """
+    A class with the lookup and classification kernels on a sorted ideal grid.
+
+    The kernels only take plain arrays: the sorted ideal x values and the best
+    fit columns gathered in the same order. That keeps them usable both from
+    DataAnalyzer and from worker processes that attach to shared copies of the
+    arrays instead of a whole DataAnalyzer.
+
+    Methods:
+        lookup(ideal_x, values, x, interpolate): Looks up the best fit values at the given x values.
+        classify(ideal_x, values, best_fits, x, y, interpolate): Tests a batch of data points.
+        match(ideal_x, values, x, y, interpolate): Returns the suitable fits of a batch as plain arrays.
+        align(ideal_x, x, tolerance, interpolate): Pairs x values with ideal rows for fitting.
+    """
+
+    # Criteria for deviation
+    MAX_DEVIATION = math.sqrt(2)
+
+    @staticmethod
+    def lookup(ideal_x: np.ndarray, values: np.ndarray, x, interpolate: bool = False) -> np.ndarray:
+        """
+        Looks up the values of the best fit columns at the given x values.
+
+        Args:
+            ideal_x (np.ndarray): The sorted ideal x values.
+            values (np.ndarray): The best fit columns in ideal_x order, shape (len(ideal_x), fits).
+            x: A single x value or an array of x values.
+            interpolate (bool, optional): Whether to linearly interpolate between the
+                neighbouring ideal rows for x values that are not on the ideal grid.
+                Defaults to False.
+
+        Returns:
+            np.ndarray: Array of shape (len(x), fits). Rows for x values that are not
+                on the grid (or outside of it when interpolating) are NaN.
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        result = np.full((len(x), values.shape[1]), np.nan)
+        if len(ideal_x) == 0:
+            return result
+
+        right = np.searchsorted(ideal_x, x, side='left')
+        clipped = np.minimum(right, len(ideal_x) - 1)
+        exact = ideal_x[clipped] == x
+        result[exact] = values[clipped[exact]]
+
+        if interpolate:
+            inside = ~exact & (right > 0) & (right < len(ideal_x))
+            upper = right[inside]
+            lower = upper - 1
+            weight = ((x[inside] - ideal_x[lower]) / (ideal_x[upper] - ideal_x[lower]))[:, None]
+            result[inside] = values[lower] + weight * (values[upper] - values[lower])
+
+        return result
+
+    @staticmethod
+    def classify(ideal_x: np.ndarray, values: np.ndarray, best_fits: List[str], x: np.ndarray, y: np.ndarray,
+                 interpolate: bool = False) -> pd.DataFrame:
+        """
+        Tests a batch of data points against the best fit curves in one array operation.
+
+        Args:
+            ideal_x (np.ndarray): The sorted ideal x values.
+            values (np.ndarray): The best fit columns in ideal_x order.
+            best_fits (List[str]): The names of the best fit columns.
+            x (np.ndarray): The x values of the data points.
+            y (np.ndarray): The y values of the data points.
+            interpolate (bool, optional): Whether to interpolate the ideal curves for x values
+                that are not on the ideal grid. Defaults to False.
+
+        Returns:
+            pd.DataFrame: The matching rows with x, y, deviation and ideal function, in input
+                order and, per point, in best fit order. The number of points without any
+                match is stored in the frame's attrs under 'no_best_fit'.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        rows, fits, deviation = IdealIndex.match(ideal_x, values, x, y, interpolate)
+
+        df = pd.DataFrame({
+            'x': x[rows],
+            'y': y[rows],
+            'delta_y': deviation,
+            'ideal_func': np.asarray(best_fits, dtype=object)[fits],
+        })
+        df.attrs['no_best_fit'] = int(len(x) - len(np.unique(rows)))
+        return df
+
+    @staticmethod
+    def match(ideal_x: np.ndarray, values: np.ndarray, x: np.ndarray, y: np.ndarray,
+              interpolate: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Finds the suitable best fits of a batch of data points, without building a DataFrame.
+
+        Args:
+            ideal_x (np.ndarray): The sorted ideal x values.
+            values (np.ndarray): The best fit columns in ideal_x order.
+            x (np.ndarray): The x values of the data points.
+            y (np.ndarray): The y values of the data points.
+            interpolate (bool, optional): Whether to interpolate the ideal curves for x values
+                that are not on the ideal grid. Defaults to False.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: The point index, best fit column and
+                deviation of every match, ordered by point and then by best fit.
+        """
+        y = np.asarray(y, dtype=np.float64)
+        ideal_values = IdealIndex.lookup(ideal_x, values, x, interpolate)
+        deviation = np.abs(y[:, None] - ideal_values)
+        # NaN (no ideal value at this x) compares False and is therefore never suitable
+        rows, fits = np.nonzero(deviation <= IdealIndex.MAX_DEVIATION)
+        return rows, fits, deviation[rows, fits]
+
+    @staticmethod
+    def align(ideal_x: np.ndarray, x: np.ndarray, tolerance: float = 0.0,
+              interpolate: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Pairs x values with the rows of a sorted ideal grid, as a sorted merge.
+
+        An x value is paired with the nearest ideal row if they are at most
+        tolerance apart. Otherwise, when interpolating, it is paired with the two
+        neighbouring ideal rows and the weight of the upper one. Values that are
+        off the grid (or outside of it when interpolating) are dropped. The x
+        values are sorted once and merged with the grid in one searchsorted pass,
+        so the cost is O(n log n) and independent of the number of ideal functions.
+
+        Args:
+            ideal_x (np.ndarray): The sorted ideal x values.
+            x (np.ndarray): The x values to align, in any order.
+            tolerance (float, optional): The largest x distance that still counts as the same
+                grid point. Defaults to 0, which only pairs equal values.
+            interpolate (bool, optional): Whether to interpolate between the neighbouring ideal
+                rows for x values that are not on the grid. Defaults to False.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The positions of the aligned
+                x values in ascending order, the lower and upper positions in ideal_x and the
+                weight of the upper one, which is 0 for values on the grid.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        empty = np.empty(0, dtype=np.int64)
+        if len(ideal_x) == 0 or len(x) == 0:
+            return empty, empty, empty, np.empty(0)
+
+        order = np.argsort(x, kind='stable')
+        sorted_x = x[order]
+        right = np.searchsorted(ideal_x, sorted_x, side='left')
+        upper = np.minimum(right, len(ideal_x) - 1)
+        lower = np.maximum(right - 1, 0)
+        # The nearest grid point is either the first one >= x or the one before it
+        nearest = np.where(np.abs(ideal_x[lower] - sorted_x) < np.abs(ideal_x[upper] - sorted_x), lower, upper)
+        on_grid = np.abs(ideal_x[nearest] - sorted_x) <= tolerance
+
+        lower = np.where(on_grid, nearest, lower)
+        upper = np.where(on_grid, nearest, upper)
+        weight = np.zeros(len(sorted_x))
+        keep = on_grid
+        if interpolate:
+            between = ~on_grid & (right > 0) & (right < len(ideal_x))
+            weight[between] = (sorted_x[between] - ideal_x[lower[between]]) / (ideal_x[upper[between]] - ideal_x[lower[between]])
+            keep = on_grid | between
+
+        # Scatter back to the original order of x
+        unsorted = [np.empty_like(values) for values in (keep, lower, upper, weight)]
+        for target, values in zip(unsorted, (keep, lower, upper, weight)):
+            target[order] = values
+        kept, lower, upper, weight = unsorted
+        rows = np.flatnonzero(kept)
+        return rows, lower[rows], upper[rows], weight[rows]
@@ -1,7 +1,246 @@
+from typing import Callable, Tuple
+import warnings
+
+import numpy as np
+
+
 class MSECalculator:
+    """
+    Error kernels between reference and candidate curves.
+
+    Besides the scalar calculate, the kernels take NumPy arrays: a 1-D reference
+    is compared against every column of a (rows, m) candidate matrix (one vs many),
+    a (rows, n) reference matrix against every column of the candidates (many vs
+    many). Inputs larger than memory can be fed block by block by adding up the
+    SSE of every block, as DataAnalyzer.partial_fit does. All kernels accept
+    dtype=np.float32 to halve the memory traffic; the sums are still
+    accumulated in float64.
+    """
+
     @staticmethod
     def calculate(y_true: list, y_pred: list) -> float | None:
         if len(y_true) != len(y_pred):
             return None
         squared_diff = [(a - b) ** 2 for a, b in zip(y_true, y_pred)]
-        return sum(squared_diff) / len(squared_diff)
\ No newline at end of file
+        return sum(squared_diff) / len(squared_diff)
+
+    @staticmethod
+    def _as_arrays(y_true, y_pred, dtype) -> Tuple[np.ndarray, np.ndarray] | None:
+        """
+        Converts the inputs to arrays of the given dtype and checks their row counts.
+
+        Args:
+            y_true: The reference curve (rows,) or curves (rows, n).
+            y_pred: The candidate curves (rows, m).
+            dtype: The floating point type of the computation.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray] | None: The reference as (rows, n) and the candidates,
+                or None if the row counts differ.
+        """
+        y_true = np.asarray(y_true, dtype=dtype)
+        y_pred = np.asarray(y_pred, dtype=dtype)
+        if y_pred.ndim == 1:
+            y_pred = y_pred[:, None]
+        if y_true.ndim == 1:
+            y_true = y_true[:, None]
+        if y_true.shape[0] != y_pred.shape[0]:
+            return None
+        return y_true, y_pred
+
+    @staticmethod
+    def sse(y_true, y_pred, dtype=np.float64) -> np.ndarray | None:
+        """
+        Computes the exact sum of squared errors of one or many reference curves against many candidates.
+
+        Args:
+            y_true: The reference curve (rows,) or curves (rows, n).
+            y_pred: The candidate curves (rows, m).
+            dtype (optional): The floating point type of the differences. Defaults to np.float64.
+
+        Returns:
+            np.ndarray | None: Shape (m,) for a 1-D reference, otherwise (n, m). None if the row counts differ.
+        """
+        arrays = MSECalculator._as_arrays(y_true, y_pred, dtype)
+        if arrays is None:
+            return None
+        reference, candidates = arrays
+        result = np.empty((reference.shape[1], candidates.shape[1]), dtype=np.float64)
+        for i in range(reference.shape[1]):
+            diff = candidates - reference[:, i, None]
+            result[i] = np.einsum('ij,ij->j', diff, diff, dtype=np.float64)
+        return result[0] if np.ndim(y_true) == 1 else result
+
+    @staticmethod
+    def _centered(y_true: np.ndarray, y_pred: np.ndarray, dtype) -> Tuple[np.ndarray, np.ndarray] | None:
+        """
+        Subtracts a shared per-row offset from the reference and candidate columns.
+
+        The differences between columns stay the same, but the common magnitude
+        of offset data, e.g. values around 1e6 that differ by 1e-3, no longer
+        cancels out in the expanded form used by sse_matrix. The offset is the
+        median of the row over the reference columns, ignoring missing values,
+        so the candidates close to a reference, whose errors are the smallest
+        and the most sensitive to rounding, become small numbers.
+
+        Args:
+            y_true (np.ndarray): Matrix of shape (rows, n) with the reference columns.
+            y_pred (np.ndarray): Matrix of shape (rows, m) with the candidate columns.
+            dtype: The floating point type of the returned matrices.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray] | None: The centered matrices, or None if the row counts differ.
+        """
+        y_true = np.asarray(y_true)
+        y_pred = np.asarray(y_pred)
+        if y_true.shape[0] != y_pred.shape[0]:
+            return None
+        reference = y_true.reshape(len(y_true), -1).astype(np.float64, copy=False)
+        if not reference.size:
+            offset = np.zeros(len(reference))
+        elif np.isnan(reference).any():
+            with warnings.catch_warnings():
+                # Rows without any reference value get no offset
+                warnings.simplefilter('ignore', RuntimeWarning)
+                offset = np.nan_to_num(np.nanmedian(reference, axis=1))
+        else:
+            offset = np.median(reference, axis=1)
+        offset = offset[:, None]
+        return (y_true - offset).astype(dtype, copy=False), (y_pred - offset).astype(dtype, copy=False)
+
+    @staticmethod
+    def _expanded_sse(y_true: np.ndarray, y_pred: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # sum((a - b)^2) = a.a + b.b - 2 a.b, with the squared norms it was built from
+        true_sq = np.einsum('ij,ij->j', y_true, y_true, dtype=np.float64)
+        pred_sq = np.einsum('ij,ij->j', y_pred, y_pred, dtype=np.float64)
+        sse = true_sq[:, None] + pred_sq[None, :] - 2.0 * (y_true.T @ y_pred).astype(np.float64)
+        # Rounding can leave tiny negative values for near-identical columns
+        return np.maximum(sse, 0.0), true_sq, pred_sq
+
+    @staticmethod
+    def sse_matrix(y_true: np.ndarray, y_pred: np.ndarray, dtype=np.float64) -> np.ndarray | None:
+        """
+        Computes the sum of squared errors between every pair of columns.
+
+        Uses the expansion sum((a - b)^2) = a.a + b.b - 2 a.b so the whole
+        matrix is a single matrix product instead of one pass per pair. Both
+        matrices are centered on a shared per-row offset first, see _centered.
+
+        Args:
+            y_true (np.ndarray): Matrix of shape (rows, n) with the reference columns.
+            y_pred (np.ndarray): Matrix of shape (rows, m) with the candidate columns.
+            dtype (optional): The floating point type of the matrix product. Defaults to np.float64.
+
+        Returns:
+            np.ndarray | None: Matrix of shape (n, m), or None if the row counts differ.
+        """
+        centered = MSECalculator._centered(y_true, y_pred, dtype)
+        if centered is None:
+            return None
+        return MSECalculator._expanded_sse(*centered)[0]
+
+    @staticmethod
+    def best_fit_sse_matrix(y_true: np.ndarray, y_pred: np.ndarray, dtype=np.float64) -> np.ndarray | None:
+        """
+        Computes the SSE matrix like sse_matrix, with exact values around each row minimum.
+
+        The expanded form still loses precision when the centered norms are large
+        compared to the error itself, so candidates within rounding distance of
+        each row's minimum are recomputed directly. This keeps the selected best
+        fit identical to a pairwise comparison.
+
+        Args:
+            y_true (np.ndarray): Matrix of shape (rows, n) with the reference columns.
+            y_pred (np.ndarray): Matrix of shape (rows, m) with the candidate columns.
+            dtype (optional): The floating point type of the matrix product. The recomputed
+                values are always float64. Defaults to np.float64.
+
+        Returns:
+            np.ndarray | None: Matrix of shape (n, m), or None if the row counts differ.
+        """
+        y_true = np.asarray(y_true)
+        y_pred = np.asarray(y_pred)
+        centered = MSECalculator._centered(y_true, y_pred, dtype)
+        if centered is None:
+            return None
+        sse, true_sq, pred_sq = MSECalculator._expanded_sse(*centered)
+        if sse.size == 0:
+            return sse
+        tolerance = 64 * np.finfo(dtype).eps * (true_sq[:, None] + pred_sq[None, :])
+        candidates = sse <= sse.min(axis=1, keepdims=True) + tolerance
+        for i, j in zip(*np.nonzero(candidates)):
+            diff = y_true[:, i].astype(np.float64) - y_pred[:, j]
+            sse[i, j] = diff @ diff
+        return sse
+
+    @staticmethod
+    def mse_matrix(y_true: np.ndarray, y_pred: np.ndarray, dtype=np.float64) -> np.ndarray | None:
+        """
+        Computes the mean squared error between every pair of columns.
+
+        Args:
+            y_true (np.ndarray): Matrix of shape (rows, n) with the reference columns.
+            y_pred (np.ndarray): Matrix of shape (rows, m) with the candidate columns.
+            dtype (optional): The floating point type of the matrix product. Defaults to np.float64.
+
+        Returns:
+            np.ndarray | None: Matrix of shape (n, m), or None if the row counts differ.
+        """
+        sse = MSECalculator.sse_matrix(y_true, y_pred, dtype)
+        if sse is None or len(y_true) == 0:
+            return None
+        return sse / len(y_true)
+
+    @staticmethod
+    def finite_sse(train_y: np.ndarray, ideal_y: np.ndarray, kernel: Callable) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the SSE of every training column against every ideal function, skipping missing training values.
+
+        The columns without missing values are evaluated in one kernel call; every
+        other column is evaluated over its own finite rows, so one missing value
+        does not turn a whole row of the matrix into NaN.
+
+        Args:
+            train_y (np.ndarray): The (rows, columns) training values.
+            ideal_y (np.ndarray): The (rows, functions) ideal values at the same rows.
+            kernel (Callable): The SSE kernel, e.g. best_fit_sse_matrix.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The (columns, functions) SSE and the number of rows
+                used per training column.
+        """
+        finite = np.isfinite(train_y)
+        counts = finite.sum(axis=0)
+        complete = counts == len(train_y)
+        sse = np.zeros((train_y.shape[1], ideal_y.shape[1]))
+        if complete.all():
+            return kernel(train_y, ideal_y), counts
+        if complete.any():
+            sse[complete] = kernel(train_y[:, complete], ideal_y)
+        for column in np.flatnonzero(~complete & (counts > 0)):
+            rows = finite[:, column]
+            sse[column] = kernel(train_y[rows][:, [column]], ideal_y[rows])[0]
+        return sse, counts
+
+    @staticmethod
+    def best_columns(sse: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """
+        Selects the candidate with the lowest SSE for every reference column.
+
+        Candidates with a NaN error, e.g. from missing values, are never selected.
+
+        Args:
+            sse (np.ndarray): The (references, candidates) SSE, e.g. from finite_sse.
+            counts (np.ndarray): The number of rows behind each reference's SSE.
+
+        Returns:
+            np.ndarray: The best candidate per reference, or -1 for references without
+                any usable row or without a candidate with a finite error.
+        """
+        errors = np.where(np.isnan(sse), np.inf, sse)
+        if not errors.size:
+            return np.full(len(counts), -1, dtype=np.int64)
+        best = errors.argmin(axis=1)
+        usable = (np.asarray(counts) > 0) & np.isfinite(errors[np.arange(len(best)), best])
+        return np.where(usable, best, -1)
+
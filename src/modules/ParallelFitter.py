@@ -0,0 +1,172 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from modules.IdealIndex import IdealIndex
+from modules.MSECalculator import MSECalculator
+
+# Shared sorted ideal grid attached once per worker process by _attach_ideal
+_worker_x: np.ndarray = None
+_worker_ideal: np.ndarray = None
+_worker_segment: shared_memory.SharedMemory = None
+_worker_alignment: Tuple[float, bool] = (0.0, False)
+
+
+def _attach_ideal(segment_name: str, shape: Tuple[int, int], alignment: Tuple[float, bool]) -> None:
+    """
+    Attaches a worker process to the shared ideal grid.
+
+    Args:
+        segment_name (str): The name of the shared memory segment.
+        shape (Tuple[int, int]): The (rows, columns) shape of the ideal matrix.
+        alignment (Tuple[float, bool]): The alignment tolerance and whether to interpolate.
+    """
+    global _worker_x, _worker_ideal, _worker_segment, _worker_alignment
+    # Workers share the parent's resource tracker, so attaching here does not
+    # take ownership; the parent unlinks the segment when fitting is done
+    _worker_segment = shared_memory.SharedMemory(name=segment_name)
+    _worker_x = np.ndarray(shape[0], dtype=np.float64, buffer=_worker_segment.buf)
+    _worker_ideal = np.ndarray(shape, dtype=np.float64, buffer=_worker_segment.buf, offset=_worker_x.nbytes)
+    _worker_alignment = alignment
+
+
+def _fit_dataset(task: Tuple[str, List[str], np.ndarray, np.ndarray]) -> Tuple[str, List[str], np.ndarray, np.ndarray]:
+    """
+    Fits one training table against the shared ideal grid.
+
+    The training rows are aligned with the sorted ideal grid on x first, like
+    DataAnalyzer.align_training_data, unless their x values are the grid itself.
+
+    Args:
+        task (Tuple[str, List[str], np.ndarray, np.ndarray]): The dataset name, its training
+            columns, x values and training values.
+
+    Returns:
+        Tuple: The dataset name, training columns, best ideal column index and MSE per
+            training column. The indices are -1 for columns without a usable training row.
+    """
+    name, columns, x, train_y = task
+    ideal_y = _worker_ideal
+    if not np.array_equal(x, _worker_x):
+        rows, lower, upper, weight = IdealIndex.align(_worker_x, x, *_worker_alignment)
+        train_y = train_y[rows]
+        ideal_y = _worker_ideal[lower]
+        between = np.flatnonzero(weight)
+        if len(between):
+            lower_y = ideal_y[between]
+            ideal_y[between] = lower_y + weight[between, None] * (_worker_ideal[upper[between]] - lower_y)
+    if len(train_y) == 0:
+        return name, columns, np.full(len(columns), -1), np.full(len(columns), np.nan)
+    # Missing values are handled like in DataAnalyzer.find_ideal_curves
+    sse, counts = MSECalculator.finite_sse(train_y, ideal_y, MSECalculator.best_fit_sse_matrix)
+    best = MSECalculator.best_columns(sse, counts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mse = np.where(best >= 0, sse[np.arange(len(columns)), best] / counts, np.nan)
+    return name, columns, best, mse
+
+
+class ParallelFitter:
+    """
+    A class that fits many independent training tables against one ideal set.
+
+    The ideal matrix is sorted by x and copied once into a shared memory
+    segment that every worker of a process pool attaches to, so only the
+    training tables are sent to the workers. Each worker aligns its training
+    rows with the shared grid on x, so the tables may cover part of the grid
+    in any order.
+
+    Attributes:
+        ideal_columns (List[str]): The ideal function columns.
+        workers (int): The number of worker processes.
+        align_tolerance (float): The largest x distance at which a training row matches an ideal row.
+        align_interpolate (bool): Whether training rows between ideal rows are fitted against interpolated values.
+
+    Methods:
+        fit(train_sets): Finds the best fits of every training table.
+    """
+
+    def __init__(self, ideal_set: pd.DataFrame, workers: int | None = None, align_tolerance: float = 0.0,
+                 align_interpolate: bool = False) -> None:
+        """
+        Initializes a new instance of the ParallelFitter class.
+
+        Args:
+            ideal_set (pd.DataFrame): The ideal dataset, including the x column.
+            workers (int | None, optional): The number of worker processes. Defaults to the number of CPUs.
+            align_tolerance (float, optional): The largest x distance at which a training row matches
+                an ideal row. Defaults to 0.
+            align_interpolate (bool, optional): Whether to fit training rows between ideal rows against
+                interpolated values. Defaults to False.
+
+        """
+        self.ideal_columns: List[str] = [column for column in ideal_set.columns if column != 'x']
+        self.workers = workers or os.cpu_count() or 1
+        self.align_tolerance = align_tolerance
+        self.align_interpolate = align_interpolate
+        self._ideal_set = ideal_set
+
+    @staticmethod
+    def _task(name: str, data: pd.DataFrame) -> Tuple[str, List[str], np.ndarray, np.ndarray]:
+        """
+        Packs a training table into the plain arrays sent to a worker.
+
+        Args:
+            name (str): The dataset name.
+            data (pd.DataFrame): The training table.
+
+        Returns:
+            Tuple[str, List[str], np.ndarray, np.ndarray]: The dataset name, its training columns,
+                x values and training values.
+
+        """
+        columns = [column for column in data.columns if column != 'x']
+        return name, columns, data['x'].to_numpy(dtype=np.float64), data[columns].to_numpy(dtype=np.float64)
+
+    def fit(self, train_sets: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        """
+        Finds the best fits of every training table.
+
+        Args:
+            train_sets (Dict[str, pd.DataFrame]): The training tables by dataset name, each with x
+                and its training columns.
+
+        Returns:
+            pd.DataFrame: One row per dataset and training column with dataset, train_func,
+                ideal_func and mse. Training columns without any usable row, e.g. because
+                no row matches the ideal grid, have no ideal_func and a NaN mse.
+
+        """
+        ideal_x = self._ideal_set['x'].to_numpy(dtype=np.float64)
+        order = np.argsort(ideal_x, kind='stable')
+        ideal_y = self._ideal_set[self.ideal_columns].to_numpy(dtype=np.float64)
+        segment = shared_memory.SharedMemory(create=True, size=max(ideal_x.nbytes + ideal_y.nbytes, 1))
+        try:
+            shared_x = np.ndarray(ideal_x.shape, dtype=np.float64, buffer=segment.buf)
+            shared_x[:] = ideal_x[order]
+            shared = np.ndarray(ideal_y.shape, dtype=np.float64, buffer=segment.buf, offset=shared_x.nbytes)
+            shared[:] = ideal_y[order]
+            del ideal_y
+
+            tasks = (self._task(name, data) for name, data in train_sets.items())
+            chunksize = max(1, len(train_sets) // (self.workers * 4))
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_attach_ideal,
+                initargs=(segment.name, shared.shape, (self.align_tolerance, self.align_interpolate)),
+            ) as executor:
+                results = list(executor.map(_fit_dataset, tasks, chunksize=chunksize))
+            del shared_x, shared
+        finally:
+            segment.close()
+            segment.unlink()
+
+        rows = []
+        for name, columns, best, mse in results:
+            for column, index, error in zip(columns, best, mse):
+                ideal_func = self.ideal_columns[index] if index >= 0 else None
+                rows.append([name, column, ideal_func, error])
+        return pd.DataFrame(rows, columns=['dataset', 'train_func', 'ideal_func', 'mse'])
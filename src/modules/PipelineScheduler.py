@@ -0,0 +1,224 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from modules.Profiler import profiler
+
+
+class Stage:
+    """
+    A named step of a pipeline.
+
+    The stage's function receives a dict with the results of the stages it
+    depends on. A streaming stage returns an iterable instead of a single
+    result; its items are passed to each dependent stage through a bounded
+    queue while it is still running, so producer and consumer overlap and a
+    slow consumer throttles the producer instead of letting items pile up.
+
+    Attributes:
+        name (str): The unique stage name.
+        function (Callable[[Dict[str, Any]], Any]): The work of the stage.
+        depends_on (Tuple[str, ...]): The names of the stages whose results are needed.
+        streams (bool): Whether the function returns an iterable of items to stream.
+        queue_size (int): The maximum number of items buffered per consumer of a streaming stage.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable[[Dict[str, Any]], Any],
+        depends_on: Sequence[str] = (),
+        streams: bool = False,
+        queue_size: int = 4,
+    ) -> None:
+        self.name = name
+        self.function = function
+        self.depends_on = tuple(depends_on)
+        self.streams = streams
+        self.queue_size = queue_size
+
+
+class _StreamEnd:
+    pass
+
+
+class PipelineCancelled(Exception):
+    """
+    Raised inside a stage when another stage failed and the pipeline is shutting down.
+    """
+
+
+class PipelineScheduler:
+    """
+    A class that runs a DAG of stages concurrently on threads.
+
+    A stage starts as soon as all of its regular dependencies have finished and
+    all of its streaming dependencies have started. Every stage runs on its own
+    thread; NumPy, pandas' parsers and SQLite release the GIL for most of their
+    work, so independent stages overlap and the end-to-end time approaches that
+    of the slowest chain instead of the sum of all stages. If a stage fails, the
+    remaining stages are cancelled and the first error is raised from run().
+
+    Attributes:
+        stages (Dict[str, Stage]): The stages by name.
+        timings (Dict[str, Tuple[float, float]]): Start and end of each stage in seconds since run() began.
+
+    Methods:
+        run(): Runs all stages and returns their results.
+    """
+
+    POLL_SECONDS = 0.1
+
+    def __init__(self, stages: Iterable[Stage]) -> None:
+        """
+        Initializes a new instance of the PipelineScheduler class.
+
+        Args:
+            stages (Iterable[Stage]): The stages of the pipeline.
+
+        """
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage {stage.name}")
+            self.stages[stage.name] = stage
+        self._check_graph()
+        self.timings: Dict[str, Tuple[float, float]] = {}
+
+    def _check_graph(self) -> None:
+        """
+        Checks that all dependencies exist and that the stages form no cycle.
+
+        """
+        for stage in self.stages.values():
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {dependency}")
+        visited: Dict[str, int] = {}
+
+        def visit(name: str, path: List[str]) -> None:
+            state = visited.get(name, 0)
+            if state == 1:
+                raise ValueError(f"Cycle between stages: {' -> '.join(path + [name])}")
+            if state == 2:
+                return
+            visited[name] = 1
+            for dependency in self.stages[name].depends_on:
+                visit(dependency, path + [name])
+            visited[name] = 2
+
+        for name in self.stages:
+            visit(name, [])
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Runs all stages.
+
+        Returns:
+            Dict[str, Any]: The result of every regular stage, and the number of items of every streaming stage.
+
+        """
+        self._results: Dict[str, Any] = {}
+        self._errors: List[BaseException] = []
+        self._started: set = set()
+        self._finished: set = set()
+        self._closed: set = set()
+        self._failed = threading.Event()
+        self._condition = threading.Condition()
+        self._origin = time.perf_counter()
+        self.timings = {}
+
+        # One bounded queue per (streaming producer, consumer) edge
+        self._queues: Dict[Tuple[str, str], queue.Queue] = {
+            (dependency, stage.name): queue.Queue(maxsize=self.stages[dependency].queue_size)
+            for stage in self.stages.values()
+            for dependency in stage.depends_on
+            if self.stages[dependency].streams
+        }
+
+        threads: List[threading.Thread] = []
+        with self._condition:
+            while len(self._finished) < len(self.stages):
+                if not self._failed.is_set():
+                    for stage in self.stages.values():
+                        if stage.name not in self._started and self._is_ready(stage):
+                            self._started.add(stage.name)
+                            thread = threading.Thread(target=self._run_stage, args=(stage,), name=f'stage-{stage.name}')
+                            threads.append(thread)
+                            thread.start()
+                elif len(self._finished) == len(self._started):
+                    break
+                self._condition.wait()
+
+        for thread in threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+        return self._results
+
+    def _is_ready(self, stage: Stage) -> bool:
+        for dependency in stage.depends_on:
+            if self.stages[dependency].streams:
+                if dependency not in self._started:
+                    return False
+            elif dependency not in self._finished:
+                return False
+        return True
+
+    def _run_stage(self, stage: Stage) -> None:
+        start = time.perf_counter() - self._origin
+        try:
+            inputs = {
+                dependency: self._consume(dependency, stage.name)
+                if self.stages[dependency].streams else self._results[dependency]
+                for dependency in stage.depends_on
+            }
+            with profiler.stage(f'pipeline.{stage.name}') as add_rows:
+                result = stage.function(inputs)
+                if stage.streams:
+                    consumers = [key for key in self._queues if key[0] == stage.name]
+                    items = 0
+                    for item in result:
+                        for key in consumers:
+                            self._put(key, item)
+                        items += 1
+                    for key in consumers:
+                        self._put(key, _StreamEnd)
+                    add_rows(items)
+                    result = items
+            self._results[stage.name] = result
+        except BaseException as error:
+            if not isinstance(error, PipelineCancelled):
+                self._errors.append(error)
+            self._failed.set()
+        finally:
+            self.timings[stage.name] = (start, time.perf_counter() - self._origin)
+            # A consumer that stops early must not leave its producer blocked on a full queue
+            self._closed.update(key for key in self._queues if key[1] == stage.name)
+            with self._condition:
+                self._finished.add(stage.name)
+                self._condition.notify_all()
+
+    def _put(self, key: Tuple[str, str], item: Any) -> None:
+        while key not in self._closed:
+            if self._failed.is_set():
+                raise PipelineCancelled()
+            try:
+                self._queues[key].put(item, timeout=self.POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _consume(self, producer: str, consumer: str) -> Iterator[Any]:
+        source = self._queues[(producer, consumer)]
+        while True:
+            if self._failed.is_set():
+                raise PipelineCancelled()
+            try:
+                item = source.get(timeout=self.POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if item is _StreamEnd:
+                return
+            yield item
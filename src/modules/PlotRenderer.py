@@ -0,0 +1,228 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Sequence, Tuple
+
+import matplotlib
+
+# Headless backend; must be selected before pyplot is imported
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from modules.CurveDownsampler import CurveDownsampler
+from modules.DataHandler import DataHandler
+
+
+def _render_figure(spec: Dict[str, Any]) -> List[str]:
+    """
+    Renders one figure description to image files.
+
+    Args:
+        spec (Dict[str, Any]): The figure description built by PlotRenderer, with title,
+            panels and output paths.
+
+    Returns:
+        List[str]: The written files.
+    """
+    panels = spec['panels']
+    figure, axes = plt.subplots(len(panels), 1, figsize=(10, 4 * len(panels)), squeeze=False)
+    for axis, panel in zip(axes[:, 0], panels):
+        for line in panel.get('lines', []):
+            axis.plot(line['x'], line['y'], label=line['label'], linewidth=line.get('width', 1.2),
+                      alpha=line.get('alpha', 1.0))
+        scatter = panel.get('scatter')
+        if scatter is not None:
+            points = axis.scatter(scatter['x'], scatter['y'], c=scatter['c'], cmap='viridis', s=6,
+                                  label=scatter['label'], rasterized=True)
+            figure.colorbar(points, ax=axis, label=scatter['colorbar'])
+        axis.set_title(panel['title'])
+        axis.set_xlabel('x')
+        axis.set_ylabel('y')
+        axis.legend(loc='best', fontsize='small')
+    figure.tight_layout()
+    for path in spec['paths']:
+        figure.savefig(path, dpi=spec.get('dpi', 100))
+    plt.close(figure)
+    return spec['paths']
+
+
+class PlotRenderer:
+    """
+    A class that renders the pipeline's tables to PNG or SVG files without a display.
+
+    Only the columns a figure needs are read from the SQLite tables, every curve
+    is reduced to at most max_points points (LTTB or min/max decimation) and the
+    classified test points to one point per raster cell, so tables with millions
+    of rows render in seconds. The figures are drawn in parallel worker processes
+    with matplotlib's Agg backend.
+
+    Attributes:
+        handler (DataHandler): The handler of the database holding the tables.
+        output_dir (str): The directory the figures are written to.
+        formats (List[str]): The image formats, e.g. ['png', 'svg'].
+        max_points (int): The maximum number of points per curve.
+        method (str): The curve reduction, 'lttb' or 'minmax'.
+        workers (int): The number of processes rendering figures.
+        timings (Dict[str, float]): Seconds spent reading and reducing the data, and rendering.
+
+    Methods:
+        downsample(x, y): Returns the indices of the curve points to draw.
+        figures(fit_pairs, ...): Builds the figure descriptions from the tables.
+        render(fit_pairs, ...): Writes all figures and returns the written files.
+    """
+
+    def __init__(self, handler: DataHandler, output_dir: str = 'runtime/plots', formats: Sequence[str] = ('png',),
+                 max_points: int = 5_000, method: str = 'lttb', workers: int | None = None) -> None:
+        """
+        Initializes a new instance of the PlotRenderer class.
+
+        Args:
+            handler (DataHandler): The handler of the database holding the tables.
+            output_dir (str, optional): The directory the figures are written to. Defaults to 'runtime/plots'.
+            formats (Sequence[str], optional): The image formats. Defaults to ('png',).
+            max_points (int, optional): The maximum number of points per curve. Defaults to 5000.
+            method (str, optional): The curve reduction, 'lttb' or 'minmax'. Defaults to 'lttb'.
+            workers (int | None, optional): The number of rendering processes. Defaults to the number
+                of CPUs; 1 renders in this process.
+
+        """
+        if method not in ('lttb', 'minmax'):
+            raise ValueError(f"Unknown downsampling method {method}, expected 'lttb' or 'minmax'")
+        self.handler = handler
+        self.output_dir = output_dir
+        self.formats = list(formats)
+        self.max_points = max_points
+        self.method = method
+        self.workers = workers or os.cpu_count() or 1
+        self.timings: Dict[str, float] = {}
+
+    def downsample(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Returns the indices of the curve points to draw.
+
+        Args:
+            x (np.ndarray): The x values, sorted ascending.
+            y (np.ndarray): The y values.
+
+        Returns:
+            np.ndarray: At most max_points indices in ascending order.
+        """
+        if self.method == 'minmax':
+            return CurveDownsampler.min_max(y, self.max_points // 2)
+        return CurveDownsampler.lttb(x, y, self.max_points)
+
+    def _curves(self, data: pd.DataFrame, columns: List[str], labels: List[str], **style) -> List[Dict[str, Any]]:
+        """
+        Builds the downsampled line descriptions of some columns of an x-sorted table.
+
+        """
+        x = data['x'].to_numpy()
+        lines = []
+        for column, label in zip(columns, labels):
+            y = data[column].to_numpy()
+            keep = self.downsample(x, y)
+            lines.append({'x': x[keep], 'y': y[keep], 'label': label, **style})
+        return lines
+
+    def _paths(self, name: str) -> List[str]:
+        return [os.path.join(self.output_dir, f'{name}.{extension}') for extension in self.formats]
+
+    @staticmethod
+    def _sorted(data: pd.DataFrame) -> pd.DataFrame:
+        x = data['x'].to_numpy()
+        if len(x) > 1 and not (np.diff(x) >= 0).all():
+            data = data.iloc[np.argsort(x, kind='stable')]
+        return data
+
+    def figures(self, fit_pairs: List[Tuple[str, str]], train_table: str = 'train', ideal_table: str = 'ideal',
+                result_table: str = 'test') -> List[Dict[str, Any]]:
+        """
+        Builds the figure descriptions for the training data, the selected ideal functions and the test deviations.
+
+        Args:
+            fit_pairs (List[Tuple[str, str]]): Each fitted training column with its ideal function,
+                e.g. DataAnalyzer.fit_pairs.
+            train_table (str, optional): The training table. Defaults to 'train'.
+            ideal_table (str, optional): The ideal table. Defaults to 'ideal'.
+            result_table (str, optional): The classified test points. Defaults to 'test'.
+
+        Returns:
+            List[Dict[str, Any]]: One description per figure, ready for rendering.
+        """
+        train = self._sorted(self.handler.read_table(train_table, dtype='float64'))
+        train_columns = [column for column in train.columns if column != 'x']
+        fits = list(dict.fromkeys(fit for _, fit in fit_pairs))
+        ideal = self._sorted(self.handler.read_table(ideal_table, ['x'] + fits, dtype='float64'))
+        results = self.handler.read_table(result_table, ['x', 'y', 'delta_y'], dtype='float64')
+
+        specs = []
+        if len(train):
+            specs.append({
+                'paths': self._paths('training'),
+                'panels': [{'title': 'Training data', 'lines': self._curves(train, train_columns, train_columns)}],
+            })
+        if len(ideal) and fits:
+            labels = [
+                f"{fit} (fits {', '.join(column for column, best in fit_pairs if best == fit)})"
+                for fit in fits
+            ]
+            specs.append({
+                'paths': self._paths('ideal_functions'),
+                'panels': [{'title': 'Selected ideal functions', 'lines': self._curves(ideal, fits, labels)}],
+            })
+            panels = []
+            for column, fit in fit_pairs:
+                lines = self._curves(train, [column], [f'training {column}'], alpha=0.6)
+                lines += self._curves(ideal, [fit], [f'ideal {fit}'], width=2.0)
+                panels.append({'title': f'{column} and its ideal function {fit}', 'lines': lines})
+            specs.append({'paths': self._paths('best_fits'), 'panels': panels})
+        if len(results):
+            keep = CurveDownsampler.grid(results['x'].to_numpy(), results['y'].to_numpy())
+            lines = self._curves(ideal, fits, fits, alpha=0.5) if len(ideal) else []
+            specs.append({
+                'paths': self._paths('test_deviations'),
+                'panels': [{
+                    'title': 'Classified test points',
+                    'lines': lines,
+                    'scatter': {
+                        'x': results['x'].to_numpy()[keep],
+                        'y': results['y'].to_numpy()[keep],
+                        'c': results['delta_y'].to_numpy()[keep],
+                        'label': 'test points',
+                        'colorbar': 'delta_y',
+                    },
+                }],
+            })
+        return specs
+
+    def render(self, fit_pairs: List[Tuple[str, str]], train_table: str = 'train', ideal_table: str = 'ideal',
+               result_table: str = 'test') -> List[str]:
+        """
+        Writes the figures for the training data, the selected ideal functions and the test deviations.
+
+        Args:
+            fit_pairs (List[Tuple[str, str]]): Each fitted training column with its ideal function,
+                e.g. DataAnalyzer.fit_pairs.
+            train_table (str, optional): The training table. Defaults to 'train'.
+            ideal_table (str, optional): The ideal table. Defaults to 'ideal'.
+            result_table (str, optional): The classified test points. Defaults to 'test'.
+
+        Returns:
+            List[str]: The written files.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        start = time.perf_counter()
+        specs = self.figures(fit_pairs, train_table, ideal_table, result_table)
+        self.timings['prepare_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        workers = min(self.workers, len(specs))
+        if workers <= 1:
+            written = [path for spec in specs for path in _render_figure(spec)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                written = [path for paths in executor.map(_render_figure, specs) for path in paths]
+        self.timings['render_seconds'] = time.perf_counter() - start
+        return written
@@ -0,0 +1,298 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+from sqlalchemy import event
+from sqlalchemy.engine.base import Engine
+
+
+class _Stats:
+    """
+    Aggregated measurements of one stage or query.
+    """
+
+    __slots__ = ('calls', 'wall', 'cpu', 'rows', 'peak_bytes', 'max_wall')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rows = 0
+        self.peak_bytes = 0
+        self.max_wall = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'wall_seconds': self.wall,
+            'cpu_seconds': self.cpu,
+            'max_wall_seconds': self.max_wall,
+            'rows': self.rows,
+            'peak_bytes': self.peak_bytes,
+        }
+
+
+class Profiler:
+    """
+    A class that collects per-stage timings, SQL query timings and memory peaks.
+
+    The profiler is off unless enabled with enable() or through the environment:
+    DATA_PROFILE=1 turns on timings and DATA_PROFILE_MEMORY=1 additionally tracks
+    peak Python memory per stage with tracemalloc. While it is off, stages and
+    profiled functions only pay for one attribute check and no SQL listeners are
+    registered.
+
+    Stages nest per thread. tracemalloc only has one process-wide peak, so the
+    peak of a stage that runs concurrently with others (e.g. in the pipeline
+    scheduler) includes their allocations and is an upper bound; peaks are
+    exact when stages run one at a time, as in cli.py or the benchmark.
+
+    Attributes:
+        enabled (bool): Whether measurements are collected.
+        memory (bool): Whether tracemalloc peaks are collected.
+
+    Methods:
+        enable(memory): Starts collecting measurements.
+        stage(name): Context manager measuring a block of code.
+        profiled(name, rows): Decorator measuring every call of a function.
+        iterate(name, iterable, rows): Measures the time spent producing each item of an iterable.
+        instrument_engine(engine): Times every SQL statement of an engine.
+        report(): Returns the collected measurements.
+        write_report(path): Writes the measurements as JSON and prints a summary.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.memory = False
+        self.stages: Dict[str, _Stats] = {}
+        self.queries: Dict[str, _Stats] = {}
+        # One stack of open stage peaks per thread, all registered so a new stage can fold into them
+        self._local = threading.local()
+        self._peak_stacks: List[List[int]] = []
+        self._peak_lock = threading.Lock()
+        self._instrumented: List[Engine] = []
+        self._started = time.perf_counter()
+
+    def enable(self, memory: bool = False) -> None:
+        """
+        Starts collecting measurements.
+
+        Args:
+            memory (bool, optional): Whether to track peak memory per stage with tracemalloc. Defaults to False.
+
+        """
+        self.enabled = True
+        self.memory = memory
+        self._started = time.perf_counter()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def _measure(self, name: str, rows: Callable[[Any], int] | None, result_box: List[Any]):
+        stats = self.stages.setdefault(name, _Stats())
+        if self.memory:
+            peak_stack = getattr(self._local, 'peak_stack', None)
+            with self._peak_lock:
+                if peak_stack is None:
+                    peak_stack = self._local.peak_stack = []
+                    self._peak_stacks.append(peak_stack)
+                # Keep the peaks of all open stages, in every thread, before resetting it for this stage
+                current = tracemalloc.get_traced_memory()[1]
+                for stack in self._peak_stacks:
+                    if stack:
+                        stack[-1] = max(stack[-1], current)
+                tracemalloc.reset_peak()
+                peak_stack.append(0)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - wall
+            stats.calls += 1
+            stats.wall += elapsed
+            stats.cpu += time.process_time() - cpu
+            stats.max_wall = max(stats.max_wall, elapsed)
+            if rows is not None and result_box:
+                try:
+                    stats.rows += int(rows(result_box[0]))
+                except (TypeError, ValueError, KeyError):
+                    pass
+            if self.memory:
+                with self._peak_lock:
+                    peak = max(peak_stack.pop(), tracemalloc.get_traced_memory()[1])
+                    stats.peak_bytes = max(stats.peak_bytes, peak)
+                    if peak_stack:
+                        peak_stack[-1] = max(peak_stack[-1], peak)
+                    else:
+                        self._peak_stacks.remove(peak_stack)
+                        self._local.peak_stack = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measures a block of code as the named stage.
+
+        Yields:
+            Callable[[int], None]: A function to add processed rows to the stage.
+        """
+        if not self.enabled:
+            yield _ignore_rows
+            return
+        box: List[Any] = [0]
+
+        def add_rows(rows: int) -> None:
+            box[0] += rows
+
+        with self._measure(name, lambda total: total, box):
+            yield add_rows
+
+    def profiled(self, name: str | None = None, rows: Callable[[Any], int] | None = None):
+        """
+        Decorator measuring every call of a function as a stage.
+
+        Args:
+            name (str | None, optional): The stage name. Defaults to the function's qualified name.
+            rows (Callable[[Any], int] | None, optional): Derives the processed row count from
+                the return value. Defaults to None.
+
+        """
+        def decorator(function):
+            stage_name = name or function.__qualname__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                box: List[Any] = []
+                with self._measure(stage_name, rows, box):
+                    result = function(*args, **kwargs)
+                    box.append(result)
+                return result
+            return wrapper
+        return decorator
+
+    def iterate(self, name: str, iterable: Iterable[Any], rows: Callable[[Any], int] | None = None) -> Iterable[Any]:
+        """
+        Measures the time spent producing each item of an iterable, e.g. parsing CSV chunks.
+
+        Args:
+            name (str): The stage name.
+            iterable (Iterable[Any]): The iterable to measure.
+            rows (Callable[[Any], int] | None, optional): Derives the row count from each item. Defaults to None.
+
+        Returns:
+            Iterable[Any]: The iterable itself while disabled, otherwise a measuring generator.
+        """
+        if not self.enabled:
+            return iterable
+        return self._iterate(name, iter(iterable), rows)
+
+    def _iterate(self, name: str, iterator: Iterator[Any], rows: Callable[[Any], int] | None) -> Iterator[Any]:
+        while True:
+            box: List[Any] = []
+            with self._measure(name, rows, box):
+                item = next(iterator, _EXHAUSTED)
+                if item is not _EXHAUSTED:
+                    box.append(item)
+            if item is _EXHAUSTED:
+                return
+            yield item
+
+    def instrument_engine(self, engine: Engine) -> None:
+        """
+        Times every SQL statement executed through the engine.
+
+        Does nothing while the profiler is disabled, so engines created before
+        enable() must be instrumented again.
+
+        Args:
+            engine (Engine): The engine to instrument.
+
+        """
+        if not self.enabled or any(engine is known for known in self._instrumented):
+            return
+        self._instrumented.append(engine)
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('profiler_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['profiler_start'].pop()
+            key = ' '.join(statement.split())[:200]
+            stats = self.queries.setdefault(key, _Stats())
+            stats.calls += 1
+            stats.wall += elapsed
+            stats.max_wall = max(stats.max_wall, elapsed)
+            if executemany and isinstance(parameters, (list, tuple)):
+                stats.rows += len(parameters)
+            elif cursor.rowcount is not None and cursor.rowcount > 0:
+                stats.rows += cursor.rowcount
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(context):
+            # A failed statement never reaches after_cursor_execute
+            starts = context.connection.info.get('profiler_start') if context.connection is not None else None
+            if starts:
+                starts.pop()
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Returns the collected measurements.
+
+        Returns:
+            Dict[str, Any]: Stages and queries, each sorted by total wall time.
+        """
+        def ordered(entries: Dict[str, _Stats]) -> Dict[str, Dict[str, Any]]:
+            return {
+                name: stats.as_dict()
+                for name, stats in sorted(entries.items(), key=lambda item: item[1].wall, reverse=True)
+            }
+
+        return {
+            'total_wall_seconds': time.perf_counter() - self._started,
+            'memory_tracked': self.memory,
+            'stages': ordered(self.stages),
+            'queries': ordered(self.queries),
+        }
+
+    def write_report(self, path: str, top: int = 10) -> None:
+        """
+        Writes the measurements as JSON and prints a summary.
+
+        Args:
+            path (str): The path of the JSON file.
+            top (int, optional): The number of stages and queries in the printed summary. Defaults to 10.
+
+        """
+        report = self.report()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+        print(f"Profile ({report['total_wall_seconds']:.3f}s total), written to {path}")
+        for title, entries in (('Stages', report['stages']), ('Queries', report['queries'])):
+            print(f'{title}:')
+            for name, stats in list(entries.items())[:top]:
+                memory = f"  peak {stats['peak_bytes'] / 2 ** 20:8.1f} MiB" if report['memory_tracked'] and title == 'Stages' else ''
+                print(f"  {stats['wall_seconds']:9.4f}s  {stats['calls']:6d}x  {stats['rows']:10d} rows{memory}  {name}")
+
+
+def _ignore_rows(rows: int) -> None:
+    pass
+
+
+_EXHAUSTED = object()
+
+
+# Process-wide profiler, configured from the environment
+profiler = Profiler()
+if os.environ.get('DATA_PROFILE', '') not in ('', '0'):
+    profiler.enable(memory=os.environ.get('DATA_PROFILE_MEMORY', '') not in ('', '0'))
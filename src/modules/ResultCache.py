@@ -0,0 +1,288 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+import pandas as pd
+from sqlalchemy import Column, Float, Index, Integer, MetaData, Table, Text, delete, select
+from sqlalchemy.engine.base import Engine
+
+# Cache tables, kept in the same database as the data tables
+cache_metadata = MetaData()
+
+cache_entries = Table(
+    'cache_entries',
+    cache_metadata,
+    Column('key', Text, primary_key=True),
+    Column('kind', Text, nullable=False),
+    Column('best_fits', Text),
+    Column('mse', Text),
+    Column('rows', Integer, nullable=False, default=0),
+    Column('last_used', Float, nullable=False),
+)
+
+cache_results = Table(
+    'cache_results',
+    cache_metadata,
+    Column('key', Text, nullable=False),
+    Column('x', Float),
+    Column('y', Float),
+    Column('delta_y', Float),
+    Column('ideal_func', Text),
+    Index('ix_cache_results_key', 'key'),
+)
+
+cache_file_digests = Table(
+    'cache_file_digests',
+    cache_metadata,
+    Column('path', Text, primary_key=True),
+    Column('size', Integer, nullable=False),
+    Column('mtime_ns', Integer, nullable=False),
+    Column('digest', Text, nullable=False),
+)
+
+
+class ResultCache:
+    """
+    A persistent, content-addressed cache for best fits and classification results.
+
+    Entries are keyed by SHA-256 digests of the input contents, so a cached
+    result is reused whenever the training, ideal (and test) inputs are
+    byte-for-byte the same, no matter where they came from. File digests are
+    remembered by path, size and modification time, which keeps unchanged
+    reruns from re-hashing large files. The cache is bounded by the number of
+    entries and the total number of cached result rows; the least recently
+    used entries are evicted first.
+
+    Attributes:
+        engine (Engine): The SQLAlchemy engine of the database holding the cache.
+        max_entries (int): The maximum number of cached fits and results.
+        max_result_rows (int): The maximum total number of cached result rows.
+
+    Methods:
+        file_digest(path): Returns the content digest of a file.
+        frame_digest(data): Returns the content digest of a DataFrame.
+        combine(*digests): Combines input digests into a cache key.
+        get_fit(key) / put_fit(key, best_fits, mse): Reads or stores best fits.
+        get_results(key) / put_results(key, data): Reads or stores a result table.
+        invalidate(key): Removes one entry or the whole cache.
+    """
+
+    def __init__(self, engine: Engine, max_entries: int = 64, max_result_rows: int = 10_000_000) -> None:
+        """
+        Initializes a new instance of the ResultCache class and creates its tables if needed.
+
+        Args:
+            engine (Engine): The SQLAlchemy engine of the database holding the cache.
+            max_entries (int, optional): The maximum number of cached fits and results. Defaults to 64.
+            max_result_rows (int, optional): The maximum total number of cached result rows. Defaults to 10000000.
+
+        """
+        self.engine = engine
+        self.max_entries = max_entries
+        self.max_result_rows = max_result_rows
+        cache_metadata.create_all(self.engine)
+
+    def file_digest(self, path: str) -> str:
+        """
+        Returns the SHA-256 digest of a file's contents.
+
+        The digest is reused from the database while the file's size and
+        modification time are unchanged.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            str: The hexadecimal digest.
+
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.engine.begin() as connection:
+            row = connection.execute(
+                select(cache_file_digests.c.digest).where(
+                    cache_file_digests.c.path == path,
+                    cache_file_digests.c.size == stat.st_size,
+                    cache_file_digests.c.mtime_ns == stat.st_mtime_ns,
+                )
+            ).first()
+            if row is not None:
+                return row.digest
+
+            digest = hashlib.sha256()
+            with open(path, 'rb') as file:
+                for block in iter(lambda: file.read(1 << 20), b''):
+                    digest.update(block)
+            connection.execute(delete(cache_file_digests).where(cache_file_digests.c.path == path))
+            connection.execute(
+                cache_file_digests.insert(),
+                {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest.hexdigest()},
+            )
+            return digest.hexdigest()
+
+    @staticmethod
+    def frame_digest(data: pd.DataFrame) -> str:
+        """
+        Returns the SHA-256 digest of a DataFrame's column names and values.
+
+        Args:
+            data (pd.DataFrame): The data.
+
+        Returns:
+            str: The hexadecimal digest.
+
+        """
+        digest = hashlib.sha256(json.dumps([str(column) for column in data.columns]).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def combine(*digests: str) -> str:
+        """
+        Combines input digests into one cache key.
+
+        Args:
+            *digests (str): The digests of the inputs, in a fixed order.
+
+        Returns:
+            str: The cache key.
+
+        """
+        return hashlib.sha256('/'.join(digests).encode()).hexdigest()
+
+    def _touch(self, connection, key: str) -> None:
+        connection.execute(cache_entries.update().where(cache_entries.c.key == key).values(last_used=time.time()))
+
+    def get_fit(self, key: str) -> Tuple[List[str], Dict[str, float]] | None:
+        """
+        Reads cached best fits.
+
+        Args:
+            key (str): The cache key of the training and ideal inputs.
+
+        Returns:
+            Tuple[List[str], Dict[str, float]] | None: The best fits and their MSE by training
+                column, or None on a cache miss.
+
+        """
+        with self.engine.begin() as connection:
+            row = connection.execute(
+                select(cache_entries.c.best_fits, cache_entries.c.mse).where(
+                    cache_entries.c.key == key, cache_entries.c.kind == 'fit'
+                )
+            ).first()
+            if row is None:
+                return None
+            self._touch(connection, key)
+        return json.loads(row.best_fits), json.loads(row.mse)
+
+    def put_fit(self, key: str, best_fits: List[str], mse: Dict[str, float]) -> None:
+        """
+        Stores best fits.
+
+        Args:
+            key (str): The cache key of the training and ideal inputs.
+            best_fits (List[str]): The best fit curves.
+            mse (Dict[str, float]): The MSE of each best fit by training column.
+
+        """
+        with self.engine.begin() as connection:
+            self._remove(connection, key)
+            connection.execute(cache_entries.insert(), {
+                'key': key,
+                'kind': 'fit',
+                'best_fits': json.dumps(best_fits),
+                'mse': json.dumps(mse),
+                'rows': 0,
+                'last_used': time.time(),
+            })
+            self._evict(connection)
+
+    def get_results(self, key: str) -> pd.DataFrame | None:
+        """
+        Reads a cached result table.
+
+        Args:
+            key (str): The cache key of the training, ideal and test inputs.
+
+        Returns:
+            pd.DataFrame | None: The results with x, y, delta_y and ideal_func, or None on a cache miss.
+
+        """
+        with self.engine.begin() as connection:
+            exists = connection.execute(
+                select(cache_entries.c.key).where(cache_entries.c.key == key, cache_entries.c.kind == 'results')
+            ).first()
+            if exists is None:
+                return None
+            self._touch(connection, key)
+            query = select(
+                cache_results.c.x, cache_results.c.y, cache_results.c.delta_y, cache_results.c.ideal_func
+            ).where(cache_results.c.key == key)
+            return pd.read_sql_query(query, connection)
+
+    def put_results(self, key: str, data: pd.DataFrame) -> None:
+        """
+        Stores a result table.
+
+        Results larger than max_result_rows are not cached.
+
+        Args:
+            key (str): The cache key of the training, ideal and test inputs.
+            data (pd.DataFrame): The results with x, y, delta_y and ideal_func.
+
+        """
+        if len(data) > self.max_result_rows:
+            return
+        records = data[['x', 'y', 'delta_y', 'ideal_func']].to_numpy(dtype=object).tolist()
+        with self.engine.begin() as connection:
+            self._remove(connection, key)
+            connection.execute(cache_entries.insert(), {
+                'key': key,
+                'kind': 'results',
+                'rows': len(data),
+                'last_used': time.time(),
+            })
+            if records:
+                connection.exec_driver_sql(
+                    'INSERT INTO cache_results (key, x, y, delta_y, ideal_func) VALUES (?, ?, ?, ?, ?)',
+                    [(key, *record) for record in records],
+                )
+            self._evict(connection)
+
+    def invalidate(self, key: str | None = None) -> None:
+        """
+        Removes one cache entry, or every entry if no key is given.
+
+        Args:
+            key (str | None, optional): The cache key to remove. Defaults to None.
+
+        """
+        with self.engine.begin() as connection:
+            if key is None:
+                connection.execute(delete(cache_results))
+                connection.execute(delete(cache_entries))
+                connection.execute(delete(cache_file_digests))
+            else:
+                self._remove(connection, key)
+
+    def _remove(self, connection, key: str) -> None:
+        connection.execute(delete(cache_results).where(cache_results.c.key == key))
+        connection.execute(delete(cache_entries).where(cache_entries.c.key == key))
+
+    def _evict(self, connection) -> None:
+        """
+        Evicts the least recently used entries until the cache is within its bounds.
+
+        """
+        entries = connection.execute(
+            select(cache_entries.c.key, cache_entries.c.rows).order_by(cache_entries.c.last_used.desc())
+        ).all()
+        kept_rows = 0
+        for position, entry in enumerate(entries):
+            kept_rows += entry.rows
+            if position >= self.max_entries or kept_rows > self.max_result_rows:
+                self._remove(connection, entry.key)
+                kept_rows -= entry.rows
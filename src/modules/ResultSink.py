@@ -0,0 +1,212 @@
+from typing import Any, Dict, Iterable, List
+
+import pandas as pd
+from sqlalchemy import exc, inspect
+
+from modules.DataHandler import DataHandler
+from modules.Profiler import profiler
+from schema.index import table_test
+
+
+class ResultSink:
+    """
+    A class that streams classification results into the typed test table.
+
+    Result chunks are buffered until batch_rows rows are collected and then
+    inserted with one executemany call per transaction, so memory is bounded by
+    the batch size instead of growing with the test set. The table keeps the
+    types from schema.index.table_test. With upsert enabled, a unique index on
+    (x, y, ideal_func) makes writes idempotent: writing the same results again,
+    e.g. when a run is repeated after a failure, updates the existing rows
+    instead of adding duplicates. Repeated test points then also collapse into
+    one row, so upserts are opt-in and plain appends are the default.
+
+    Attributes:
+        handler (DataHandler): The handler of the database holding the table.
+        table_name (str): The name of the result table.
+        columns (Dict[str, Any]): The column names and types of the result table.
+        batch_rows (int): The number of rows written per transaction.
+        upsert (bool): Whether rows with an existing (x, y, ideal_func) key are updated instead of added.
+        rows_written (int): The number of rows written so far.
+
+    Methods:
+        ensure_table(): Creates the table and its unique key if they do not exist.
+        clear(): Deletes all rows of the table.
+        write(data): Adds a chunk of results, writing a batch when it is full.
+        flush(): Writes the buffered results, keeping them buffered if the write fails.
+        consume(chunks): Writes all chunks of an iterable and flushes.
+    """
+
+    KEY = ('x', 'y', 'ideal_func')
+
+    def __init__(
+        self,
+        handler: DataHandler,
+        table_name: str = 'test',
+        columns: Dict[str, Any] = None,
+        batch_rows: int = 50_000,
+        upsert: bool = False,
+    ) -> None:
+        """
+        Initializes a new instance of the ResultSink class.
+
+        Args:
+            handler (DataHandler): The handler of the database holding the table.
+            table_name (str, optional): The name of the result table. Defaults to 'test'.
+            columns (Dict[str, Any], optional): The column names and types. Defaults to schema.index.table_test.
+            batch_rows (int, optional): The number of rows written per transaction. Defaults to 50000.
+            upsert (bool, optional): Whether rows with an existing (x, y, ideal_func) key are updated.
+                Defaults to False.
+
+        """
+        self.handler = handler
+        self.table_name = table_name
+        self.columns = dict(columns if columns is not None else table_test)
+        self.batch_rows = batch_rows
+        self.upsert = upsert
+        self.rows_written = 0
+        self._buffer: List[pd.DataFrame] = []
+        self._buffered_rows = 0
+        self._quoted_table = handler.engine.dialect.identifier_preparer.quote(table_name)
+        self._statement = self._insert_statement()
+
+    def _insert_statement(self) -> str:
+        preparer = self.handler.engine.dialect.identifier_preparer
+        names = list(self.columns)
+        statement = (
+            f"INSERT INTO {self._quoted_table} ({', '.join(preparer.quote(name) for name in names)}) "
+            f"VALUES ({', '.join('?' for _ in names)})"
+        )
+        if self.upsert:
+            updates = [name for name in names if name not in self.KEY]
+            key = ', '.join(preparer.quote(name) for name in self.KEY)
+            if updates:
+                assignments = ', '.join(f'{preparer.quote(name)} = excluded.{preparer.quote(name)}' for name in updates)
+                statement += f" ON CONFLICT ({key}) DO UPDATE SET {assignments}"
+            else:
+                statement += f" ON CONFLICT ({key}) DO NOTHING"
+        return statement
+
+    def ensure_table(self) -> None:
+        """
+        Creates the result table and, for upserts, its unique key if they do not exist.
+
+        For plain appends an existing unique key is dropped, since the same test
+        point may legitimately be written more than once.
+
+        If the existing rows already contain duplicate keys, the unique index cannot
+        be created and the sink falls back to plain appends.
+
+        """
+        if not inspect(self.handler.engine).has_table(self.table_name):
+            self.handler.create_table(self.table_name, self.columns)
+        preparer = self.handler.engine.dialect.identifier_preparer
+        index = preparer.quote(f'ux_{self.table_name}_point')
+        if not self.upsert:
+            # A unique key left by an earlier upsert would reject repeated test points
+            try:
+                with self.handler.write_lock, self.handler.engine.begin() as connection:
+                    connection.exec_driver_sql(f"DROP INDEX IF EXISTS {index}")
+            except exc.SQLAlchemyError as e:
+                print(f"Error dropping the unique key of table {self.table_name}: {e}")
+            return
+        key = ', '.join(preparer.quote(name) for name in self.KEY)
+        try:
+            with self.handler.write_lock, self.handler.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {self._quoted_table} ({key})"
+                )
+        except exc.SQLAlchemyError as e:
+            print(f"Error creating the unique key of table {self.table_name}, appending instead: {e}")
+            self.upsert = False
+            self._statement = self._insert_statement()
+
+    def clear(self) -> None:
+        """
+        Deletes all rows of the result table.
+
+        """
+        try:
+            with self.handler.write_lock, self.handler.engine.begin() as connection:
+                connection.exec_driver_sql(f"DELETE FROM {self._quoted_table}")
+        except exc.SQLAlchemyError as e:
+            print(f"Error clearing table {self.table_name}: {e}")
+
+    def write(self, data: pd.DataFrame) -> None:
+        """
+        Adds a chunk of results and writes a batch once batch_rows rows are buffered.
+
+        Args:
+            data (pd.DataFrame): The results with (at least) the columns of the result table.
+
+        """
+        if len(data) == 0:
+            return
+        self._buffer.append(data[list(self.columns)])
+        self._buffered_rows += len(data)
+        if self._buffered_rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Writes the buffered results in one transaction.
+
+        A batch that fails to write stays buffered, so the next write or flush
+        retries it together with any results added in between.
+
+        Returns:
+            int: The number of rows written, 0 if the batch failed.
+
+        """
+        if not self._buffer:
+            return 0
+        batch = pd.concat(self._buffer, ignore_index=True) if len(self._buffer) > 1 else self._buffer[0]
+        self._buffer = [batch]
+
+        records = batch.to_numpy(dtype=object)
+        # Missing values become NULL instead of NaN
+        records[pd.isna(records)] = None
+        try:
+            with profiler.stage('ResultSink.flush') as add_rows, self.handler.write_lock, self.handler.engine.begin() as connection:
+                if self.upsert:
+                    # SQLite resolves the ON CONFLICT target against the schema the pooled
+                    # connection last read, which may predate the unique index; reading
+                    # from the table first makes it reload a changed schema
+                    connection.exec_driver_sql(f"SELECT 1 FROM {self._quoted_table} LIMIT 0")
+                connection.exec_driver_sql(self._statement, list(map(tuple, records.tolist())))
+                add_rows(len(batch))
+        except exc.SQLAlchemyError as e:
+            print(f"Error writing results to table {self.table_name}, keeping {len(batch)} rows for a retry: {e}")
+            return 0
+        self._buffer = []
+        self._buffered_rows = 0
+        self.rows_written += len(batch)
+        return len(batch)
+
+    def consume(self, chunks: Iterable[pd.DataFrame]) -> int:
+        """
+        Writes all chunks of an iterable, e.g. DataAnalyzer.iter_test_data_set, and flushes.
+
+        Args:
+            chunks (Iterable[pd.DataFrame]): The result chunks.
+
+        Returns:
+            int: The total number of rows written by this sink.
+
+        """
+        for chunk in chunks:
+            self.write(chunk)
+        self.flush()
+        return self.rows_written
+
+    def __enter__(self) -> 'ResultSink':
+        self.ensure_table()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # Batches already written stay; a partial batch is only written if no error occurred
+        if exc_type is None:
+            self.flush()
+        else:
+            self._buffer = []
+            self._buffered_rows = 0
@@ -0,0 +1,228 @@
+import csv
+import io
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from modules.IdealIndex import IdealIndex
+
+# Shared ideal lookup attached once per worker process by _attach_lookup
+_worker_x: np.ndarray = None
+_worker_values: np.ndarray = None
+_worker_fits: List[str] = None
+_worker_segment: shared_memory.SharedMemory = None
+
+
+def _attach_lookup(segment_name: str, rows: int, fits: List[str]) -> None:
+    """
+    Attaches a worker process to the shared sorted x values and best fit columns.
+
+    Args:
+        segment_name (str): The name of the shared memory segment.
+        rows (int): The number of ideal rows.
+        fits (List[str]): The names of the best fit columns.
+    """
+    global _worker_x, _worker_values, _worker_fits, _worker_segment
+    _worker_segment = shared_memory.SharedMemory(name=segment_name)
+    _worker_x = np.ndarray((rows,), dtype=np.float64, buffer=_worker_segment.buf)
+    _worker_values = np.ndarray((rows, len(fits)), dtype=np.float64, buffer=_worker_segment.buf, offset=rows * 8)
+    _worker_fits = fits
+
+
+def _classify_shard(task: Tuple[int, str, int, int, List[str], bool]) -> Tuple[int, pd.DataFrame, Dict[str, Any]]:
+    """
+    Classifies the rows of one byte range of the test CSV file.
+
+    Args:
+        task (Tuple): The shard index, the CSV path, the start and end byte offsets,
+            the header names and whether to interpolate.
+
+    Returns:
+        Tuple[int, pd.DataFrame, Dict[str, Any]]: The shard index, its results and its statistics.
+    """
+    index, csv_path, start, end, names, interpolate = task
+    started = time.perf_counter()
+    with open(csv_path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    if data.strip():
+        points = pd.read_csv(io.BytesIO(data), header=None, names=names, usecols=['x', 'y'], dtype='float64')
+    else:
+        points = pd.DataFrame({'x': np.empty(0), 'y': np.empty(0)})
+    results = IdealIndex.classify(_worker_x, _worker_values, _worker_fits,
+                                  points['x'].to_numpy(), points['y'].to_numpy(), interpolate)
+    seconds = time.perf_counter() - started
+    stats = {
+        'shard': index,
+        'start': start,
+        'end': end,
+        'rows': len(points),
+        'matches': len(results),
+        'no_best_fit': results.attrs['no_best_fit'],
+        'seconds': seconds,
+        'rows_per_sec': len(points) / seconds if seconds > 0 else float('inf'),
+        'pid': os.getpid(),
+    }
+    return index, results, stats
+
+
+class ShardedClassifier:
+    """
+    A class that classifies a large test CSV file with a pool of worker processes.
+
+    The file is split into byte ranges that end on line boundaries, so every
+    worker parses its own part of the file and no rows are sent through a pipe.
+    The sorted ideal x values and best fit columns are copied once into a
+    shared memory segment that every worker attaches to. The results come back
+    in file order, so the output is the same as classifying the file in one
+    process, whatever the number of workers.
+
+    Attributes:
+        best_fits (List[str]): The names of the best fit columns.
+        workers (int): The number of worker processes.
+        shard_bytes (int): The target size of a shard in bytes.
+        shard_stats (List[Dict[str, Any]]): Rows, matches, seconds and rows per second of each shard of the last run.
+
+    Methods:
+        shards(csv_path): Splits a CSV file into byte ranges.
+        iter_classify(csv_path, interpolate): Yields the results of every shard in file order.
+        classify(csv_path, interpolate): Returns all results as one DataFrame.
+    """
+
+    def __init__(self, ideal_x: np.ndarray, ideal_fit_values: np.ndarray, best_fits: List[str],
+                 workers: int | None = None, shard_bytes: int = 16 * 2 ** 20) -> None:
+        """
+        Initializes a new instance of the ShardedClassifier class.
+
+        Args:
+            ideal_x (np.ndarray): The sorted ideal x values.
+            ideal_fit_values (np.ndarray): The best fit columns in ideal_x order.
+            best_fits (List[str]): The names of the best fit columns.
+            workers (int | None, optional): The number of worker processes. Defaults to the number of CPUs.
+            shard_bytes (int, optional): The target size of a shard in bytes. Defaults to 16 MiB.
+
+        """
+        self.best_fits = list(best_fits)
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_bytes = shard_bytes
+        self.shard_stats: List[Dict[str, Any]] = []
+        self._ideal_x = ideal_x
+        self._ideal_fit_values = ideal_fit_values
+
+    def shards(self, csv_path: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """
+        Splits a CSV file into byte ranges of about shard_bytes that end on line boundaries.
+
+        At least one shard per worker is made while the file has enough lines.
+
+        Args:
+            csv_path (str): The path to the CSV file.
+
+        Returns:
+            Tuple[List[str], List[Tuple[int, int]]]: The header names and the (start, end) byte offsets.
+
+        """
+        size = os.path.getsize(csv_path)
+        with open(csv_path, 'rb') as file:
+            header = file.readline()
+            start = file.tell()
+            names = next(csv.reader([header.decode('utf-8')]))
+            target = max(1, min(self.shard_bytes, (size - start) // self.workers))
+            ranges = []
+            while start < size:
+                file.seek(min(start + target, size))
+                if file.tell() < size:
+                    # Move the boundary to the end of the current line
+                    file.readline()
+                end = file.tell()
+                ranges.append((start, end))
+                start = end
+        return names, ranges
+
+    def iter_classify(self, csv_path: str, interpolate: bool = False) -> Iterator[pd.DataFrame]:
+        """
+        Classifies a CSV file shard by shard, yielding the results of each shard in file order.
+
+        Args:
+            csv_path (str): The path to the CSV file with x and y columns.
+            interpolate (bool, optional): Whether to interpolate the ideal curves for x values
+                that are not on the ideal grid. Defaults to False.
+
+        Yields:
+            pd.DataFrame: The results of each shard. The number of points without any match
+                is stored in the frame's attrs under 'no_best_fit'.
+        """
+        names, ranges = self.shards(csv_path)
+        self.shard_stats.clear()
+        rows = len(self._ideal_x)
+        values = np.ascontiguousarray(self._ideal_fit_values, dtype=np.float64)
+        segment = shared_memory.SharedMemory(create=True, size=max(rows * 8 + values.nbytes, 1))
+        started = time.perf_counter()
+        try:
+            np.ndarray((rows,), dtype=np.float64, buffer=segment.buf)[:] = self._ideal_x
+            np.ndarray(values.shape, dtype=np.float64, buffer=segment.buf, offset=rows * 8)[:] = values
+
+            tasks = ((index, csv_path, start, end, names, interpolate) for index, (start, end) in enumerate(ranges))
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_attach_lookup,
+                initargs=(segment.name, rows, self.best_fits),
+            ) as executor:
+                # Keep a bounded window of shards in flight and collect them in
+                # submission order, i.e. file order, so finished results never pile up
+                pending = deque(executor.submit(_classify_shard, task) for task in islice(tasks, self.workers * 2))
+                while pending:
+                    index, results, stats = pending.popleft().result()
+                    for task in islice(tasks, 1):
+                        pending.append(executor.submit(_classify_shard, task))
+                    self.shard_stats.append(stats)
+                    results.attrs['no_best_fit'] = stats['no_best_fit']
+                    yield results
+        finally:
+            segment.close()
+            segment.unlink()
+
+        self._report(time.perf_counter() - started)
+
+    def classify(self, csv_path: str, interpolate: bool = False) -> pd.DataFrame:
+        """
+        Classifies a CSV file and returns all results in file order.
+
+        Args:
+            csv_path (str): The path to the CSV file with x and y columns.
+            interpolate (bool, optional): Whether to interpolate the ideal curves. Defaults to False.
+
+        Returns:
+            pd.DataFrame: The results, with the total number of points without any match in
+                attrs['no_best_fit'].
+        """
+        frames = list(self.iter_classify(csv_path, interpolate))
+        if frames:
+            df = pd.concat(frames, ignore_index=True)
+        else:
+            df = pd.DataFrame(columns=['x', 'y', 'delta_y', 'ideal_func'])
+        df.attrs['no_best_fit'] = sum(stats['no_best_fit'] for stats in self.shard_stats)
+        return df
+
+    def _report(self, seconds: float) -> None:
+        """
+        Prints the overall and per-shard throughput of the last run.
+
+        """
+        if not self.shard_stats:
+            return
+        rows = sum(stats['rows'] for stats in self.shard_stats)
+        throughput = np.array([stats['rows_per_sec'] for stats in self.shard_stats])
+        print(
+            f"Classified {rows} rows in {len(self.shard_stats)} shards on {self.workers} workers "
+            f"in {seconds:.3f}s ({rows / seconds if seconds > 0 else float('inf'):,.0f} rows/s); "
+            f"per shard min {throughput.min():,.0f}, median {np.median(throughput):,.0f}, "
+            f"max {throughput.max():,.0f} rows/s"
+        )
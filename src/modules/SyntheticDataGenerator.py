@@ -0,0 +1,144 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+class SyntheticDataGenerator:
+    """
+    A class that generates deterministic synthetic datasets in the shape of the data/ CSV files.
+
+    The ideal set holds a family of sine, cosine, linear, quadratic and tanh
+    functions with pseudo-random parameters on an evenly spaced x grid. The
+    training set contains noisy copies of a few of those functions on the same
+    grid, and the test set holds points near the training functions mixed with
+    outliers. The same seed and sizes always produce the same files. Rows are
+    generated and written in chunks, so the file sizes are not limited by memory.
+
+    Attributes:
+        seed (int): The seed of the random number generator.
+        train_functions (int): The number of training columns.
+        noise (float): The standard deviation of the training noise.
+
+    Methods:
+        generate(directory, ideal_functions, rows, test_points): Writes train.csv, ideal.csv and test.csv.
+    """
+
+    def __init__(self, seed: int = 0, train_functions: int = 4, noise: float = 0.3) -> None:
+        """
+        Initializes a new instance of the SyntheticDataGenerator class.
+
+        Args:
+            seed (int, optional): The seed of the random number generator. Defaults to 0.
+            train_functions (int, optional): The number of training columns. Defaults to 4.
+            noise (float, optional): The standard deviation of the training noise. Defaults to 0.3.
+
+        """
+        self.seed = seed
+        self.train_functions = train_functions
+        self.noise = noise
+
+    def _parameters(self, ideal_functions: int) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        return rng.uniform(-2.0, 2.0, size=(ideal_functions, 3))
+
+    @staticmethod
+    def _evaluate(x: np.ndarray, parameters: np.ndarray, functions: np.ndarray) -> np.ndarray:
+        """
+        Evaluates ideal functions on a block of x values.
+
+        Args:
+            x (np.ndarray): The x values, shape (rows,).
+            parameters (np.ndarray): The (a, b, c) parameters of all functions, shape (ideal_functions, 3).
+            functions (np.ndarray): The indices of the functions to evaluate.
+
+        Returns:
+            np.ndarray: The function values, shape (rows, len(functions)).
+        """
+        parameters = parameters[functions]
+        a, b, c = parameters[:, 0], parameters[:, 1], parameters[:, 2]
+        kind = np.asarray(functions) % 5
+        x = x[:, None]
+        values = np.empty((x.shape[0], len(parameters)))
+        for k, formula in enumerate((
+            lambda a, b, c: a * np.sin(b * x) + c,
+            lambda a, b, c: a * np.cos(b * x) + c,
+            lambda a, b, c: a * x + c,
+            lambda a, b, c: a * x ** 2 + b * x + c,
+            lambda a, b, c: a * np.tanh(b * x) + c,
+        )):
+            columns = kind == k
+            if columns.any():
+                values[:, columns] = formula(a[columns], b[columns], c[columns])
+        return values
+
+    def selected_functions(self, ideal_functions: int) -> List[int]:
+        """
+        Returns the ideal functions that the training columns are generated from.
+
+        Args:
+            ideal_functions (int): The number of ideal functions.
+
+        Returns:
+            List[int]: The zero-based ideal function indices, one per training column.
+        """
+        rng = np.random.default_rng(self.seed + 1)
+        count = min(self.train_functions, ideal_functions)
+        return sorted(rng.choice(ideal_functions, size=count, replace=False).tolist())
+
+    def generate(self, directory: str, ideal_functions: int, rows: int, test_points: int) -> Dict[str, str]:
+        """
+        Writes train.csv, ideal.csv and test.csv into a directory.
+
+        Args:
+            directory (str): The output directory, created if needed.
+            ideal_functions (int): The number of ideal functions.
+            rows (int): The number of rows of the ideal and training sets.
+            test_points (int): The number of test points.
+
+        Returns:
+            Dict[str, str]: The paths of the written files by name ('train', 'ideal', 'test').
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = {name: os.path.join(directory, f'{name}.csv') for name in ('train', 'ideal', 'test')}
+        parameters = self._parameters(ideal_functions)
+        selected = self.selected_functions(ideal_functions)
+        x_grid = np.round(np.linspace(-20.0, 20.0, rows), 6)
+        # Keep each generated block at roughly five million values
+        chunk_rows = max(1, 5_000_000 // max(ideal_functions, 1))
+
+        noise_rng = np.random.default_rng(self.seed + 2)
+        ideal_header = ['x'] + [f'y{i}' for i in range(1, ideal_functions + 1)]
+        train_header = ['x'] + [f'y{i}' for i in range(1, len(selected) + 1)]
+        with open(paths['ideal'], 'w', newline='') as ideal_file, open(paths['train'], 'w', newline='') as train_file:
+            for start in range(0, rows, chunk_rows):
+                x = x_grid[start:start + chunk_rows]
+                values = self._evaluate(x, parameters, np.arange(ideal_functions))
+                ideal = pd.DataFrame(values, columns=ideal_header[1:])
+                ideal.insert(0, 'x', x)
+                ideal.to_csv(ideal_file, header=start == 0, index=False, float_format='%.8g')
+
+                noisy = values[:, selected] + noise_rng.normal(scale=self.noise, size=(len(x), len(selected)))
+                train = pd.DataFrame(noisy, columns=train_header[1:])
+                train.insert(0, 'x', x)
+                train.to_csv(train_file, header=start == 0, index=False, float_format='%.8g')
+
+        test_rng = np.random.default_rng(self.seed + 3)
+        test_chunk = 1_000_000
+        with open(paths['test'], 'w', newline='') as test_file:
+            for start in range(0, test_points, test_chunk):
+                count = min(test_chunk, test_points - start)
+                x = x_grid[test_rng.integers(0, rows, size=count)]
+                function = test_rng.choice(selected, size=count)
+                # Evaluate every point against its own function only
+                y = np.empty(count)
+                for index in np.unique(function):
+                    mask = function == index
+                    y[mask] = self._evaluate(x[mask], parameters, np.array([index]))[:, 0]
+                y = y + test_rng.normal(scale=self.noise * 2, size=count)
+                outliers = test_rng.random(count) < 0.15
+                y[outliers] += test_rng.uniform(-50.0, 50.0, size=int(outliers.sum()))
+                pd.DataFrame({'x': x, 'y': y}).to_csv(test_file, header=start == 0, index=False, float_format='%.8g')
+
+        return paths
@@ -9,11 +9,17 @@ table_training.update({f'y{i}': Float for i in range(1, 5)})
 # Define test table
 table_test = {
     'x': Float,
-    'y1': Float,
+    'y': Float,
     'delta_y': Float,
     'ideal_func': Text
 }
 
+# Define table of raw test points, for classification inside the database
+table_test_points = {
+    'x': Float,
+    'y': Float
+}
+
 # Define ideal table
 table_ideal = {'x': Float}
 table_ideal.update({f'y{i}': Float for i in range(1, 51)})
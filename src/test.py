@@ -1,101 +1,1129 @@
-import unittest
-import numpy as np
-import pandas as pd
-import os
-from DataAnalyzer import DataAnalyzer
-from DataHandler import DataHandler
-from sqlalchemy import Column, MetaData, Table, create_engine
-from sqlalchemy import Float, String
-
-class TestDataAnalyzer(unittest.TestCase):
-
-    def setUp(self):
-        # Perform setup before each test
-        self.db_handler = DataHandler()
-        self.data_analyzer = DataAnalyzer()
-
-        # Create tables and load data for testing
-        self.db_handler.create_table('test', {'X': 'FLOAT', 'Y': 'FLOAT'})
-        self.db_handler.create_table('ideal', {'X': 'FLOAT', 'Y': 'FLOAT'})
-        self.db_handler.load_csv_to_db('data/test.csv', 'test')
-        self.db_handler.load_csv_to_db('data/ideal.csv', 'ideal')
-
-    def test_find_best_fit(self):
-        # Retrieve data for testing
-        train_data = self.db_handler.get_data_from_db('SELECT * FROM test')
-        ideal_data = self.db_handler.get_data_from_db('SELECT * FROM ideal')
-
-        # Find best fit
-        train_set = train_data[['X', 'Y']].values
-        ideal_set = ideal_data[['X', 'Y']].values
-        best_fits = self.data_analyzer.find_best_fit(train_set, ideal_set)
-
-        # Test 1: Check if the number of best fits is correct
-        self.assertEqual(len(best_fits), 3)
-
-        # Test 2: Check if the best fits contain the expected data
-        expected_mses = [mse for _, mse in best_fits]
-        self.assertLessEqual(min(expected_mses), self.data_analyzer.min_mse)
-        
-        # Test 3: Check if the best fits correspond to the expected curves
-        for curve, mse in best_fits:
-            # Example: Check if the curve has the same number of points as the training dataset
-            self.assertEqual(len(curve), len(train_set))
-
-        # Test 4: Add more specific checks
-
-    def test_save_deviation(self):
-        # Prepare data for testing
-        self.data_analyzer.best_fits = [(
-            np.array([[1.0, 2.0], [2.0, 3.0], [3.0, 4.0]]), 0.5
-        )]
-
-        # Test if the method saves data to the database
-        self.data_analyzer.save_deviation()
-
-        # Retrieve and check data from the database
-        deviation_data = self.db_handler.get_data_from_db('SELECT * FROM deviations')
-
-        # Test 1: Check if the number of saved data points is correct
-        self.assertEqual(len(deviation_data), 3)
-
-        # Test 2: Check if the saved data is correct
-        expected_data = np.array([[1.0, 2.0, 0.5, 'Func1'],
-                                  [2.0, 3.0, 0.5, 'Func1'],
-                                  [3.0, 4.0, 0.5, 'Func1']])
-        np.testing.assert_array_equal(deviation_data.values, expected_data)
-        
-    def test_create_deviations_table(self):
-        # Test if the method creates a table with the correct columns
-        self.db_handler.create_deviations_table()
-
-        # Check if the table exists in the database
-        table_names = self.db_handler.engine.table_names()
-        self.assertIn('deviations', table_names)
-
-        # Check the columns of the created table
-        metadata = MetaData(bind=self.db_handler.engine)
-        deviations_table = Table('deviations', metadata, autoload=True)
-        expected_columns = {'X': Float, 'Y': Float, 'Deviation': Float, 'IdealFunction': String}
-        for column_name, column_type in expected_columns.items():
-            self.assertIsInstance(deviations_table.columns[column_name].type, column_type)
-
-    def test_load_csv_to_db(self):
-        # Test if the method loads CSV data into the database
-        csv_path = 'test_data.csv'
-        df = pd.DataFrame({'X': [1, 2, 3], 'Y': [4, 5, 6]})
-        df.to_csv(csv_path, index=False)
-        table_name = 'test_table'
-
-        self.db_handler.load_csv_to_db(csv_path, table_name)
-
-        # Check if the data is present in the database
-        query = f'SELECT * FROM {table_name}'
-        loaded_data = self.db_handler.get_data_from_db(query)
-        pd.testing.assert_frame_equal(df, loaded_data)
-
-        # Clean up
-        os.remove(csv_path)
-
-if _name_ == '_main_':
-    unittest.main()
\ No newline at end of file
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import tracemalloc
+import unittest
+import warnings
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Float, Text, inspect
+from sqlalchemy.pool import StaticPool
+
+import benchmark
+import cli
+from modules.ClassificationService import ClassificationService
+from modules.CurveDownsampler import CurveDownsampler
+from modules.DataAnalyzer import DataAnalyzer
+from modules.DatabaseConnection import DatabaseConnection, PROFILES
+from modules.IdealCache import IdealCache
+from modules.MSECalculator import MSECalculator
+from modules.PipelineScheduler import PipelineScheduler, Stage
+from modules.PlotRenderer import PlotRenderer
+from modules.Profiler import Profiler
+from modules.ResultSink import ResultSink
+from modules.ShardedClassifier import ShardedClassifier
+from modules.SyntheticDataGenerator import SyntheticDataGenerator
+from schema.index import table_ideal, table_test, table_training
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+TRAIN_CSV = os.path.join(DATA_DIR, 'train.csv')
+IDEAL_CSV = os.path.join(DATA_DIR, 'ideal.csv')
+TEST_CSV = os.path.join(DATA_DIR, 'test.csv')
+
+
+def sorted_results(data: pd.DataFrame) -> pd.DataFrame:
+    # Result frames from different paths only differ in dtypes and row order
+    data = data[['x', 'y', 'delta_y', 'ideal_func']].astype({'x': float, 'y': float, 'delta_y': float, 'ideal_func': str})
+    return data.sort_values(['x', 'y', 'ideal_func'], kind='stable').reset_index(drop=True)
+
+
+def brute_force_sse(train_y: np.ndarray, ideal: pd.DataFrame) -> pd.Series:
+    # The SSE of one training column against every ideal column, skipping missing training values
+    finite = np.isfinite(train_y)
+    values = ideal.drop(columns='x').to_numpy(dtype=np.float64)[finite]
+    return pd.Series(((values - train_y[finite, None]) ** 2).sum(axis=0), index=ideal.columns[1:])
+
+
+class AnalyzerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Every test gets its own in-memory database and a scratch directory for files
+        self.directory = tempfile.mkdtemp()
+        self.db_connection = DatabaseConnection(profile='memory')
+        self.db_handler = self.data_analyzer = DataAnalyzer(self.db_connection)
+        self.train = pd.read_csv(TRAIN_CSV)
+        self.ideal = pd.read_csv(IDEAL_CSV)
+
+    def tearDown(self):
+        self.db_connection.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def fitted_analyzer(self, **kwargs) -> DataAnalyzer:
+        analyzer = DataAnalyzer(self.db_connection, **kwargs)
+        analyzer.load_training_data(self.train)
+        analyzer.load_ideal_data(self.ideal)
+        analyzer.find_ideal_curves()
+        return analyzer
+
+
+class TestDataAnalyzer(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Create tables and load data for testing
+        self.db_handler.create_table('train', table_training)
+        self.db_handler.create_table('ideal', table_ideal)
+        self.db_handler.load_csv_to_db(TRAIN_CSV, 'train', bulk=True)
+        self.db_handler.load_csv_to_db(IDEAL_CSV, 'ideal', bulk=True)
+
+    def test_find_best_fit(self):
+        # Retrieve data for testing
+        train_data = self.db_handler.get_data_from_db('SELECT * FROM train')
+        ideal_data = self.db_handler.get_data_from_db('SELECT * FROM ideal')
+        self.data_analyzer.load_training_data(train_data)
+        self.data_analyzer.load_ideal_data(ideal_data)
+
+        for column in ['y1', 'y2', 'y3', 'y4']:
+            best_fit, mse = self.data_analyzer.find_best_fit(train_data[column].tolist())
+            # The best fit has the lowest MSE of all ideal functions
+            expected = brute_force_sse(train_data[column].to_numpy(), ideal_data) / len(train_data)
+            self.assertEqual(best_fit, expected.idxmin())
+            self.assertAlmostEqual(mse, expected.min())
+
+    def test_save_deviation(self):
+        self.data_analyzer.load_training_data(self.db_handler.get_data_from_db('SELECT * FROM train'))
+        self.data_analyzer.load_ideal_data(self.db_handler.get_data_from_db('SELECT * FROM ideal'))
+        self.data_analyzer.find_ideal_curves()
+
+        # Test if the method saves the results to the database
+        rows = self.data_analyzer.write_test_data_set(TEST_CSV, 'test')
+
+        # Retrieve and check data from the database
+        deviation_data = self.db_handler.get_data_from_db('SELECT * FROM test')
+        self.assertEqual(len(deviation_data), rows)
+        expected = self.data_analyzer.test_data_set(TEST_CSV)
+        pd.testing.assert_frame_equal(sorted_results(deviation_data), sorted_results(expected))
+
+    def test_create_deviations_table(self):
+        # Test if the method creates a table with the correct columns
+        self.db_handler.create_table('test', table_test)
+
+        # Check if the table exists in the database
+        self.assertIn('test', inspect(self.db_handler.engine).get_table_names())
+
+        # Check the columns of the created table
+        columns = {column['name']: column['type'] for column in inspect(self.db_handler.engine).get_columns('test')}
+        expected_columns = {'x': Float, 'y': Float, 'delta_y': Float, 'ideal_func': Text}
+        for column_name, column_type in expected_columns.items():
+            self.assertIsInstance(columns[column_name], column_type)
+
+    def test_load_csv_to_db(self):
+        # Test if the method loads CSV data into the database
+        csv_path = self.path('test_data.csv')
+        df = pd.DataFrame({'X': [1, 2, 3], 'Y': [4, 5, 6]})
+        df.to_csv(csv_path, index=False)
+        table_name = 'test_table'
+
+        self.db_handler.load_csv_to_db(csv_path, table_name)
+
+        # Check if the data is present in the database
+        query = f'SELECT * FROM {table_name}'
+        loaded_data = self.db_handler.get_data_from_db(query)
+        pd.testing.assert_frame_equal(df, loaded_data)
+
+
+class TestFitting(AnalyzerTestCase):
+
+    def test_vectorized_fit_matches_pairwise_fit(self):
+        self.data_analyzer.load_training_data(self.train)
+        self.data_analyzer.load_ideal_data(self.ideal)
+        vectorized = self.data_analyzer.find_ideal_curves(vectorized=True)
+        pairwise = self.data_analyzer.find_ideal_curves(vectorized=False)
+        self.assertEqual(vectorized, pairwise)
+
+        # Every entry of the MSE matrix is the pairwise MSE
+        for column in ['y1', 'y2', 'y3', 'y4']:
+            expected = brute_force_sse(self.train[column].to_numpy(), self.ideal) / len(self.train)
+            np.testing.assert_allclose(self.data_analyzer.mse_matrix.loc[column], expected, rtol=1e-12)
+
+    def test_missing_training_values_are_skipped(self):
+        train = self.train.copy()
+        train.loc[::7, 'y2'] = np.nan
+        self.data_analyzer.load_training_data(train)
+        self.data_analyzer.load_ideal_data(self.ideal)
+        vectorized = self.data_analyzer.find_ideal_curves(vectorized=True)
+        pairwise = self.data_analyzer.find_ideal_curves(vectorized=False)
+        self.assertEqual(vectorized, pairwise)
+
+        rows = int(train['y2'].notna().sum())
+        expected = brute_force_sse(train['y2'].to_numpy(), self.ideal) / rows
+        np.testing.assert_allclose(self.data_analyzer.mse_matrix.loc['y2'], expected, rtol=1e-12)
+
+
+class TestIdealLookup(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data_analyzer.load_training_data(self.train)
+        self.data_analyzer.load_ideal_data(self.ideal.sample(frac=1, random_state=0))
+        self.data_analyzer.find_ideal_curves()
+
+    def test_lookup_matches_a_scan(self):
+        fits = self.data_analyzer.best_fits
+        x = np.array([self.ideal['x'].iloc[10], self.ideal['x'].iloc[-1], 1000.0])
+        values = self.data_analyzer.lookup_ideal_values(x)
+        for row, value in zip(values[:2], x[:2]):
+            np.testing.assert_array_equal(row, self.ideal.loc[self.ideal['x'] == value, fits].to_numpy()[0])
+        # Off the grid there is no value unless interpolating
+        self.assertTrue(np.isnan(values[2]).all())
+        between = self.data_analyzer.lookup_ideal_values(-19.95, interpolate=True)[0]
+        np.testing.assert_allclose(between, self.ideal[fits].iloc[:2].mean().to_numpy())
+
+    def test_data_point(self):
+        fit = self.data_analyzer.best_fits[0]
+        x, ideal_y = self.ideal['x'].iloc[5], self.ideal[fit].iloc[5]
+        matches = self.data_analyzer.test_data_point([x, ideal_y + 0.5])
+        self.assertIn([x, ideal_y + 0.5, 0.5, fit], [[m[0], m[1], round(m[2], 9), m[3]] for m in matches])
+        self.assertIsNone(self.data_analyzer.test_data_point([x, ideal_y + 1e9]))
+
+
+class TestClassification(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data_analyzer.load_training_data(self.train)
+        self.data_analyzer.load_ideal_data(self.ideal)
+        self.data_analyzer.find_ideal_curves()
+        self.per_row = sorted_results(self.data_analyzer.test_data_set(TEST_CSV, batched=False))
+
+    def test_batched_matches_per_row(self):
+        for chunksize in [1, 7, 100_000]:
+            batched = self.data_analyzer.test_data_set(TEST_CSV, chunksize=chunksize)
+            pd.testing.assert_frame_equal(sorted_results(batched), self.per_row)
+
+    def test_sharded_matches_per_row(self):
+        analyzer = self.data_analyzer
+        # Small shards, so the file is split between the workers
+        classifier = ShardedClassifier(analyzer.ideal_x, analyzer.ideal_fit_values, analyzer.best_fits, 2, shard_bytes=256)
+        self.assertGreater(len(classifier.shards(TEST_CSV)[1]), 1)
+        pd.testing.assert_frame_equal(sorted_results(classifier.classify(TEST_CSV)), self.per_row)
+
+        sharded = analyzer.test_data_set(TEST_CSV, workers=2)
+        pd.testing.assert_frame_equal(sorted_results(sharded), self.per_row)
+
+    def test_in_db_matches_per_row(self):
+        self.db_handler.create_table('ideal', table_ideal)
+        self.db_handler.load_csv_to_db(IDEAL_CSV, 'ideal', bulk=True)
+        rows = self.data_analyzer.classify_in_db(csv_path=TEST_CSV)
+
+        in_db = self.db_handler.get_data_from_db('SELECT * FROM test')
+        self.assertEqual(rows, len(in_db))
+        pd.testing.assert_frame_equal(sorted_results(in_db), self.per_row, check_exact=False, rtol=1e-6)
+
+    def test_in_db_counts_points_once(self):
+        # Every ideal row twice, so each matched point joins two ideal rows
+        self.db_handler.create_table('ideal', table_ideal)
+        self.db_handler.replace_data_in_table('ideal', pd.concat([self.ideal, self.ideal], ignore_index=True))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertIsNotNone(self.data_analyzer.classify_in_db(csv_path=TEST_CSV))
+        unmatched = len(pd.read_csv(TEST_CSV)) - len(self.per_row.drop_duplicates(['x', 'y']))
+        self.assertIn(f'No best fit:  {unmatched}\n', output.getvalue())
+
+    def test_points_without_a_match_are_counted(self):
+        test = pd.read_csv(TEST_CSV)
+        results = self.data_analyzer.classify_points(test['x'].to_numpy(), test['y'].to_numpy())
+        self.assertEqual(results.attrs['no_best_fit'], len(test) - results[['x', 'y']].drop_duplicates().shape[0])
+
+
+class TestIdealCache(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = IdealCache(self.path('ideal_cache'))
+        self.ideal_csv = self.path('ideal.csv')
+        self.ideal.to_csv(self.ideal_csv, index=False)
+
+    def test_round_trip_is_memory_mapped(self):
+        self.assertIsNone(self.cache.read_meta())
+        self.cache.write(self.ideal, self.ideal_csv)
+
+        values = self.cache.load_array()
+        self.assertIsInstance(values, np.memmap)
+        self.assertEqual(self.cache.read_meta()['columns'], self.ideal.columns.tolist())
+        np.testing.assert_array_equal(values.T, self.ideal.to_numpy())
+
+        # Fitting from the cache gives the same fits as fitting from the frame
+        self.data_analyzer.load_training_data(self.train)
+        self.data_analyzer.load_ideal_data(cache=self.cache)
+        self.assertEqual(self.data_analyzer.find_ideal_curves(), self.fitted_analyzer().best_fits)
+
+    def test_changed_source_invalidates(self):
+        self.assertFalse(self.cache.is_valid(self.ideal_csv))
+        self.cache.write(self.ideal, self.ideal_csv)
+        self.assertTrue(self.cache.is_valid(self.ideal_csv))
+        self.assertTrue(self.cache.is_valid())
+
+        self.ideal.iloc[:-1].to_csv(self.ideal_csv, index=False)
+        self.assertFalse(self.cache.is_valid(self.ideal_csv))
+        os.remove(self.ideal_csv)
+        self.assertFalse(self.cache.is_valid(self.ideal_csv))
+
+
+class TestBulkLoad(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.db_handler.create_table('train', table_training)
+
+    def test_chunks_keep_the_typed_table(self):
+        csv_path = self.path('train.csv')
+        train = self.train.copy()
+        train.loc[3, 'y2'] = np.nan
+        train.to_csv(csv_path, index=False)
+
+        stats = self.db_handler.load_csv_to_db(csv_path, 'train', bulk=True, chunksize=64)
+        self.assertEqual(stats['rows'], len(train))
+        columns = {column['name']: column['type'] for column in inspect(self.db_handler.engine).get_columns('train')}
+        self.assertIsInstance(columns['y1'], Float)
+        # Missing values are stored as NULL
+        nulls = self.db_handler.get_data_from_db('SELECT COUNT(*) AS n FROM train WHERE y2 IS NULL')
+        self.assertEqual(nulls['n'][0], 1)
+        pd.testing.assert_frame_equal(self.db_handler.get_data_from_db('SELECT * FROM train'), train)
+
+    def test_failing_chunk_writes_nothing(self):
+        def chunks():
+            yield self.train.iloc[:100]
+            raise ValueError('broken chunk')
+
+        self.assertIsNone(self.db_handler.bulk_insert('train', chunks()))
+        self.assertIsNone(self.db_handler.bulk_insert('train', [self.train.assign(z=1.0)]))
+        self.assertIsNone(self.db_handler.bulk_insert('missing', [self.train]))
+        self.assertEqual(len(self.db_handler.get_data_from_db('SELECT * FROM train')), 0)
+
+
+class TestEngineProfiles(AnalyzerTestCase):
+
+    def pragma(self, engine, name: str):
+        with engine.connect() as connection:
+            return connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+    def test_profile_pragmas_are_applied(self):
+        # File databases are created under runtime/ in the working directory
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, cwd)
+        for profile, settings in PROFILES.items():
+            connection = DatabaseConnection(f'{profile}.db', profile=profile)
+            self.addCleanup(connection.engine.dispose)
+            for name, value in settings['pragmas'].items():
+                # SQLite reports these settings by number
+                value = {'MEMORY': 2, 'OFF': 0, 'NORMAL': 1}.get(value, value)
+                actual = self.pragma(connection.engine, name)
+                self.assertEqual(str(actual).lower(), str(value).lower(), f'{profile}: {name}')
+            self.pragma(connection.engine, 'user_version')
+            self.assertEqual(os.path.exists(os.path.join('runtime', f'{profile}.db')), not settings.get('in_memory'))
+
+    def test_memory_profile_shares_one_database(self):
+        engine = self.db_connection.engine
+        self.assertIsInstance(engine.pool, StaticPool)
+        self.db_handler.create_table('train', table_training)
+        # Every checkout, from any thread, sees the same in-memory database
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(inspect(engine).has_table('train')))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [True])
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            DatabaseConnection(profile='fast')
+
+
+class TestPartialFit(AnalyzerTestCase):
+
+    def test_partial_fit_matches_full_fit(self):
+        full = self.fitted_analyzer()
+
+        self.data_analyzer.load_ideal_data(self.ideal)
+        shuffled = self.train.sample(frac=1, random_state=0)
+        for start in range(0, len(shuffled), 150):
+            part = shuffled.iloc[start:start + 150]
+            best_fits = self.data_analyzer.partial_fit(part)
+        self.assertEqual(best_fits, full.best_fits)
+        pd.testing.assert_frame_equal(self.data_analyzer.mse_matrix, full.mse_matrix, rtol=1e-12)
+
+    def test_partial_fit_continues_a_saved_state(self):
+        first, second = self.train.iloc[:250], self.train.iloc[250:]
+        self.data_analyzer.load_training_data(first)
+        self.data_analyzer.load_ideal_data(self.ideal)
+        self.data_analyzer.find_ideal_curves()
+        state = self.path('fit_state.npz')
+        self.data_analyzer.save_fit_state(state)
+
+        restored = DataAnalyzer(self.db_connection)
+        restored.load_ideal_data(self.ideal)
+        restored.load_fit_state(state)
+        restored.partial_fit(second)
+        self.assertEqual(restored.best_fits, self.fitted_analyzer().best_fits)
+
+
+class TestFitMany(AnalyzerTestCase):
+
+    def serial_fits(self, train: pd.DataFrame, ideal: pd.DataFrame) -> Dict[str, str]:
+        analyzer = DataAnalyzer(self.db_connection)
+        analyzer.load_training_data(train)
+        analyzer.load_ideal_data(ideal)
+        analyzer.find_ideal_curves()
+        pairs = analyzer._select_fits(analyzer.sse_accumulator, analyzer.accumulated_rows, *analyzer.fit_columns)
+        fits = dict(pairs)
+        return {column: (fit, analyzer.mse_matrix.at[column, fit]) for column, fit in fits.items()}
+
+    def assert_matches_serial(self, train_sets: Dict[str, pd.DataFrame], ideal: pd.DataFrame):
+        self.data_analyzer.load_ideal_data(ideal)
+        fits = self.data_analyzer.fit_many(train_sets, workers=2)
+        for name, train in train_sets.items():
+            expected = self.serial_fits(train, ideal)
+            result = fits[fits['dataset'] == name].set_index('train_func')
+            for column in result.index:
+                if column in expected:
+                    self.assertEqual(result.at[column, 'ideal_func'], expected[column][0], f'{name} {column}')
+                    self.assertAlmostEqual(result.at[column, 'mse'], expected[column][1])
+                else:
+                    self.assertIsNone(result.at[column, 'ideal_func'])
+                    self.assertTrue(np.isnan(result.at[column, 'mse']))
+
+    def test_matches_serial_fit(self):
+        train_sets = {
+            'full': self.train,
+            # Shuffled rows covering part of the grid are aligned on x like in the serial fit
+            'part': self.train.iloc[50:300].sample(frac=1, random_state=1),
+        }
+        self.assert_matches_serial(train_sets, self.ideal)
+
+    def test_missing_values_match_serial_fit(self):
+        train = self.train.copy()
+        train.loc[17, 'y2'] = np.nan
+        empty = self.train.copy()
+        empty['y3'] = np.nan
+        ideal = self.ideal.copy()
+        ideal.loc[3, 'y1'] = np.nan
+        self.assert_matches_serial({'missing': train, 'empty': empty}, self.ideal)
+        self.assert_matches_serial({'missing': train, 'empty': empty}, ideal)
+
+
+class TestRankBestFits(AnalyzerTestCase):
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            rows, functions = int(rng.integers(1, 600)), int(rng.integers(1, 200))
+            ideal = pd.DataFrame(rng.normal(size=(rows, functions)).round(1),
+                                 columns=[f'y{i + 1}' for i in range(functions)])
+            if functions > 2:
+                # A tie, which is ranked by column position
+                ideal['y3'] = ideal['y2']
+            ideal.insert(0, 'x', np.arange(rows, dtype=np.float64))
+            train_y = ideal['y1'].to_numpy() + rng.normal(scale=0.5, size=rows)
+            k, block_size = int(rng.integers(1, 10)), int(rng.integers(1, 200))
+
+            self.data_analyzer.load_ideal_data(ideal)
+            ranking, pruned = self.data_analyzer.rank_best_fits(train_y, k, block_size)
+
+            sse = brute_force_sse(train_y, ideal).to_numpy()
+            order = np.lexsort((np.arange(functions), sse))[:k]
+            self.assertEqual(ranking['ideal_func'].tolist(), [f'y{i + 1}' for i in order])
+            np.testing.assert_allclose(ranking['mse'], sse[order] / rows, rtol=1e-9)
+            self.assertLessEqual(pruned, functions - len(order))
+
+    def test_rejects_k_below_one(self):
+        self.data_analyzer.load_ideal_data(self.ideal)
+        self.assertIsNone(self.data_analyzer.rank_best_fits(self.train['y1'].tolist(), 0))
+
+
+class TestMSECalculator(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.reference = rng.normal(size=(200, 3))
+        self.candidates = rng.normal(size=(200, 5))
+
+    def exact_sse(self, reference: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        return ((reference[:, :, None] - candidates[:, None, :]) ** 2).sum(axis=0)
+
+    def test_kernels_match_the_scalar_mse(self):
+        mse = MSECalculator.calculate(self.reference[:, 0].tolist(), self.candidates[:, 2].tolist())
+        self.assertAlmostEqual(MSECalculator.sse(self.reference[:, 0], self.candidates)[2] / 200, mse)
+        self.assertAlmostEqual(MSECalculator.mse_matrix(self.reference, self.candidates)[0, 2], mse)
+        self.assertIsNone(MSECalculator.calculate([1.0], [1.0, 2.0]))
+
+        expected = self.exact_sse(self.reference, self.candidates)
+        for kernel in [MSECalculator.sse, MSECalculator.sse_matrix, MSECalculator.best_fit_sse_matrix]:
+            np.testing.assert_allclose(kernel(self.reference, self.candidates), expected, rtol=1e-12)
+            np.testing.assert_allclose(kernel(self.reference, self.candidates, dtype=np.float32), expected, rtol=1e-4)
+            self.assertIsNone(kernel(self.reference[:-1], self.candidates))
+
+    def test_large_offsets_do_not_cancel(self):
+        # Values around 1e6 that differ by about 1e-3
+        reference = 1e6 + self.reference
+        candidates = reference[:, [0]] + 1e-3 * self.candidates
+        expected = self.exact_sse(reference, candidates) / len(reference)
+        np.testing.assert_allclose(MSECalculator.mse_matrix(reference, candidates), expected, rtol=1e-6)
+        np.testing.assert_allclose(MSECalculator.sse_matrix(reference, candidates), expected * len(reference), rtol=1e-6)
+        # Against a single reference the offset is the reference itself, so even float32 resolves these errors
+        np.testing.assert_allclose(MSECalculator.mse_matrix(reference[:, :1], candidates, dtype=np.float32)[0],
+                                   expected[0], rtol=1e-3)
+
+    def test_missing_values(self):
+        reference = self.reference.copy()
+        reference[3, 1] = np.nan
+        candidates = self.candidates.copy()
+        candidates[:, 4] = np.nan
+        sse, counts = MSECalculator.finite_sse(reference, candidates, MSECalculator.best_fit_sse_matrix)
+        np.testing.assert_array_equal(counts, [200, 199, 200])
+        rows = np.isfinite(reference[:, 1])
+        np.testing.assert_allclose(sse[1, :4], self.exact_sse(reference[rows][:, [1]], candidates[rows, :4])[0])
+        self.assertTrue(np.isnan(sse[:, 4]).all())
+
+        # A candidate with a NaN error is never the best one, and a reference without rows has none
+        best = MSECalculator.best_columns(sse, np.array([200, 199, 0]))
+        np.testing.assert_array_equal(best[:2], np.nanargmin(sse[:2, :4], axis=1))
+        self.assertEqual(best[2], -1)
+        np.testing.assert_array_equal(MSECalculator.best_columns(np.full((2, 1), np.nan), np.array([5, 5])), [-1, -1])
+
+
+class TestResultCache(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.train_csv = self.path('train.csv')
+        self.ideal_csv = self.path('ideal.csv')
+        self.test_csv = self.path('test.csv')
+        self.train.to_csv(self.train_csv, index=False)
+        self.ideal.to_csv(self.ideal_csv, index=False)
+        shutil.copy(TEST_CSV, self.test_csv)
+
+    def fit(self, train: pd.DataFrame = None, refit: bool = False, **kwargs) -> DataAnalyzer:
+        analyzer = DataAnalyzer(self.db_connection, **kwargs)
+        analyzer.enable_result_cache()
+        analyzer.load_training_data(self.train if train is None else train)
+        analyzer.load_ideal_data(self.ideal)
+        analyzer.find_ideal_curves(refit=refit)
+        return analyzer
+
+    def test_fit_cache_hit_and_invalidation(self):
+        first = self.fit()
+        # A fit is only computed, with its MSE matrix, on a cache miss
+        self.assertIsNotNone(first.mse_matrix)
+        second = self.fit()
+        self.assertIsNone(second.mse_matrix)
+        self.assertEqual(second.best_fits, first.best_fits)
+
+        changed = self.train.copy()
+        changed.loc[0, 'y1'] += 1
+        self.assertIsNotNone(self.fit(changed).mse_matrix)
+
+        self.assertIsNotNone(self.fit(refit=True).mse_matrix)
+        # float32 fits are cached apart from float64 ones
+        self.assertIsNotNone(self.fit(dtype='float32').mse_matrix)
+        self.assertIsNone(self.fit(dtype='float32').mse_matrix)
+
+        second.invalidate_cache()
+        self.assertIsNotNone(self.fit().mse_matrix)
+
+    def test_cached_fit_seeds_partial_fit(self):
+        self.fit(self.train.iloc[:250])
+        cached = self.fit(self.train.iloc[:250])
+        self.assertIsNone(cached.mse_matrix)
+        cached.partial_fit(self.train.iloc[250:])
+        self.assertEqual(cached.best_fits, self.fitted_analyzer().best_fits)
+
+    def test_results_cache_follows_the_files(self):
+        analyzer = DataAnalyzer(self.db_connection)
+        analyzer.enable_result_cache()
+        analyzer.load_training_data(self.train, source=self.train_csv)
+        analyzer.load_ideal_data(self.ideal, source=self.ideal_csv)
+        analyzer.find_ideal_curves()
+        results = analyzer.test_data_set(self.test_csv)
+
+        cached = analyzer.lookup_cached_results(self.train_csv, self.ideal_csv, self.test_csv)
+        pd.testing.assert_frame_equal(sorted_results(cached), sorted_results(results))
+        restored = DataAnalyzer(self.db_connection)
+        restored.enable_result_cache()
+        self.assertEqual(restored.load_cached_fit(self.train_csv, self.ideal_csv), analyzer.best_fits)
+        self.assertIsNone(analyzer.lookup_cached_results(self.train_csv, self.ideal_csv, self.test_csv, interpolate=True))
+
+        # Another test file misses, and so do all results once the training file changes
+        with open(self.test_csv, 'a') as file:
+            file.write('1.0,2.0\n')
+        self.assertIsNone(analyzer.lookup_cached_results(self.train_csv, self.ideal_csv, self.test_csv))
+        shutil.copy(TEST_CSV, self.test_csv)
+        self.assertIsNotNone(analyzer.lookup_cached_results(self.train_csv, self.ideal_csv, self.test_csv))
+        self.train.iloc[::-1].to_csv(self.train_csv, index=False)
+        self.assertIsNone(analyzer.lookup_cached_results(self.train_csv, self.ideal_csv, self.test_csv))
+        self.assertIsNone(restored.load_cached_fit(self.train_csv, self.ideal_csv))
+
+
+class TestBenchmark(AnalyzerTestCase):
+
+    def test_generator_is_deterministic(self):
+        first = SyntheticDataGenerator(seed=3).generate(self.path('first'), 8, 60, 25)
+        second = SyntheticDataGenerator(seed=3).generate(self.path('second'), 8, 60, 25)
+        for name, path in first.items():
+            with open(path, 'rb') as a, open(second[name], 'rb') as b:
+                self.assertEqual(a.read(), b.read(), name)
+
+        selected = SyntheticDataGenerator(seed=3).selected_functions(8)
+        self.assertEqual(pd.read_csv(first['ideal']).shape, (60, 9))
+        self.assertEqual(pd.read_csv(first['train']).shape, (60, len(selected) + 1))
+        self.assertEqual(pd.read_csv(first['test']).shape, (25, 2))
+
+    def test_benchmark_report(self):
+        # The benchmark keeps its data and database under runtime/ in the working directory
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, cwd)
+        self.assertEqual(benchmark.main(['--size', '6x50x20', '--memory', 'none', '--output', 'report.json']), 0)
+        with open('report.json', encoding='utf-8') as file:
+            report = json.load(file)
+
+        run, = report['runs']
+        self.assertEqual(run['sizes']['ideal_functions'], 6)
+        # A point that fits several ideal functions is written once per match
+        self.assertGreaterEqual(run['result_rows'], 20)
+        self.assertEqual(len(run['best_fits']), len(SyntheticDataGenerator(0).selected_functions(6)))
+        self.assertIn('find_ideal_curves', run['stages'])
+        self.assertEqual(benchmark.compare(report, report, 0.25, 0.05), [])
+
+        slower = json.loads(json.dumps(report))
+        slower['runs'][0]['stages']['find_ideal_curves']['wall_seconds'] += 1
+        self.assertEqual(len(benchmark.compare(slower, report, 0.25, 0.05)), 1)
+
+
+class TestProfiler(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profiler = Profiler()
+        self.profiler.enable()
+
+    def test_disabled_profiler_collects_nothing(self):
+        profiler = Profiler()
+        with profiler.stage('load') as add_rows:
+            add_rows(10)
+        self.assertEqual(profiler.report()['stages'], {})
+
+    def test_stages_functions_and_iterables(self):
+        with self.profiler.stage('load') as add_rows:
+            add_rows(10)
+            add_rows(5)
+        square = self.profiler.profiled('square', rows=len)(lambda values: [value ** 2 for value in values])
+        square([1, 2, 3])
+        square([4])
+        chunks = list(self.profiler.iterate('chunks', iter([[1, 2], [3]]), rows=len))
+        self.assertEqual(chunks, [[1, 2], [3]])
+
+        stages = self.profiler.report()['stages']
+        self.assertEqual((stages['load']['calls'], stages['load']['rows']), (1, 15))
+        self.assertEqual((stages['square']['calls'], stages['square']['rows']), (2, 4))
+        # The iterable is measured once more for the call that finds it exhausted
+        self.assertEqual((stages['chunks']['calls'], stages['chunks']['rows']), (3, 3))
+
+    def test_nested_memory_peaks(self):
+        profiler = Profiler()
+        tracing = tracemalloc.is_tracing()
+        profiler.enable(memory=True)
+        if not tracing:
+            self.addCleanup(tracemalloc.stop)
+        with profiler.stage('outer'):
+            with profiler.stage('inner'):
+                block = bytearray(4 * 2 ** 20)
+                del block
+            with profiler.stage('after'):
+                pass
+
+        stages = profiler.report()['stages']
+        self.assertGreaterEqual(stages['inner']['peak_bytes'], 4 * 2 ** 20)
+        # The outer stage includes the peak of the nested one, the later sibling does not
+        self.assertGreaterEqual(stages['outer']['peak_bytes'], stages['inner']['peak_bytes'])
+        self.assertLess(stages['after']['peak_bytes'], 4 * 2 ** 20)
+
+    def test_queries_and_report(self):
+        self.profiler.instrument_engine(self.db_connection.engine)
+        # Instrumenting twice must not count statements twice
+        self.profiler.instrument_engine(self.db_connection.engine)
+        self.db_handler.create_table('train', table_training)
+        self.db_handler.replace_data_in_table('train', self.train)
+
+        queries = self.profiler.report()['queries']
+        insert = next(stats for statement, stats in queries.items() if statement.startswith('INSERT INTO train'))
+        self.assertEqual(insert['rows'], len(self.train))
+
+        path = self.path(os.path.join('profile', 'report.json'))
+        self.profiler.write_report(path)
+        with open(path, encoding='utf-8') as file:
+            self.assertEqual(set(json.load(file)), {'total_wall_seconds', 'memory_tracked', 'stages', 'queries'})
+
+
+class TestPipelineScheduler(unittest.TestCase):
+
+    def test_results_and_streams(self):
+        scheduler = PipelineScheduler([
+            Stage('numbers', lambda inputs: range(10), streams=True, queue_size=2),
+            Stage('total', lambda inputs: sum(inputs['numbers']), depends_on=['numbers']),
+            Stage('double', lambda inputs: inputs['total'] * 2, depends_on=['total']),
+        ])
+        results = scheduler.run()
+        self.assertEqual(results, {'numbers': 10, 'total': 45, 'double': 90})
+        self.assertEqual(set(scheduler.timings), {'numbers', 'total', 'double'})
+
+    def test_error_stops_the_pipeline(self):
+        def fail(inputs):
+            next(iter(inputs['numbers']))
+            raise KeyError('broken')
+
+        scheduler = PipelineScheduler([
+            # The producer would block forever on the full queue of the failed consumer
+            Stage('numbers', lambda inputs: iter(range(10 ** 6)), streams=True, queue_size=1),
+            Stage('consumer', fail, depends_on=['numbers']),
+            Stage('after', lambda inputs: inputs['consumer'], depends_on=['consumer']),
+        ])
+        with self.assertRaises(KeyError):
+            scheduler.run()
+        # The dependent of the failed stage never started
+        self.assertNotIn('after', scheduler.timings)
+        self.assertIn('numbers', scheduler.timings)
+
+    def test_consumer_that_stops_early(self):
+        scheduler = PipelineScheduler([
+            Stage('numbers', lambda inputs: iter(range(1000)), streams=True, queue_size=1),
+            Stage('first', lambda inputs: next(iter(inputs['numbers'])), depends_on=['numbers']),
+        ])
+        results = scheduler.run()
+        # The producer is not blocked by the closed queue and finishes its items
+        self.assertEqual(results, {'numbers': 1000, 'first': 0})
+
+    def test_invalid_graphs(self):
+        with self.assertRaises(ValueError):
+            PipelineScheduler([Stage('a', len), Stage('a', len)])
+        with self.assertRaises(ValueError):
+            PipelineScheduler([Stage('a', len, depends_on=['b'])])
+        with self.assertRaises(ValueError):
+            PipelineScheduler([Stage('a', len, depends_on=['b']), Stage('b', len, depends_on=['a'])])
+
+
+class TestReadTable(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.db_handler.create_table('train', table_training)
+        self.train.loc[3, 'y2'] = np.nan
+        self.db_handler.replace_data_in_table('train', self.train)
+
+    def test_projection_and_dtype(self):
+        data = self.db_handler.read_table('train', ['y2', 'x'], dtype='float32')
+        self.assertEqual(list(data.columns), ['y2', 'x'])
+        self.assertEqual(set(data.dtypes), {np.dtype('float32')})
+        # NULL is read back as NaN
+        self.assertTrue(np.isnan(data.loc[3, 'y2']))
+        expected = self.train[['y2', 'x']].astype('float32')
+        pd.testing.assert_frame_equal(data, expected)
+
+        inferred = self.db_handler.read_table('train')
+        pd.testing.assert_frame_equal(inferred, self.train)
+
+    def test_chunks(self):
+        for dtype in ('float64', None):
+            chunks = list(self.db_handler.read_table('train', ['x', 'y1'], dtype=dtype, chunksize=150))
+            self.assertEqual([len(chunk) for chunk in chunks], [150, 150, 100])
+            pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), self.train[['x', 'y1']])
+
+    def test_unknown_table_or_column(self):
+        self.assertTrue(self.db_handler.read_table('missing').empty)
+        self.assertTrue(self.db_handler.read_table('train', ['x', 'y9'], dtype='float64').empty)
+        self.assertEqual(list(self.db_handler.read_table('train', ['y9'], chunksize=10)), [])
+
+
+class TestResultSink(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.results = self.fitted_analyzer().test_data_set(TEST_CSV)
+
+    def stored(self) -> pd.DataFrame:
+        return self.db_handler.read_table('test')
+
+    def test_repeated_upsert_is_idempotent(self):
+        for _ in range(2):
+            with ResultSink(self.db_handler, upsert=True, batch_rows=40) as sink:
+                sink.consume([self.results.iloc[:60], self.results.iloc[60:]])
+        stored = self.stored()
+        self.assertEqual(len(stored), len(self.results.drop_duplicates(list(ResultSink.KEY))))
+        self.assertFalse(stored.duplicated(list(ResultSink.KEY)).any())
+
+        # Plain appends add every row again
+        with ResultSink(self.db_handler) as sink:
+            sink.write(self.results)
+        self.assertEqual(len(self.stored()), len(stored) + len(self.results))
+
+    def test_failed_batch_is_kept_for_a_retry(self):
+        sink = ResultSink(self.db_handler)
+        sink.write(self.results.iloc[:10])
+        # The table does not exist yet, so the batch cannot be written
+        self.assertEqual(sink.flush(), 0)
+        sink.write(self.results.iloc[10:15])
+        sink.ensure_table()
+        self.assertEqual(sink.flush(), 15)
+        self.assertEqual(sink.rows_written, 15)
+        self.assertEqual(sink.flush(), 0)
+        pd.testing.assert_frame_equal(sorted_results(self.stored()), sorted_results(self.results.iloc[:15]))
+
+
+class TestPlotRenderer(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # A training column without any value gets no fit, so the fits no longer line up with the columns
+        self.train['y2'] = np.nan
+        self.analyzer = self.fitted_analyzer()
+        self.db_handler.create_table('train', table_training)
+        self.db_handler.create_table('ideal', table_ideal)
+        self.db_handler.replace_data_in_table('train', self.train)
+        self.db_handler.replace_data_in_table('ideal', self.ideal)
+        with ResultSink(self.db_handler) as sink:
+            sink.write(self.analyzer.test_data_set(TEST_CSV))
+        self.renderer = PlotRenderer(self.db_handler, self.path('plots'), ('png', 'svg'), max_points=50, workers=1)
+
+    def test_figures_pair_columns_with_their_fits(self):
+        self.assertEqual([column for column, _ in self.analyzer.fit_pairs], ['y1', 'y3', 'y4'])
+        specs = {os.path.basename(spec['paths'][0]): spec for spec in self.renderer.figures(self.analyzer.fit_pairs)}
+        titles = [panel['title'] for panel in specs['best_fits.png']['panels']]
+        self.assertEqual(titles, [f'{column} and its ideal function {fit}' for column, fit in self.analyzer.fit_pairs])
+        for panel in specs['best_fits.png']['panels']:
+            self.assertTrue(all(len(line['x']) <= 50 for line in panel['lines']))
+
+    def test_render_writes_every_format(self):
+        written = self.renderer.render(self.analyzer.fit_pairs)
+        self.assertEqual(len(written), 8)
+        self.assertTrue(all(os.path.getsize(path) > 0 for path in written))
+
+
+class TestCurveDownsampler(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.linspace(0, 10, 1_000)
+        self.y = np.sin(self.x)
+        self.y[500] = 5.0
+
+    def test_lttb(self):
+        keep = CurveDownsampler.lttb(self.x, self.y, 100)
+        self.assertEqual(len(keep), 100)
+        self.assertEqual((keep[0], keep[-1]), (0, 999))
+        self.assertTrue((np.diff(keep) > 0).all())
+        self.assertIn(500, keep)
+        np.testing.assert_array_equal(CurveDownsampler.lttb(self.x, self.y, 2_000), np.arange(1_000))
+
+    def test_missing_values(self):
+        missing = np.full_like(self.y, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            keep = CurveDownsampler.lttb(self.x, missing, 100)
+        self.assertEqual(len(keep), 100)
+        self.assertTrue((np.diff(keep) > 0).all())
+        keep = CurveDownsampler.min_max(missing, 10)
+        self.assertEqual((keep[0], keep[-1]), (0, 999))
+        self.assertLessEqual(len(keep), 22)
+        self.assertEqual(len(CurveDownsampler.grid(np.arange(10 ** 4), np.full(10 ** 4, np.nan))), 0)
+
+    def test_min_max_keeps_peaks(self):
+        keep = CurveDownsampler.min_max(self.y, 10)
+        self.assertLessEqual(len(keep), 22)
+        self.assertIn(500, keep)
+        self.assertIn(int(np.argmin(self.y)), keep)
+
+    def test_grid(self):
+        x = np.random.default_rng(0).random(100_000)
+        keep = CurveDownsampler.grid(x, x, width=40, height=30)
+        self.assertLessEqual(len(keep), 40 * 30)
+        self.assertTrue((np.diff(keep) > 0).all())
+        np.testing.assert_array_equal(CurveDownsampler.grid(x[:10], x[:10]), np.arange(10))
+
+
+class TestCli(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # The commands use runtime/database.db in the working directory
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, cwd)
+        self.files = ['--train', TRAIN_CSV, '--ideal', IDEAL_CSV]
+
+    def run_cli(self, *argv: str) -> Tuple[int, str]:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = cli.main(list(argv))
+        return status, output.getvalue()
+
+    def stored_results(self) -> pd.DataFrame:
+        connection = DatabaseConnection()
+        self.addCleanup(connection.engine.dispose)
+        return DataAnalyzer(connection).read_table('test')
+
+    def test_ingest_fit_classify(self):
+        status, output = self.run_cli('ingest', *self.files, '--test', TEST_CSV)
+        self.assertEqual(status, 0)
+        # Unchanged files are skipped by the next ingest
+        status, output = self.run_cli('ingest', *self.files)
+        self.assertEqual((status, output.count('unchanged since it was ingested')), (0, 2))
+
+        status, output = self.run_cli('fit', *self.files)
+        best_fits = self.fitted_analyzer().best_fits
+        self.assertEqual((status, output), (0, f'Best fits:  {best_fits}\n'))
+
+        per_row = sorted_results(self.fitted_analyzer().test_data_set(TEST_CSV, batched=False))
+        status, output = self.run_cli('classify', *self.files, '--test', TEST_CSV)
+        self.assertEqual(status, 0)
+        self.assertNotIn('No cached fit', output)
+        pd.testing.assert_frame_equal(sorted_results(self.stored_results()), per_row)
+
+        # The table is emptied first, unless the rows are appended
+        self.assertEqual(self.run_cli('classify', *self.files, '--test', TEST_CSV, '--in-db')[0], 0)
+        pd.testing.assert_frame_equal(sorted_results(self.stored_results()), per_row, check_exact=False, rtol=1e-6)
+        self.assertEqual(self.run_cli('classify', *self.files, '--test', TEST_CSV, '--append')[0], 0)
+        self.assertEqual(len(self.stored_results()), 2 * len(per_row))
+
+    def test_fit_without_tables(self):
+        status, output = self.run_cli('fit', *self.files)
+        self.assertEqual(status, 1)
+        self.assertIn('Run the ingest command first', output)
+
+    def test_usage_errors(self):
+        self.assertEqual(self.run_cli()[0], 2)
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            self.run_cli('fit', '--unknown')
+
+
+class TestClassificationService(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.analyzer = self.fitted_analyzer()
+        self.service = ClassificationService(self.analyzer)
+
+    async def request(self, reader, writer, method: str, path: str, body: bytes = b'') -> Tuple[int, Dict]:
+        writer.write(f'{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+        await writer.drain()
+        head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        headers = dict(line.lower().split(': ', 1) for line in head[1:] if line)
+        return int(head[0].split(' ')[1]), json.loads(await reader.readexactly(int(headers['content-length'])))
+
+    def serve(self, requests: List[Tuple[str, str, bytes]]) -> List[Tuple[int, Dict]]:
+        async def run():
+            socket_path = self.path('classify.sock')
+            with contextlib.redirect_stdout(io.StringIO()):
+                await self.service.start(socket_path)
+            try:
+                # All requests share one keep-alive connection
+                reader, writer = await asyncio.open_unix_connection(socket_path)
+                responses = [await self.request(reader, writer, *request) for request in requests]
+                writer.close()
+                return responses
+            finally:
+                await self.service.stop()
+        return asyncio.run(run())
+
+    def test_classify_points(self):
+        test = pd.read_csv(TEST_CSV)
+        points = json.dumps({'points': test[['x', 'y']].values.tolist()}).encode()
+        single = json.dumps({'x': float(test.x[0]), 'y': float(test.y[0])}).encode()
+        (status, batch), (single_status, first), (fits_status, fits) = self.serve([
+            ('POST', '/classify', points),
+            ('POST', '/classify', single),
+            ('GET', '/fits', b''),
+        ])
+        self.assertEqual((status, single_status, fits_status), (200, 200, 200))
+        self.assertEqual(fits['best_fits'], self.analyzer.best_fits)
+        self.assertEqual(first['matches'], batch['results'][0])
+
+        rows = [
+            [x, y, match['delta_y'], match['ideal_func']]
+            for (x, y), matches in zip(test[['x', 'y']].values.tolist(), batch['results'])
+            for match in matches
+        ]
+        served = pd.DataFrame(rows, columns=['x', 'y', 'delta_y', 'ideal_func'])
+        pd.testing.assert_frame_equal(sorted_results(served), sorted_results(self.analyzer.test_data_set(TEST_CSV)))
+
+    def test_invalid_requests(self):
+        responses = self.serve([
+            ('POST', '/classify', b'{"x": 1.0}'),
+            ('POST', '/classify', b'{"points": [[1.0, 2.0, 3.0]]}'),
+            ('POST', '/classify', b'{"x": NaN, "y": 1.0}'),
+            ('POST', '/classify', b'not json'),
+            ('GET', '/classify', b''),
+            ('GET', '/missing', b''),
+            ('POST', '/classify', b'{"points": []}'),
+            ('GET', '/stats', b''),
+        ])
+        statuses = [status for status, _ in responses]
+        self.assertEqual(statuses, [400, 400, 400, 400, 405, 404, 200, 200])
+        self.assertTrue(all('error' in response for _, response in responses[:6]))
+        self.assertEqual(responses[6][1], {'results': []})
+        self.assertEqual((responses[7][1]['errors'], responses[7][1]['requests']), (6, 1))
+
+
+class TestPrecision(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.db_handler.create_table('ideal', table_ideal)
+        self.db_handler.replace_data_in_table('ideal', self.ideal)
+
+    def check(self, analyzer: DataAnalyzer, **kwargs) -> Dict:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return analyzer.check_precision(**kwargs)
+
+    def test_float32_matches_float64(self):
+        analyzer = self.fitted_analyzer(dtype='float32')
+        self.assertEqual(analyzer.ideal_y.dtype, np.float32)
+        self.assertEqual(analyzer.best_fits, self.fitted_analyzer().best_fits)
+
+        report = self.check(analyzer, csv_path=TEST_CSV)
+        self.assertEqual(report['dtype'], 'float32')
+        self.assertTrue(report['same_fits'])
+        self.assertTrue(report['same_results'])
+        self.assertEqual(report['matches'], len(self.fitted_analyzer().test_data_set(TEST_CSV)))
+        # float32 keeps about seven significant digits
+        scale = np.abs(self.ideal.drop(columns='x').to_numpy()).max()
+        self.assertGreater(report['max_value_error'], 0)
+        self.assertLess(report['max_value_error'], scale * 1e-6)
+        self.assertLess(report['max_delta_y_error'], scale * 1e-6)
+
+    def test_float64_is_exact(self):
+        report = self.check(self.fitted_analyzer())
+        self.assertEqual((report['max_value_error'], report['max_mse_error']), (0.0, 0.0))
+        self.assertNotIn('same_results', report)
+
+    def test_other_ideal_table(self):
+        self.db_handler.replace_data_in_table('ideal', self.ideal.iloc[:-1])
+        self.assertIsNone(self.check(self.fitted_analyzer(dtype='float32')))
+
+
+class TestIngest(AnalyzerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.csv_path = self.path('train.csv')
+        self.train.iloc[:300].to_csv(self.csv_path, index=False)
+
+    def ingest(self, **kwargs):
+        return self.db_handler.ingest_csv(self.csv_path, 'train', table_training, chunksize=64, **kwargs)
+
+    def assert_table_matches_file(self):
+        table = self.db_handler.read_table('train', dtype='float64')
+        pd.testing.assert_frame_equal(table, pd.read_csv(self.csv_path))
+
+    def test_skip_append_and_full(self):
+        self.assertEqual(self.ingest()['mode'], 'full')
+        self.assert_table_matches_file()
+
+        result = self.ingest()
+        self.assertEqual((result['mode'], result['rows'], result['total_rows']), ('skipped', 0, 300))
+
+        # Only the appended rows are read
+        self.train.iloc[300:].to_csv(self.csv_path, mode='a', header=False, index=False)
+        result = self.ingest()
+        self.assertEqual((result['mode'], result['rows'], result['total_rows']), ('appended', 100, 400))
+        self.assert_table_matches_file()
+
+        # A rewritten row invalidates the ingested prefix
+        changed = self.train.copy()
+        changed.loc[5, 'y1'] += 1
+        changed.to_csv(self.csv_path, index=False)
+        result = self.ingest()
+        self.assertEqual((result['mode'], result['rows'], result['total_rows']), ('full', 400, 400))
+        self.assert_table_matches_file()
+
+        result = self.ingest(full=True)
+        self.assertEqual((result['mode'], result['rows']), ('full', 400))
+        self.assert_table_matches_file()
+
+    def test_touched_file_is_skipped(self):
+        self.ingest()
+        stat = os.stat(self.csv_path)
+        os.utime(self.csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.ingest()['mode'], 'skipped')
+        self.assert_table_matches_file()
+
+    def test_failed_load_writes_nothing(self):
+        self.ingest()
+        pd.DataFrame({'x': [1.0], 'z': [2.0]}).to_csv(self.csv_path, index=False)
+        self.assertIsNone(self.ingest())
+        self.assertEqual(len(self.db_handler.read_table('train')), 0)
+
+
+class TestAlignment(AnalyzerTestCase):
+
+    def fit(self, train: pd.DataFrame, **kwargs) -> Tuple[DataAnalyzer, List[str]]:
+        analyzer = DataAnalyzer(self.db_connection, **kwargs)
+        analyzer.load_training_data(train)
+        analyzer.load_ideal_data(self.ideal)
+        best_fits = analyzer.find_ideal_curves()
+        # The pairwise search aligns the rows the same way
+        self.assertEqual(analyzer.find_ideal_curves(vectorized=False), best_fits)
+        return analyzer, best_fits
+
+    def test_shuffled_subset(self):
+        train = self.train.iloc[50:300].sample(frac=1, random_state=0)
+        analyzer, best_fits = self.fit(train)
+        ideal = self.ideal.set_index('x').loc[train['x']].reset_index()
+        for column, fit in zip(['y1', 'y2', 'y3', 'y4'], best_fits):
+            expected = brute_force_sse(train[column].to_numpy(), ideal) / len(train)
+            self.assertEqual(fit, expected.idxmin())
+            self.assertEqual(analyzer.find_best_fit(train[column].tolist(), align=True)[0], fit)
+            np.testing.assert_allclose(analyzer.mse_matrix.loc[column], expected, rtol=1e-12)
+
+    def test_tolerance(self):
+        shifted = self.train.assign(x=self.train['x'] + 0.01)
+        # Without a tolerance no row is on the grid, and neither search finds a fit
+        self.assertEqual(self.fit(shifted)[1], [])
+        analyzer, best_fits = self.fit(shifted, align_tolerance=0.02)
+        reference = self.fitted_analyzer()
+        self.assertEqual(best_fits, reference.best_fits)
+        pd.testing.assert_frame_equal(analyzer.mse_matrix, reference.mse_matrix)
+
+    def test_interpolation(self):
+        ideal_x = self.ideal['x'].to_numpy()
+        between = self.train.iloc[:-1].assign(x=(ideal_x[:-1] + ideal_x[1:]) / 2)
+        self.assertEqual(self.fit(between)[1], [])
+        analyzer, best_fits = self.fit(between, align_interpolate=True)
+
+        values = self.ideal.drop(columns='x')
+        midpoints = (values.iloc[:-1].to_numpy() + values.iloc[1:].to_numpy()) / 2
+        interpolated = pd.DataFrame(midpoints, columns=values.columns)
+        interpolated.insert(0, 'x', between['x'].to_numpy())
+        for column, fit in zip(['y1', 'y2', 'y3', 'y4'], best_fits):
+            expected = brute_force_sse(between[column].to_numpy(), interpolated) / len(between)
+            self.assertEqual(fit, expected.idxmin())
+            np.testing.assert_allclose(analyzer.mse_matrix.loc[column], expected, rtol=1e-9)
+
+    def test_positional_comparison(self):
+        analyzer = self.fitted_analyzer()
+        # Values that are not aligned are compared with the ideal rows in order
+        reversed_y = self.train['y1'].to_numpy()[::-1]
+        expected = brute_force_sse(reversed_y, self.ideal) / len(self.ideal)
+        self.assertEqual(analyzer.find_best_fit(reversed_y.tolist())[0], expected.idxmin())
+
+
+if __name__ == '__main__':
+    unittest.main()
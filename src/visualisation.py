@@ -1,59 +1,66 @@
-import matplotlib.pyplot as plt
-from modules.DataAnalyzer import DataAnalyzer
-from modules.DataHandler import DataHandler
-from modules.DatabaseConnection import DatabaseConnection
-from schema.index import table_training
-
-# Create an instance of the DatabaseConnection class for managing database connections
-db_connection = DatabaseConnection()
-
-# Create an instance of the DataHandler class for managing data operations
-db_handler = DataHandler(db_connection)
-
-# Example: Load training data from the database based on the specified table name
-train_data = db_handler.get_data_from_db(f'SELECT * FROM {table_training}')
-
-# Create an instance of the DataAnalyzer class, which extends DataHandler
-data_analyzer = DataAnalyzer(db_connection)
-
-# Example: Load ideal set data from the database
-ideal_set_data = db_handler.get_data_from_db('SELECT * FROM ideal')
-
-# Extract X, Y values from the training set
-train_set = train_data[['X', 'Y']].values
-
-# Compute the best fits using the DataAnalyzer instance
-best_fits = data_analyzer.find_best_fit(train_set, ideal_set_data[['X', 'Y']].values)
-
-# Example: Visualize the training data using a scatter plot
-plt.figure(figsize=(8, 6))
-plt.scatter(train_data['X'], train_data['Y'], label='Train Data', color='blue')
-plt.title('Training Data')
-plt.xlabel('X')
-plt.ylabel('Y')
-plt.legend()
-plt.show()
-
-# Example: Visualize the best fits using line plots
-plt.figure(figsize=(8, 6))
-for i, (curve, mse) in enumerate(best_fits, start=1):
-    plt.plot(curve[:, 0], curve[:, 1], label=f'Best Fit {i}, MSE: {mse}')
-
-plt.title('Best Fits')
-plt.xlabel('X')
-plt.ylabel('Y')
-plt.legend()
-plt.show()
-
-# Example: Load deviation data from the database
-deviation_data = db_handler.get_data_from_db('SELECT * FROM deviations')
-
-# Example: Visualize deviations using a scatter plot with a color scale based on deviation
-plt.figure(figsize=(8, 6))
-plt.scatter(deviation_data['X'], deviation_data['Y'], c=deviation_data['Deviation'], cmap='viridis', label='Deviations')
-plt.colorbar(label='Deviation')
-plt.title('Deviations')
-plt.xlabel('X')
-plt.ylabel('Y')
-plt.legend()
-plt.show()
\ No newline at end of file
+"""
+This script plots the tables that main.py writes to the SQLite database.
+It reads the training data, the ideal functions selected for it and the
+classified test points, and writes the figures as image files without opening a
+window, so it also runs on servers without a display. Curves are downsampled
+before drawing (LTTB or min/max decimation) and the figures are rendered in
+parallel processes, so tables with millions of rows plot in seconds.
+
+Example:
+    python src/main.py
+    python src/visualisation.py --format png --format svg --output-dir runtime/plots
+"""
+
+import argparse
+import os
+import sys
+from typing import List
+
+from modules.DataAnalyzer import DataAnalyzer
+from modules.DatabaseConnection import DatabaseConnection
+from modules.PlotRenderer import PlotRenderer
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Plot the training data, the selected ideal functions and the test deviations.')
+    parser.add_argument('--output-dir', default='runtime/plots', help='Directory the figures are written to.')
+    parser.add_argument('--format', action='append', choices=('png', 'svg'), dest='formats',
+                        help='Image format; repeatable. Defaults to png.')
+    parser.add_argument('--max-points', type=int, default=5_000, help='Maximum number of points drawn per curve.')
+    parser.add_argument('--method', choices=('lttb', 'minmax'), default='lttb', help='How curves are downsampled.')
+    parser.add_argument('--workers', type=int, help='Number of processes rendering figures.')
+    parser.add_argument('--train', default='data/train.csv', help='Training CSV the train table was loaded from.')
+    parser.add_argument('--ideal', default='data/ideal.csv', help='Ideal CSV the ideal table was loaded from.')
+    args = parser.parse_args(argv)
+
+    # Initialize database connection, tuned for reading
+    db_connection = DatabaseConnection(profile='read_heavy')
+    db_analyzer = DataAnalyzer(db_connection)
+
+    # Reuse the fit of a previous run of the source files, or select the ideal functions again
+    db_analyzer.enable_result_cache()
+    best_fits = None
+    if os.path.exists(args.train) and os.path.exists(args.ideal):
+        best_fits = db_analyzer.load_cached_fit(args.train, args.ideal)
+    if best_fits is None:
+        train = db_analyzer.read_table('train', dtype='float64')
+        ideal = db_analyzer.read_table('ideal', dtype='float64')
+        if train.empty or ideal.empty:
+            print('Run main.py first to fill the train and ideal tables')
+            return 1
+        db_analyzer.load_training_data(train)
+        db_analyzer.load_ideal_data(ideal)
+        best_fits = db_analyzer.find_ideal_curves()
+
+    renderer = PlotRenderer(db_analyzer, args.output_dir, args.formats or ('png',), args.max_points,
+                            args.method, args.workers)
+    written = renderer.render(db_analyzer.fit_pairs)
+    for path in written:
+        print(f'Wrote {path}')
+    print(f"Prepared the data in {renderer.timings['prepare_seconds']:.3f}s "
+          f"and rendered {len(written)} files in {renderer.timings['render_seconds']:.3f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())